@@ -1,35 +1,202 @@
-from django.contrib import admin
-from .models import Shop, Category,Company,MemberProfile
-from django.utils.safestring import mark_safe
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.files.storage import default_storage
+from django.core.paginator import Paginator
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.text import smart_split, unescape_string_literal
+from .models import Shop, Category,Company,MemberProfile,Job,Review,Reservation
+from . import prerender, shop_cache
 
 # Register your models here.
 
-class ShopAdmin(admin.ModelAdmin):
+class EstimatedCountPaginator(Paginator):
+    """
+    件数の多いテーブル用のページネーター。
+    - ESTIMATE_LIMIT 件以下なら正確に数える（数えるのは LIMIT + 1 件まで）
+    - それより多く、絞り込みなし: PostgreSQL は統計情報、それ以外は MAX(id) を件数の目安にする
+      （estimated = True。一覧には「約 N 件」と出す）
+    - それより多く、絞り込みあり: ESTIMATE_LIMIT 件で打ち切る（truncated = True。「N 件以上」と出す）
+    """
+    ESTIMATE_LIMIT = 10000
+    estimated = False
+    truncated = False
+
+    @cached_property
+    def count(self):
+        qs = self.object_list.order_by()
+        exact = qs[:self.ESTIMATE_LIMIT + 1].count()
+        if exact <= self.ESTIMATE_LIMIT:
+            return exact
+        if not qs.query.where:
+            estimate = self._estimate(qs)
+            if estimate > self.ESTIMATE_LIMIT:
+                self.estimated = True
+                return estimate
+        self.truncated = True
+        return self.ESTIMATE_LIMIT
+
+    def _estimate(self, qs):
+        connection = connections[qs.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [qs.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            return row[0] if row else 0
+        return qs.aggregate(m=Max('pk'))['m'] or 0
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    行数の多いモデル用の共通設定。
+
+    search_fields の '^' は LIKE ではなく範囲検索（>= 語 AND < 語の最後の文字 +1）、
+    '=' は完全一致にする。SQLite の LIKE（istartswith / iexact）はインデックスを
+    使えず全件スキャンになるため。その代わり英字の大文字・小文字は区別する。
+    '^user__username' のような関連先の列は user_id IN (SELECT ...) にする
+    （JOIN した 2 つのテーブルの列を OR でつなぐと、どちらのインデックスも使えない）。
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # 「全 N 件」のための COUNT(*) をしない
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        if not search_fields or not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        may_have_duplicates = False
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            if not bit:
+                continue
+            queryset = queryset.filter(
+                Q.create([_search_lookup(self.opts, field, bit) for field in search_fields], connector=Q.OR)
+            )
+        for field in search_fields:
+            may_have_duplicates |= lookup_spawns_duplicates(self.opts, field.lstrip('^='))
+        return queryset, may_have_duplicates
+
+
+def _search_lookup(opts, field, term):
+    """search_fields の 1 項目を Q にする（'^' は範囲、'=' は完全一致、それ以外は部分一致）"""
+    if field.startswith('^'):
+        relation, _, field = field[1:].rpartition('__')
+        # 語の最後の文字を 1 つ進めた文字列が上限（コードポイント順 = UTF-8 のバイト順）
+        upper = term[:-1] + chr(min(ord(term[-1]) + 1, 0x10FFFF))
+        prefix = Q(**{f"{field}__gte": term, f"{field}__lt": upper})
+        if not relation:
+            return prefix
+        related = opts.get_field(relation).related_model
+        return Q(**{f"{relation}__in": related._default_manager.filter(prefix).values('pk')})
+    if field.startswith('='):
+        return (field[1:], term)
+    return (f"{field}__icontains", term)
+
+
+class PriceActionForm(ActionForm):
+    # 一括操作のプルダウンの横に表示する入力欄
+    price = forms.IntegerField(label="予約料金（円）", required=False, min_value=0)
+
+
+def _action_price(modeladmin, request):
+    price = request.POST.get('price', '')
+    if not price.isdigit():
+        modeladmin.message_user(request, "予約料金を入力してください。", messages.WARNING)
+        return None
+    return int(price)
+
+
+class ShopAdmin(ScalableAdmin):
     list_display = ('id', 'name', 'price','budget','category', 
                     'image','closed_days','opening_hours','detail')
     list_filter = ('category',)
-
+    list_select_related = ('category',)
+    # 前方一致（name のインデックスを使える）。external_id は完全一致
+    search_fields = ('^name', '=external_id')
+    action_form = PriceActionForm
+    actions = ['update_price']
 
     def image(self, obj):
+        # 一覧では元画像ではなくサムネイルを表示する
+        thumb = (obj.img_variants or {}).get('variants', {}).get('thumb')
+        if thumb:
+            return format_html('<img src="{}" width="100" loading="lazy">', default_storage.url(thumb['jpeg']))
         if obj.img:
-            return mark_safe(f'<img src="{obj.img.url}" style="width:100px; height:auto;">')
+            return format_html('<img src="{}" width="100" loading="lazy">', obj.img.url)
         return "(画像なし)"
 
+    @admin.action(description="選択した店舗の予約料金を変更")
+    def update_price(self, request, queryset):
+        price = _action_price(self, request)
+        if price is None:
+            return
+        # 1 回の UPDATE で更新する（signals が動かないのでキャッシュと静的ページは自分で消す）
+        updated = queryset.update(price=price, updated_at=timezone.now())
+        shop_cache.invalidate_many(queryset.values_list("pk", flat=True))
+        prerender.invalidate_shops(queryset, listings=False)  # 料金は一覧に出ない
+        self.message_user(request, f"{updated} 件の予約料金を {price} 円にしました。")
+
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
     search_fields = ('name',)
+    action_form = PriceActionForm
+    actions = ['update_shop_price']
+
+    @admin.action(description="選択したカテゴリの店舗の予約料金を変更")
+    def update_shop_price(self, request, queryset):
+        price = _action_price(self, request)
+        if price is None:
+            return
+        shops = Shop.objects.filter(category__in=queryset)
+        updated = shops.update(price=price, updated_at=timezone.now())
+        shop_cache.invalidate_many(shops.values_list("pk", flat=True))
+        prerender.invalidate_shops(shops, listings=False)
+        self.message_user(request, f"{updated} 件の予約料金を {price} 円にしました。")
 
 class CompanyAdmin(admin.ModelAdmin):
     list_display = ('name', 'founded_year', 'headquarters')
     search_fields = ('name', 'headquarters')
 
 # MemberProfile を管理画面に登録
-class MemberProfileAdmin(admin.ModelAdmin):
+class MemberProfileAdmin(ScalableAdmin):
     list_display = ('user', 'display_name', 'birth_date')  # 一覧で表示する項目
-    search_fields = ('user__username', 'display_name')    # 検索可能な項目
-    list_filter = ('birth_date',)                        # フィルター項目
+    list_select_related = ('user',)
+    search_fields = ('^user__username', '^display_name')  # 前方一致で検索（インデックスを使う）
+    date_hierarchy = 'birth_date'                         # 生年月日は年→月→日でたどる
+    raw_id_fields = ('user',)
+
+class ReviewAdmin(ScalableAdmin):
+    list_display = ('id', 'shop', 'user', 'rating', 'created_at')
+    list_select_related = ('shop', 'user')
+    list_filter = ('rating',)
+    search_fields = ('^shop__name', '^user__username')
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('shop', 'user')
+
+class ReservationAdmin(ScalableAdmin):
+    list_display = ('id', 'shop', 'user', 'date', 'time', 'num_people', 'created_at')
+    list_select_related = ('shop', 'user')
+    search_fields = ('^shop__name', '^user__username')
+    date_hierarchy = 'date'
+    raw_id_fields = ('shop', 'user')
+
+class JobAdmin(ScalableAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'created_at')
+    list_filter = ('status',)
 
 admin.site.register(Shop,ShopAdmin)
 admin.site.register(Category,CategoryAdmin)    
 admin.site.register(Company,CompanyAdmin)
-admin.site.register(MemberProfile,MemberProfileAdmin)
\ No newline at end of file
+admin.site.register(MemberProfile,MemberProfileAdmin)
+admin.site.register(Review,ReviewAdmin)
+admin.site.register(Reservation,ReservationAdmin)
+admin.site.register(Job,JobAdmin)
@@ -0,0 +1,253 @@
+# app/api.py
+"""
+読み取り専用の JSON API（店舗検索・店舗詳細・レビュー・カテゴリ）
+
+- モデルのインスタンスは作らず、.values() で必要な列だけを取り出して返す
+  （category や user の名前は JOIN で取るので、一覧は 1 クエリ）
+- ?fields=id,name,... で返す項目を選べる
+- 店舗検索に ?lat=&lng=&radius= を付けると近い順（distance_km 付き、1 ページだけ）
+- 一覧はカーソルページング。レスポンスの next をそのまま次のリクエストに使う。
+  OFFSET や COUNT を使わないので、深いページでも速さは変わらない
+- orjson があれば使い、無ければ標準の json で書き出す
+- どれも非同期ビュー（ASGI ではクエリの結果を待つ間にスレッドを占有しない）
+"""
+import base64
+import datetime
+import functools
+import json
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .filters import filter_shops, nearby_shops, sort_order
+from .models import Category, Review, Shop
+from .routers import use_replica
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 任意の依存
+    orjson = None
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# API の項目名 → .values() に渡す列
+SHOP_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "category_id": "category_id",
+    "category": "category__name",
+    "address": "address",
+    "prefecture": "prefecture",
+    "city": "city",
+    "ward": "ward",
+    "budget": "budget",
+    "closed_days": "closed_days",
+    "opening_hours": "opening_hours",
+    "price": "price",
+    "favorite_count": "favorite_count",
+    "image": "img",
+    "image_width": "img_width",
+    "image_height": "img_height",
+    "image_color": "img_color",
+    "updated_at": "updated_at",
+}
+SHOP_DETAIL_FIELDS = {**SHOP_FIELDS, "detail": "detail", "image_placeholder": "img_placeholder"}
+REVIEW_FIELDS = {
+    "id": "id",
+    "shop_id": "shop_id",
+    "user": "user__username",
+    "rating": "rating",
+    "content": "content",
+    "created_at": "created_at",
+}
+REVIEW_ORDER = ("-created_at", "-id")
+CATEGORY_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "image": "img",
+}
+# 値を変換して返す項目
+CONVERTERS = {
+    "image": lambda name: default_storage.url(name) if name else None,
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} は JSON にできません")
+
+
+def json_response(data, status=200):
+    if orjson is not None:
+        body = orjson.dumps(data, default=_default)
+    else:
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+    return HttpResponse(body, status=status, content_type="application/json")
+
+
+def api_view(view):
+    """GET だけを受け付け、BadRequest を 400 の JSON にする（view は async def）"""
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except BadRequest as e:
+            return json_response({"error": str(e)}, status=400)
+
+    return use_replica(wrapper)
+
+
+def selected_fields(request, available):
+    """?fields= で指定された項目（未指定ならすべて）"""
+    value = request.GET.get("fields")
+    if not value:
+        return list(available)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise BadRequest(f"不明な項目です: {', '.join(unknown)}（使える項目: {', '.join(available)}）")
+    return names
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit は整数で指定してください")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=_default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, ordering, model):
+    """cursor を並び順の各列の値に戻す（型も列に合わせて確かめる。改ざんされたものは BadRequest）"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadRequest("cursor が不正です")
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise BadRequest("cursor が不正です")
+    try:
+        values = [model._meta.get_field(field.lstrip("-")).to_python(value) for field, value in zip(ordering, values)]
+    except (TypeError, ValueError, ValidationError):
+        raise BadRequest("cursor が不正です")
+    if any(value is None for value in values):
+        raise BadRequest("cursor が不正です")
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    並び順 ordering で values の行より後ろにある行の条件。
+    ('-favorite_count', 'id') なら favorite_count < v0 OR (favorite_count = v0 AND id > v1)
+    """
+    condition = Q()
+    for i in reversed(range(len(ordering))):
+        field = ordering[i].lstrip("-")
+        lookup = "lt" if ordering[i].startswith("-") else "gt"
+        after = Q(**{f"{field}__{lookup}": values[i]})
+        condition = after if i == len(ordering) - 1 else after | (Q(**{field: values[i]}) & condition)
+    return condition
+
+
+async def paginate(request, queryset, ordering, available):
+    """カーソルページングした一覧のレスポンス（クエリは 1 回）"""
+    names = selected_fields(request, available)
+    limit = get_limit(request)
+    order_columns = [field.lstrip("-") for field in ordering]
+    cursor = request.GET.get("cursor")
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, ordering, queryset.model)))
+
+    columns = [available[name] for name in names]
+    extra = [column for column in order_columns if column not in columns]
+    rows = [row async for row in queryset.order_by(*ordering).values_list(*columns, *extra)[:limit + 1]]
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        positions = {column: i for i, column in enumerate([*columns, *extra])}
+        last = rows[-1]
+        params = request.GET.copy()
+        params["cursor"] = encode_cursor([last[positions[column]] for column in order_columns])
+        next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+    return json_response({"results": _to_dicts(names, rows), "next": next_url})
+
+
+def _to_dicts(names, rows):
+    converters = [(i, CONVERTERS[name]) for i, name in enumerate(names) if name in CONVERTERS]
+    results = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for i, convert in converters:
+            item[names[i]] = convert(row[i])
+        results.append(item)
+    return results
+
+
+@api_view
+async def shop_list(request):
+    """店舗検索（keyword, category_id, area, sort, lat, lng, radius は一覧ページと同じ）"""
+    try:
+        found = await sync_to_async(nearby_shops)(request.GET, limit=get_limit(request))
+    except ValueError:
+        raise BadRequest("lat・lng・radius は範囲内の数値で指定してください")
+    if found is not None:
+        return await nearby_response(request, found)
+    try:
+        queryset = filter_shops(request.GET)
+    except ValueError:
+        raise BadRequest("category_id は整数で指定してください")
+    return await paginate(request, queryset, sort_order(request.GET), SHOP_FIELDS)
+
+
+async def nearby_response(request, found):
+    """近い順の店舗（geo.nearby の結果を .values() で取り直して並べる）"""
+    names = selected_fields(request, SHOP_FIELDS)
+    columns = [SHOP_FIELDS[name] for name in names]
+    rows = Shop.objects.filter(pk__in=[shop_id for shop_id, _ in found]).values_list("id", *columns)
+    by_id = {row[0]: row[1:] async for row in rows}
+    found = [(shop_id, distance) for shop_id, distance in found if shop_id in by_id]  # 間に削除されたもの
+    results = _to_dicts(names, [by_id[shop_id] for shop_id, _ in found])
+    for item, (_, distance) in zip(results, found):
+        item["distance_km"] = round(distance, 3)
+    return json_response({"results": results, "next": None})
+
+
+@api_view
+async def shop_detail(request, pk):
+    names = selected_fields(request, SHOP_DETAIL_FIELDS)
+    row = await Shop.objects.filter(pk=pk).values_list(*(SHOP_DETAIL_FIELDS[name] for name in names)).afirst()
+    if row is None:
+        return json_response({"error": "店舗が見つかりません"}, status=404)
+    return json_response(_to_dicts(names, [row])[0])
+
+
+@api_view
+async def review_list(request, pk):
+    """店舗のレビュー（新しい順）"""
+    return await paginate(request, Review.objects.filter(shop_id=pk), REVIEW_ORDER, REVIEW_FIELDS)
+
+
+@api_view
+async def category_list(request):
+    names = selected_fields(request, CATEGORY_FIELDS)
+    rows = [row async for row in Category.objects.order_by("id").values_list(*(CATEGORY_FIELDS[name] for name in names))]
+    return json_response({"results": _to_dicts(names, rows)})
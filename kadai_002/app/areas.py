@@ -0,0 +1,106 @@
+# app/areas.py
+"""
+住所（Shop.address）から都道府県・市区町村・区を取り出す
+
+同梱の app/data/areas.json（47 都道府県、政令指定都市とその区、東京 23 区、
+「市」「町」「村」「郡」を名前の途中に含む市町村）を使い、ネットワークには出ない。
+
+    >>> parse("〒150-0002 東京都渋谷区渋谷2-1-1")
+    Area(prefecture='東京都', city='渋谷区', ward='')
+    >>> parse("横浜市中区山下町1")
+    Area(prefecture='神奈川県', city='横浜市', ward='中区')
+
+郡部は「○○郡△△町」を city に入れる。都道府県が書かれていない住所は、
+政令指定都市・23 区など都道府県が一意に決まる市区町村名から補う。
+"""
+import functools
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+
+DATA_FILE = Path(__file__).resolve().parent / "data" / "areas.json"
+POSTAL_CODE_RE = re.compile(r"^〒?\s*\d{3}-?\d{4}")
+# 郡があればそれも含めて、最初の「市」「町」「村」までを市町村名とみなす
+MUNICIPALITY_RE = re.compile(r"^((?:[^郡]{1,6}郡)?.{1,9}?[市町村])")
+AREA_FIELDS = ("prefecture", "city", "ward")
+
+
+@dataclass(frozen=True)
+class Area:
+    prefecture: str = ""
+    city: str = ""
+    ward: str = ""
+
+
+@functools.lru_cache(maxsize=None)
+def table():
+    data = json.loads(DATA_FILE.read_text(encoding="utf-8"))
+    # 市区町村名 → 都道府県（同じ名前が複数の都道府県にあるものは除く）
+    owners = {}
+    for prefecture, cities in data["designated_cities"].items():
+        for city in cities:
+            owners.setdefault(city, set()).add(prefecture)
+    for prefecture, names in [*data["special_wards"].items(), *data["irregular_municipalities"].items()]:
+        for name in names:
+            owners.setdefault(name, set()).add(prefecture)
+    data["city_prefecture"] = {name: prefs.pop() for name, prefs in owners.items() if len(prefs) == 1}
+    return data
+
+
+def normalize(address):
+    """全角英数・記号を半角にし、空白と先頭の郵便番号を除く"""
+    address = unicodedata.normalize("NFKC", address or "")
+    address = re.sub(r"\s+", "", address)
+    return POSTAL_CODE_RE.sub("", address)
+
+
+def parse(address):
+    data = table()
+    rest = normalize(address)
+
+    prefecture = next((p for p in data["prefectures"] if rest.startswith(p)), "")
+    rest = rest[len(prefecture):]
+    if not prefecture:
+        prefecture = next(
+            (p for name, p in data["city_prefecture"].items() if rest.startswith(name)), ""
+        )
+
+    candidates = [prefecture] if prefecture else list(data["prefectures"])
+    for pref in candidates:
+        # 政令指定都市（市 + 区）
+        for city, wards in data["designated_cities"].get(pref, {}).items():
+            if rest.startswith(city):
+                after = rest[len(city):]
+                ward = next((w for w in sorted(wards, key=len, reverse=True) if after.startswith(w)), "")
+                return Area(pref, city, ward)
+        # 東京 23 区・名前の途中に「市」「町」などを含む市町村
+        for name in [*data["special_wards"].get(pref, []), *data["irregular_municipalities"].get(pref, [])]:
+            if rest.startswith(name):
+                return Area(pref, name, "")
+
+    match = MUNICIPALITY_RE.match(rest)
+    return Area(prefecture, match.group(1) if match else "", "")
+
+
+def apply(shop):
+    """shop.address から prefecture / city / ward を設定する（保存はしない）"""
+    area = parse(shop.address)
+    shop.prefecture, shop.city, shop.ward = area.prefecture, area.city, area.ward
+    return shop
+
+
+def label(prefecture, city="", ward=""):
+    return f"{prefecture}{city}{ward}"
+
+
+def format_param(prefecture, city="", ward=""):
+    """?area= の値（例: 神奈川県/横浜市/中区）"""
+    return "/".join(part for part in (prefecture, city, ward) if part)
+
+
+def parse_param(value):
+    """?area= の値を {prefecture, city, ward} の絞り込み条件にする"""
+    parts = [part for part in (value or "").split("/") if part][:len(AREA_FIELDS)]
+    return dict(zip(AREA_FIELDS, parts))
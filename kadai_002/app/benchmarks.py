@@ -0,0 +1,433 @@
+# app/benchmarks.py
+"""
+app/urls.py の各 URL のベンチマーク
+
+seed_data で作った固定のデータセット（BENCH_DATASET）に対して各ページを
+何度か取得し、クエリ数・レイテンシ（p50 / p95）・ピークメモリを記録する。
+結果は settings.BENCHMARK_BASELINE の JSON と比べ、悪化していれば回帰として報告する。
+
+    python manage.py bench_views                  # 計測してベースラインと比較
+    python manage.py bench_views --save-baseline  # ベースラインを更新
+
+テスト（app/tests.py）ではクエリ数だけを比較する（時間は環境で変わるため）。
+クエリ数が増える変更では、その URL だけ（--url 名 --save-baseline）を更新し、
+増えた理由をコミットに書く（例: 店舗詳細の「似ている店舗」で +1、一覧のエリアの件数で +1）。
+
+python manage.py bench_concurrency は、同じページを WSGI（スレッドごとに 1 リクエスト）と
+ASGI（イベントループ）のハンドラーに同時に何本も投げ、スループットと p50 / p95 / p99 を比べる。
+サーバーは起動せず、WSGIHandler / ASGIHandler をプロセス内で直接呼ぶ。
+
+python manage.py bench_startup は、新しいプロセスで起動にかかる時間（Django と
+アプリの import、app/warmup.py の準備）と最初のリクエストの応答時間を、準備あり・
+なしで測る。結果は settings.STARTUP_BASELINE と比べ、起動時に読み込まないはずの
+重い依存（HEAVY_MODULES）が import されていないかも調べる。
+"""
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import Reservation, Review, Shop
+
+# ベンチマーク・テストで使うデータセット（seed_data の引数）
+BENCH_DATASET = {
+    "categories": 10,
+    "shops": 300,
+    "users": 200,
+    "reviews": 3000,
+    "reservations": 1000,
+    "favorites": 1000,
+    "seed": 1,
+}
+
+# 外部 API を呼ぶ・セッションを壊すなどで計測しない URL
+SKIP = {"billing_portal", "checkout", "create_subscription", "logout", "add_favorite", "remove_favorite"}
+# POST で計測する URL
+POST = {"toggle_favorite"}
+# URL 引数がどのオブジェクトを指すか
+DEFAULT_PARAMS = {"pk": "shop", "shop_id": "shop", "reservation_id": "reservation"}
+PARAMS = {
+    "review_edit": {"pk": "review"},
+    "review_delete": {"pk": "review"},
+    "reservation_cancel": {"pk": "reservation"},
+}
+
+# bench_concurrency で比べるページ（非同期ビュー）
+CONCURRENCY_VIEWS = [
+    "shop_list", "shop_detail", "company_detail", "my_favorite_list",
+    "api_shop_list", "api_shop_detail", "api_review_list", "api_category_list",
+]
+
+# 回帰とみなす閾値
+LATENCY_TOLERANCE = 1.5      # ベースラインの何倍まで許すか
+LATENCY_SLACK_MS = 5.0       # 小さい値の揺れを無視する幅
+MEMORY_TOLERANCE = 1.5
+STARTUP_TOLERANCE = 2.0      # 起動はプロセスを作るので揺れが大きい
+STARTUP_SLACK_MS = 100.0
+
+# 起動時（最初のリクエストまで）に import されてはいけないモジュール（app/lazy.py）
+HEAVY_MODULES = ("stripe", "PIL", "numpy", "scipy")
+# bench_startup で比べる値（import: Django とアプリの import、ready: import + 準備、
+# first_response: 準備の後の最初のリクエスト）
+STARTUP_METRICS = ("import_ms", "ready_ms", "first_response_ms")
+
+# 新しいプロセスで実行して起動の時間を測るスクリプト（引数: パス, warmup / cold, 重い依存...）
+# DB はテスト用（SQLite ならメモリ上）に作り直すので、マイグレーションの時間は含めない
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.core.handlers.wsgi import WSGIHandler
+handler = WSGIHandler()
+imported = time.perf_counter()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+setup_test_environment()
+connection.creation.create_test_db(verbosity=0)
+connection.close()
+
+path, mode, heavy = sys.argv[1], sys.argv[2], sys.argv[3:]
+prepared = time.perf_counter()
+if mode == "warmup":
+    from app import warmup
+    warmup.run()
+ready = time.perf_counter()
+
+from django.test import RequestFactory
+def get():
+    statuses = []
+    body = handler(RequestFactory().get(path).environ, lambda status, headers, exc_info=None: statuses.append(int(status.split()[0])))
+    b"".join(body)
+    body.close()
+    return statuses[0]
+status = get()
+responded = time.perf_counter()
+get()
+print(json.dumps({
+    "status": status,
+    "import_ms": (imported - started) * 1000,
+    "ready_ms": (imported - started + ready - prepared) * 1000,
+    "first_response_ms": (responded - ready) * 1000,
+    "second_response_ms": (time.perf_counter() - responded) * 1000,
+    "heavy_modules": sorted(name for name in heavy if name in sys.modules),
+}))
+"""
+
+
+def baseline_path():
+    return Path(getattr(settings, "BENCHMARK_BASELINE", Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"))
+
+
+def startup_baseline_path():
+    return Path(getattr(settings, "STARTUP_BASELINE", Path(settings.BASE_DIR) / "benchmarks" / "startup.json"))
+
+
+def seed():
+    call_command("seed_data", stdout=io.StringIO(), **BENCH_DATASET)
+
+
+def prepare():
+    """計測用のスタッフユーザーと、その人のレビュー・予約を用意して URL 引数を返す"""
+    shop = Shop.objects.annotate(n=Count("reviews")).order_by("-n", "id").first()
+    user, _ = User.objects.get_or_create(
+        username="bench_staff", defaults={"email": "bench@example.com", "is_staff": True}
+    )
+    user.set_password("password")
+    user.save()
+    review, _ = Review.objects.get_or_create(shop=shop, user=user, defaults={"content": "bench", "rating": 4})
+    reservation, _ = Reservation.objects.get_or_create(
+        shop=shop, user=user, date="2099-01-01", time="12:00", defaults={"num_people": 2},
+    )
+    return user, {
+        "shop": shop.pk,
+        "review": review.pk,
+        "reservation": reservation.pk,
+        "uidb64": urlsafe_base64_encode(force_bytes(user.pk)),
+        "token": default_token_generator.make_token(user),
+        "dataset": "shops",
+    }
+
+
+def cases(objects):
+    """(URL 名, パス, メソッド) を app/urls.py の順に返す"""
+    from . import urls
+
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in SKIP:
+            continue
+        mapping = {**DEFAULT_PARAMS, **PARAMS.get(pattern.name, {})}
+        kwargs = {param: objects[mapping.get(param, param)] for param in pattern.pattern.converters}
+        yield pattern.name, reverse(pattern.name, kwargs=kwargs), "post" if pattern.name in POST else "get"
+
+
+def _request(client, method, path):
+    response = getattr(client, method)(path)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    else:
+        response.content
+    return response
+
+
+def run(iterations=10, names=None):
+    """各 URL を計測して {URL 名: 結果} を返す"""
+    user, objects = prepare()
+    client = Client()
+    client.force_login(user)
+    connection = connections["default"]
+
+    results = {}
+    for name, path, method in cases(objects):
+        if names and name not in names:
+            continue
+        _request(client, method, path)  # ウォームアップ（テンプレートの読み込みなど）
+
+        latencies, queries = [], 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = _request(client, method, path)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured.captured_queries))
+
+        # tracemalloc は遅くなるので、メモリは別に 1 回だけ測る
+        tracemalloc.start()
+        _request(client, method, path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies.sort()
+        results[name] = {
+            "path": path,
+            "status": response.status_code,
+            "queries": queries,
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            "peak_kb": round(peak / 1024, 1),
+        }
+    return results
+
+
+def load_baseline():
+    path = baseline_path()
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_baseline(results):
+    path = baseline_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def compare(results, baseline, queries_only=False):
+    """ベースラインより悪化した項目を文字列のリストで返す"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["queries"] > base["queries"]:
+            regressions.append(f"{name}: クエリ数 {base['queries']} → {result['queries']}")
+        if queries_only:
+            continue
+        limit = max(base["p95_ms"] * LATENCY_TOLERANCE, base["p95_ms"] + LATENCY_SLACK_MS)
+        if result["p95_ms"] > limit:
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms → {result['p95_ms']}ms")
+        if result["peak_kb"] > base["peak_kb"] * MEMORY_TOLERANCE:
+            regressions.append(f"{name}: ピークメモリ {base['peak_kb']}KB → {result['peak_kb']}KB")
+    return regressions
+
+
+
+def _percentile(values, ratio):
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def _summary(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+    }
+
+
+def _wsgi_get(handler, path, cookie):
+    environ = RequestFactory().get(path, HTTP_COOKIE=cookie).environ
+    statuses = []
+    body = handler(environ, lambda status, headers, exc_info=None: statuses.append(int(status.split()[0])))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return statuses[0]
+
+
+async def _asgi_get(app, path, cookie):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    received = False
+    statuses = []
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.Future()  # 切断はしない（応答を返すと Django が待つのをやめる）
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await app(scope, receive, send)
+    return statuses[0]
+
+
+def run_wsgi(paths, cookie, concurrency, total):
+    """concurrency 本のスレッドで total 回取得する（gunicorn --threads と同じ形）"""
+    handler = WSGIHandler()
+
+    def one(i):
+        started = time.perf_counter()
+        status = _wsgi_get(handler, paths[i % len(paths)], cookie)
+        return (time.perf_counter() - started) * 1000, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    return _summary([r[0] for r in results], [r[1] for r in results], elapsed)
+
+
+def run_asgi(paths, cookie, concurrency, total):
+    """1 つのイベントループで同時に concurrency 本ずつ total 回取得する（uvicorn のワーカー 1 つと同じ形）"""
+    app = ASGIHandler()
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await _asgi_get(app, paths[i % len(paths)], cookie)
+                return (time.perf_counter() - started) * 1000, status
+
+        return await asyncio.gather(*(one(i) for i in range(total)))
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    return _summary([r[0] for r in results], [r[1] for r in results], elapsed)
+
+
+def run_concurrency(levels=(1, 8, 32), total=200, names=None):
+    """{(モード, 同時数): 結果}。ページは names（省略時は CONCURRENCY_VIEWS）を順に取得する"""
+    user, objects = prepare()
+    client = Client()
+    client.force_login(user)
+    cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+    wanted = names or CONCURRENCY_VIEWS
+    paths = [path for name, path, method in cases(objects) if name in wanted and method == "get"]
+
+    # ウォームアップ（テンプレートの読み込みなど）
+    run_wsgi(paths, cookie, 1, len(paths))
+    run_asgi(paths, cookie, 1, len(paths))
+
+    results = {}
+    for concurrency in levels:
+        results[("wsgi", concurrency)] = run_wsgi(paths, cookie, concurrency, total)
+        results[("asgi", concurrency)] = run_asgi(paths, cookie, concurrency, total)
+    return results
+
+
+def _startup_once(path, mode):
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT, path, mode, *HEAVY_MODULES],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_startup(runs=3, path=None):
+    """
+    {"warmup": 結果, "cold": 結果}。準備あり（warmup）・なし（cold）でそれぞれ runs 回
+    プロセスを起動し、時間は中央値を返す（heavy_modules はどれかの回で読み込まれたもの）
+    """
+    path = path or reverse("shop_list")
+    results = {}
+    for mode in ("warmup", "cold"):
+        samples = [_startup_once(path, mode) for _ in range(runs)]
+        result = {
+            key: round(statistics.median(sample[key] for sample in samples), 1)
+            for key in (*STARTUP_METRICS, "second_response_ms")
+        }
+        result["status"] = max(sample["status"] for sample in samples)
+        result["heavy_modules"] = sorted({name for sample in samples for name in sample["heavy_modules"]})
+        results[mode] = result
+    return results
+
+
+def load_startup_baseline():
+    path = startup_baseline_path()
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_startup_baseline(results):
+    path = startup_baseline_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def compare_startup(results, baseline):
+    """起動時間の悪化と、起動時に読み込まれた重い依存を文字列のリストで返す"""
+    regressions = []
+    for mode, result in results.items():
+        if result["heavy_modules"]:
+            regressions.append(f"{mode}: 起動時に重い依存を読み込んでいます: {', '.join(result['heavy_modules'])}")
+        base = baseline.get(mode)
+        if base is None:
+            continue
+        for key in STARTUP_METRICS:
+            limit = max(base[key] * STARTUP_TOLERANCE, base[key] + STARTUP_SLACK_MS)
+            if result[key] > limit:
+                regressions.append(f"{mode}: {key} {base[key]}ms → {result[key]}ms")
+    return regressions
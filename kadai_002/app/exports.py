@@ -0,0 +1,155 @@
+# app/exports.py
+"""
+予約・レビュー・店舗のストリーミング出力（CSV / JSONL、gzip 可）
+
+行は values_list + iterator(chunk_size=...) で少しずつ読み、書き出した分から
+順に返すので、件数に関係なくメモリ使用量は一定。
+CSV では = + - @ などで始まる文字列の前に ' を付け、表計算ソフトで数式にならないようにする。
+ビュー（export_data）と管理コマンド（export_data）の両方から使う。
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable
+
+from .models import Reservation, Review, Shop
+
+CHUNK_SIZE = 2000          # DB から一度に取り出す行数
+FLUSH_BYTES = 64 * 1024    # この大きさになったら 1 チャンクとして返す
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")  # 表計算ソフトが数式として扱う先頭の文字
+
+
+@dataclass
+class Dataset:
+    columns: tuple          # 出力する列名
+    fields: tuple           # values_list に渡すフィールド
+    queryset: Callable      # filters(dict) -> QuerySet
+
+
+def _reservations(filters):
+    qs = Reservation.objects.all()
+    if filters.get("shop"):
+        qs = qs.filter(shop_id=filters["shop"])
+    if filters.get("date_from"):
+        qs = qs.filter(date__gte=filters["date_from"])
+    if filters.get("date_to"):
+        qs = qs.filter(date__lte=filters["date_to"])
+    return qs.order_by("id")
+
+
+def _reviews(filters):
+    qs = Review.objects.all()
+    if filters.get("shop"):
+        qs = qs.filter(shop_id=filters["shop"])
+    return qs.order_by("id")
+
+
+def _shops(filters):
+    return Shop.objects.order_by("id")
+
+
+DATASETS = {
+    "reservations": Dataset(
+        columns=("id", "shop_id", "shop_name", "username", "date", "time", "num_people", "created_at"),
+        fields=("id", "shop_id", "shop__name", "user__username", "date", "time", "num_people", "created_at"),
+        queryset=_reservations,
+    ),
+    "reviews": Dataset(
+        columns=("id", "shop_id", "shop_name", "username", "rating", "content", "created_at"),
+        fields=("id", "shop_id", "shop__name", "user__username", "rating", "content", "created_at"),
+        queryset=_reviews,
+    ),
+    "shops": Dataset(
+        columns=("id", "external_id", "name", "category", "address", "budget",
+                 "closed_days", "opening_hours", "price", "favorite_count", "updated_at"),
+        fields=("id", "external_id", "name", "category__name", "address", "budget",
+                "closed_days", "opening_hours", "price", "favorite_count", "updated_at"),
+        queryset=_shops,
+    ),
+}
+
+FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} は JSON にできません")
+
+
+def rows(name, filters=None, using=None):
+    """(列名, 行のイテレーター)。using を渡すとその DB から読む（行は返した後に読むので、ビューで決めておく）"""
+    dataset = DATASETS[name]
+    qs = dataset.queryset(filters or {}).values_list(*dataset.fields)
+    if using:
+        qs = qs.using(using)
+    return dataset.columns, qs.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _encode(columns, values, fmt):
+    """行を文字列にして返すジェネレーター（FLUSH_BYTES ごとにまとめる）"""
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in values:
+            writer.writerow([_csv_cell(value) for value in row])
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    else:
+        dumps = json.JSONEncoder(ensure_ascii=False, default=_json_default).encode
+        for row in values:
+            buffer.write(dumps(dict(zip(columns, row))))
+            buffer.write("\n")
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip 形式
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(name, fmt="csv", filters=None, gzip=False, using=None):
+    """出力するバイト列のチャンクを順に返す"""
+    columns, values = rows(name, filters, using)
+    # Excel で開けるように CSV は BOM 付き UTF-8 にする
+    prefix = "\ufeff" if fmt == "csv" else ""
+    chunks = (chunk.encode("utf-8") for chunk in _encode(columns, values, fmt))
+    chunks = _prepend(prefix.encode("utf-8"), chunks)
+    return _gzip(chunks) if gzip else chunks
+
+
+def _prepend(head, chunks):
+    if head:
+        yield head
+    yield from chunks
+
+
+def filename(name, fmt, gzip=False):
+    return f"{name}_{datetime.date.today():%Y%m%d}.{fmt}{'.gz' if gzip else ''}"
@@ -0,0 +1,91 @@
+# app/filters.py
+"""
+店舗一覧の絞り込みと並び順
+
+ShopListView（HTML）と app/api.py（JSON）の両方から使い、同じ条件で同じ結果を返す。
+"""
+from django.db.models import Count
+
+from . import areas, geo
+from .models import Shop
+
+# 並び順（?sort=...）。どれもインデックスで並べ替えられる列だけを使う
+# 最後は必ず一意な列にする（app/api.py のカーソルページングで使う）
+SORT_ORDERS = {
+    '': ('id',),
+    'favorites': ('-favorite_count', 'id'),  # お気に入りが多い順
+    'trending': ('-trending_score', 'id'),   # いま人気の順（app/trending.py）
+}
+
+
+def filter_shops(params, queryset=None):
+    """GET パラメータ（keyword, category_id, area, sort）で絞り込み・並べ替えた QuerySet"""
+    queryset = Shop.objects.all() if queryset is None else queryset
+    return _filter(params, queryset).order_by(*sort_order(params))
+
+
+def _filter(params, queryset):
+    keyword = params.get('keyword', '')
+    category_id = params.get('category_id', '')
+
+    if keyword:
+        queryset = queryset.filter(name__icontains=keyword)
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    # ?area=東京都/渋谷区 は prefecture・city の等号条件（インデックスで引ける）
+    area = areas.parse_param(params.get('area'))
+    if area:
+        queryset = queryset.filter(**area)
+    return queryset
+
+
+def area_facets(params):
+    """
+    選択中のエリア（?area=）の 1 つ下の階層ごとの店舗数。
+    未選択なら都道府県ごと、都道府県を選んでいれば市区町村ごと、政令指定都市なら区ごと。
+    keyword・category_id の絞り込みも反映する。
+    """
+    selected = areas.parse_param(params.get('area'))
+    if len(selected) >= len(areas.AREA_FIELDS):
+        return []
+    level = areas.AREA_FIELDS[len(selected)]
+    rows = (
+        _filter(params, Shop.objects.all()).exclude(**{level: ''})
+        .order_by().values_list(level).annotate(count=Count('id'))
+        .order_by('-count', level)
+    )
+    return [
+        {'label': name, 'value': areas.format_param(*selected.values(), name), 'count': count}
+        for name, count in rows
+    ]
+
+
+def nearby_params(params):
+    """
+    ?lat=&lng=&radius=（km）を (緯度, 経度, 半径) にする。
+    lat・lng が無ければ None、数値でない・範囲外なら ValueError
+    """
+    lat, lng = params.get('lat', ''), params.get('lng', '')
+    if not lat or not lng:
+        return None
+    latitude, longitude = float(lat), float(lng)
+    radius = float(params.get('radius') or geo.DEFAULT_RADIUS_KM)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and radius > 0):
+        raise ValueError('lat・lng・radius が範囲外です')
+    return latitude, longitude, min(radius, geo.MAX_RADIUS_KM)
+
+
+def nearby_shops(params, queryset=None, limit=geo.NEARBY_LIMIT):
+    """
+    ?lat=&lng= から近い順に [(店舗 ID, 距離 km), ...]（app/geo.py）。lat・lng が無ければ None。
+    keyword・category_id・area の絞り込みも反映する（sort は無視する）
+    """
+    point = nearby_params(params)
+    if point is None:
+        return None
+    queryset = Shop.objects.all() if queryset is None else queryset
+    return geo.nearby(_filter(params, queryset), *point, limit=limit)
+
+
+def sort_order(params):
+    return SORT_ORDERS.get(params.get('sort', ''), SORT_ORDERS[''])
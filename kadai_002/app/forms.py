@@ -1,10 +1,13 @@
 from django import forms
 from django.contrib.auth.models import User
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import UserCreationForm, PasswordResetForm
+from django.template import loader
 from .models import Review, Reservation, MemberProfile
 from django.utils import timezone
 import datetime
 
+from . import jobs
+
 #登録フォーム
 class RegisterForm(UserCreationForm):
     first_name = forms.CharField(label="氏名（名）", max_length=30, required=True)
@@ -108,4 +111,20 @@ class MemberProfileForm(forms.ModelForm):
         fields = ['display_name', 'birth_date']
         widgets = {
             'birth_date': forms.DateInput(attrs={'type': 'date'})
-        }
\ No newline at end of file
+        }
+
+#パスワードリセット（メール送信はバックグラウンドジョブで行う）
+class QueuedPasswordResetForm(PasswordResetForm):
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = "".join(subject.splitlines())
+        payload = {
+            "subject": subject,
+            "body": loader.render_to_string(email_template_name, context),
+            "from_email": from_email,
+            "to": [to_email],
+        }
+        if html_email_template_name is not None:
+            payload["html"] = loader.render_to_string(html_email_template_name, context)
+        jobs.enqueue("app.send_email", payload)
@@ -0,0 +1,148 @@
+# app/geo.py
+"""
+店舗の緯度・経度と「近くのお店」検索
+
+緯度・経度は住所から取り出した都道府県・市区町村・区（app/areas.py）を、同梱の
+app/data/centroids.json（政令指定都市の市役所と区役所・東京 23 区の区役所の位置）で
+引いて決める。ネットワークのジオコーダーは使わない。
+区 → 市の順に、見つかった中で細かい方の位置を使う。それ以外の市町村（表に無いもの）や
+都道府県しか分からない住所は緯度・経度を空にし、「近くのお店」には出さない
+（都道府県庁の位置で代用すると、例えば鎌倉市の店舗が横浜にあることになってしまう）。
+町名（丁目）や郵便番号の位置の表は持っていないので、同じ区・市の店舗は
+すべて同じ位置になり、その中での「近い順」は決まらない（一覧の画面にもそう表示する）。
+
+検索では次の 2 段階で絞り込む。
+
+1. 候補: 緯度・経度を CELL_DEGREES 度の格子に区切ったセル番号（Shop.geo_cell、
+   行 × COLUMNS + 列）をインデックスに持つ。探す範囲を囲む長方形は行ごとに
+   セル番号の連続した範囲になるので、BETWEEN の OR でインデックスを引ける
+   （(geo_cell, latitude, longitude) のカバリングインデックスなので本体は読まない）
+2. 順位: 候補の距離を haversine の式でまとめて計算し、近い順に並べる
+   （NumPy があれば配列で計算する）
+
+探す半径は INITIAL_RADIUS_KM から倍々に広げ、その半径の中に limit 件そろった
+時点で止める（半径の中にある店舗はすべて候補に入っているので、結果は正確）。
+ただし位置は区・市ごとの 1 点なので、1 つのセルに入った区の店舗は件数に関係なく
+すべて候補になる。読む行数は「近くの区の店舗数」に比例し、区の中で件数を抑えることはできない
+（区の店舗が増えて遅くなったら、町名単位の位置の表を入れる）。
+"""
+import functools
+import json
+import math
+from pathlib import Path
+
+from django.db.models import Q
+
+from . import lazy
+
+DATA_FILE = Path(__file__).resolve().parent / "data" / "centroids.json"
+CELL_DEGREES = 0.01            # 格子の 1 辺（緯度方向で約 1.1km）
+COLUMNS = round(360 / CELL_DEGREES)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+DEFAULT_RADIUS_KM = 3
+MAX_RADIUS_KM = 30
+INITIAL_RADIUS_KM = 0.5
+NEARBY_LIMIT = 50
+LOCATION_FIELDS = ("latitude", "longitude", "geo_cell")
+
+
+@functools.lru_cache(maxsize=None)
+def centroids():
+    """{"東京都/渋谷区": (緯度, 経度), ...}"""
+    data = json.loads(DATA_FILE.read_text(encoding="utf-8"))
+    return {key: tuple(point) for key, point in data.items()}
+
+
+def locate(prefecture, city="", ward=""):
+    """区か市の位置 (緯度, 経度)。表に無い市町村や、都道府県しか分からなければ None"""
+    parts = [part for part in (prefecture, city, ward) if part]
+    table = centroids()
+    for i in range(len(parts), 1, -1):
+        point = table.get("/".join(parts[:i]))
+        if point:
+            return point
+    return None
+
+
+def cell(latitude, longitude):
+    row = math.floor((latitude + 90) / CELL_DEGREES)
+    column = math.floor((longitude + 180) / CELL_DEGREES) % COLUMNS
+    return row * COLUMNS + column
+
+
+def apply(shop):
+    """shop の prefecture / city / ward から latitude / longitude / geo_cell を設定する（保存はしない）"""
+    point = locate(shop.prefecture, shop.city, shop.ward)
+    shop.latitude, shop.longitude = point or (None, None)
+    shop.geo_cell = cell(*point) if point else None
+    return shop
+
+
+def cell_ranges(latitude, longitude, radius_km):
+    """中心から radius_km の円を囲む長方形のセル番号の範囲 [(最小, 最大), ...]（行ごと）"""
+    delta_lat = radius_km / KM_PER_DEGREE
+    # 経度 1 度の長さは緯度が高いほど短い（極の近くは全周）
+    cos_lat = math.cos(math.radians(min(abs(latitude) + delta_lat, 90)))
+    delta_lng = 180 if cos_lat < 1e-6 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180)
+    first = math.floor((max(latitude - delta_lat, -90) + 90) / CELL_DEGREES)
+    last = math.floor((min(latitude + delta_lat, 90) + 90) / CELL_DEGREES)
+    west = math.floor((longitude - delta_lng + 180) / CELL_DEGREES)
+    east = math.floor((longitude + delta_lng + 180) / CELL_DEGREES)
+
+    columns = []
+    if east - west + 1 >= COLUMNS:
+        columns.append((0, COLUMNS - 1))
+    elif west < 0:  # 経度 180 度をまたぐ
+        columns += [(0, east), (west % COLUMNS, COLUMNS - 1)]
+    elif east >= COLUMNS:
+        columns += [(west, COLUMNS - 1), (0, east % COLUMNS)]
+    else:
+        columns.append((west, east))
+    return [(row * COLUMNS + low, row * COLUMNS + high)
+            for row in range(first, last + 1) for low, high in columns]
+
+
+def distances(latitude, longitude, latitudes, longitudes):
+    """中心から各点までの距離（km、haversine の式）"""
+    np = lazy.optional("numpy")
+    if np is not None:
+        lat1, lng1 = np.radians(latitude), np.radians(longitude)
+        lat2, lng2 = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))).tolist()
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    results = []
+    for lat2, lng2 in zip(latitudes, longitudes):
+        lat2, lng2 = math.radians(lat2), math.radians(lng2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        results.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1))))
+    return results
+
+
+def within(queryset, latitude, longitude, radius_km):
+    """radius_km 以内の店舗の [(距離, id), ...]（順不同）"""
+    condition = Q()
+    for low, high in cell_ranges(latitude, longitude, radius_km):
+        condition |= Q(geo_cell__range=(low, high))
+    rows = list(queryset.filter(condition).order_by().values_list("id", "latitude", "longitude"))
+    if not rows:
+        return []
+    ids, latitudes, longitudes = zip(*rows)
+    return [(distance, shop_id)
+            for distance, shop_id in zip(distances(latitude, longitude, latitudes, longitudes), ids)
+            if distance <= radius_km]
+
+
+def nearby(queryset, latitude, longitude, radius_km=DEFAULT_RADIUS_KM, limit=NEARBY_LIMIT):
+    """radius_km 以内で近い順に limit 件の [(id, 距離 km), ...]（同じ位置の店舗は id 順）"""
+    radius_km = min(radius_km, MAX_RADIUS_KM)
+    searched = min(INITIAL_RADIUS_KM, radius_km)
+    while True:
+        found = within(queryset, latitude, longitude, searched)
+        if len(found) >= limit or searched >= radius_km:
+            break
+        searched = min(searched * 2, radius_km)
+    found.sort()
+    return [(shop_id, distance) for distance, shop_id in found[:limit]]
@@ -0,0 +1,191 @@
+# app/images.py
+"""
+Shop.img / Category.img の派生画像（サムネイル・カード・詳細用）
+
+元画像ごとに settings.IMAGE_VARIANTS の幅へ縮小した WebP と JPEG（フォールバック）を
+MEDIA_ROOT/<IMAGE_DERIVED_DIR>/<元画像のハッシュ>/ に保存し、結果をモデルの
+img_variants（JSON）へ記録する。パスに内容のハッシュを含むので、
+同じ URL の中身が変わることはなく、長期キャッシュしてよい。
+
+生成はバックグラウンドジョブ（app.generate_image_variants）で行う。
+既存画像は `python manage.py generate_image_variants` で作成する。
+"""
+import base64
+import hashlib
+import io
+import posixpath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from . import jobs, prerender, shop_cache
+
+JOB_NAME = "app.generate_image_variants"
+
+# 派生画像を持つモデルと画像フィールド
+IMAGE_MODELS = {
+    "app.Shop": "img",
+    "app.Category": "img",
+}
+
+
+def variant_widths():
+    return getattr(settings, "IMAGE_VARIANTS", {"thumb": 160, "card": 480, "detail": 1200})
+
+
+def derived_dir():
+    return getattr(settings, "IMAGE_DERIVED_DIR", "derived")
+
+
+def is_default(image):
+    """フィールドの既定の画像（noImage.png）。派生画像は作らず元画像をそのまま使う"""
+    return image.name == image.field.default
+
+
+def needs_variants(image, variants):
+    """img_variants が現在の画像から作られたものでなければ True（既定の画像は False）"""
+    return bool(image) and not is_default(image) and (variants or {}).get("source") != image.name
+
+
+def _open(data, draft_size=None):
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+    if draft_size:
+        # JPEG はデコード時に縮小できるので、巨大な写真でも速い
+        image.draft("RGB", draft_size)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    return image
+
+
+def _encode(image, fmt):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        if image.mode == "RGBA":
+            # JPEG は透過を持てないので白背景に合成する
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        image.save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+    else:
+        image.save(buffer, "WEBP", quality=80, method=4)
+    return buffer.getvalue()
+
+
+def _save(name, data):
+    # ハッシュ付きのパスなので、既にあれば同じ内容とみなして書き込まない
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def generate_variants(field_file):
+    """画像ファイルから派生画像を生成し、img_variants に保存する dict を返す"""
+    from PIL import Image
+
+    with field_file.open("rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    base = posixpath.join(derived_dir(), digest)
+    source = _open(data)
+
+    variants = {}
+    for variant, width in variant_widths().items():
+        # 元画像より大きくはしない
+        width = min(width, source.width)
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS)
+        variants[variant] = {
+            "width": width,
+            "height": height,
+            "webp": _save(f"{base}/{variant}.webp", _encode(resized, "webp")),
+            "jpeg": _save(f"{base}/{variant}.jpg", _encode(resized, "jpeg")),
+        }
+
+    return {
+        "source": field_file.name,
+        "width": source.width,
+        "height": source.height,
+        "variants": variants,
+    }
+
+
+def placeholder(data):
+    """画像データから (幅, 高さ, 代表色, 16px プレビューの data URI) を返す"""
+    from PIL import Image
+
+    width = getattr(settings, "IMAGE_PLACEHOLDER_WIDTH", 16)
+    image = _open(data, draft_size=(width * 4, width * 4))
+    # draft 後の size は縮小後の値なので、元のサイズはヘッダーから読む
+    with Image.open(io.BytesIO(data)) as original:
+        size = original.size
+        if original.getexif().get(0x0112) in (5, 6, 7, 8):
+            size = size[::-1]  # EXIF で 90 度回転している
+
+    rgb = image.convert("RGB")
+    r, g, b = rgb.resize((1, 1), Image.BOX).getpixel((0, 0))
+    preview = rgb.resize((width, max(1, round(rgb.height * width / rgb.width))), Image.BOX)
+    encoded = base64.b64encode(_encode(preview, "webp")).decode("ascii")
+    return size[0], size[1], f"#{r:02x}{g:02x}{b:02x}", f"data:image/webp;base64,{encoded}"
+
+
+def clear_placeholder(instance):
+    instance.img_width = instance.img_height = None
+    instance.img_color = instance.img_placeholder = ""
+
+
+def set_placeholder(instance, field="img"):
+    """インスタンスの img_width / img_height / img_color / img_placeholder を埋める
+    （保存はしない）。アップロード直後のファイルも読める。"""
+    image = getattr(instance, field)
+    if not image:
+        clear_placeholder(instance)
+        return
+    committed = image._committed
+    image.open("rb")
+    try:
+        data = image.read()
+    finally:
+        # アップロード直後のファイルはこの後ストレージへ保存されるので閉じない
+        if committed:
+            image.close()
+        else:
+            image.seek(0)
+    (instance.img_width, instance.img_height,
+     instance.img_color, instance.img_placeholder) = placeholder(data)
+
+
+def process_instance(instance, field="img", force=False):
+    """インスタンスの派生画像を作り直して保存する（save() は呼ばない）"""
+    image = getattr(instance, field)
+    if not image:
+        return None
+    if not force and not needs_variants(image, instance.img_variants):
+        return instance.img_variants
+    result = generate_variants(image)
+    type(instance).objects.filter(pk=instance.pk).update(img_variants=result)
+    shop_cache.invalidate_object(instance)
+    prerender.invalidate_object(instance)
+    instance.img_variants = result
+    return result
+
+
+def enqueue(instance, field="img"):
+    label = f"{instance._meta.app_label}.{instance._meta.object_name}"
+    return jobs.enqueue(JOB_NAME, {"model": label, "pk": instance.pk, "field": field})
+
+
+@jobs.register(JOB_NAME)
+def generate_image_variants(payload):
+    model = apps.get_model(payload["model"])
+    instance = model.objects.filter(pk=payload["pk"]).first()
+    if instance is None:
+        # 生成前に削除された
+        return
+    process_instance(instance, payload.get("field", "img"))
@@ -0,0 +1,263 @@
+# app/jobs.py
+"""
+DB バックエンドのバックグラウンドジョブ
+
+使い方:
+    from app import jobs
+
+    @jobs.register("app.send_email", batch=True)
+    def send_email(payloads): ...
+
+    jobs.enqueue("app.send_email", {"subject": ..., "to": [...]})
+
+batch=True のハンドラは、失敗した payload があれば {payload の位置: エラー} を返す。
+返した分だけがリトライされ、残りは完了になる（例外を投げたらすべてリトライ）。
+
+ワーカーは `python manage.py run_jobs` で起動する。
+settings.JOBS_EAGER = True の場合は enqueue 時にその場で実行する（テスト用）。
+"""
+import logging
+import os
+import socket
+import traceback
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobSpec:
+    func: Callable
+    batch: bool = False
+    max_attempts: int = 5
+
+
+_registry: dict[str, JobSpec] = {}
+
+
+def register(name, batch=False, max_attempts=5):
+    """ハンドラを登録するデコレータ。
+    batch=True のハンドラは payload のリストを受け取り、まとめて処理する。
+    一部だけ失敗したときは {位置: エラー} を返す（None ならすべて成功）。"""
+    def decorator(func):
+        _registry[name] = JobSpec(func=func, batch=batch, max_attempts=max_attempts)
+        return func
+    return decorator
+
+
+def get_spec(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"未登録のジョブです: {name}")
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(name, payload=None, run_at=None, max_attempts=None):
+    """ジョブを登録する。呼び出し元のトランザクション内で INSERT されるので、
+    ロールバックされればジョブも消える。"""
+    spec = get_spec(name)
+    payload = payload or {}
+
+    if _setting("JOBS_EAGER", False):
+        _call_eager(spec, [payload])
+        return None
+
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or spec.max_attempts,
+    )
+
+
+def enqueue_many(name, payloads, batch_size=1000):
+    """同じハンドラのジョブをまとめて登録する（bulk INSERT）"""
+    spec = get_spec(name)
+    payloads = list(payloads)
+
+    if _setting("JOBS_EAGER", False):
+        _call_eager(spec, payloads)
+        return []
+
+    now = timezone.now()
+    return Job.objects.bulk_create(
+        [Job(name=name, payload=p, run_at=now, max_attempts=spec.max_attempts) for p in payloads],
+        batch_size=batch_size,
+    )
+
+
+def _call(spec, payloads):
+    """{位置: エラー}（失敗した payload だけ）を返す"""
+    if spec.batch:
+        return spec.func(payloads) or {}
+    for payload in payloads:
+        spec.func(payload)
+    return {}
+
+
+def _call_eager(spec, payloads):
+    # その場で実行するときは、失敗を呼び出し元に伝える
+    failures = _call(spec, payloads)
+    if failures:
+        raise RuntimeError(next(iter(failures.values())))
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker_id, limit):
+    """実行可能なジョブを最大 limit 件取得して running にする。
+
+    SKIP LOCKED が使える DB（PostgreSQL など）では行ロックで取り合いを避ける。
+    SQLite では候補 ID を読んだ後、status=queued を条件にした UPDATE で
+    奪い合い、自分が書き換えた行だけを返す。"""
+    now = timezone.now()
+    ready = (
+        Job.objects.filter(status=Job.Status.QUEUED, run_at__lte=now)
+        .order_by("run_at", "id")
+    )
+    claimed = dict(
+        status=Job.Status.RUNNING,
+        locked_by=worker_id,
+        locked_at=now,
+        attempts=F("attempts") + 1,
+    )
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                ready.select_for_update(skip_locked=True).values_list("id", flat=True)[:limit]
+            )
+            Job.objects.filter(id__in=ids).update(**claimed)
+    else:
+        ids = list(ready.values_list("id", flat=True)[:limit])
+        Job.objects.filter(id__in=ids, status=Job.Status.QUEUED).update(**claimed)
+
+    return list(
+        Job.objects.filter(
+            id__in=ids,
+            status=Job.Status.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+        ).order_by("run_at", "id")
+    )
+
+
+def requeue_stale(timeout=None):
+    """ワーカーが落ちて running のまま残ったジョブを待機中に戻す。"""
+    timeout = timeout or _setting("JOBS_LOCK_TIMEOUT", 600)
+    limit = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=limit).update(
+        status=Job.Status.QUEUED, locked_by="", locked_at=None
+    )
+
+
+def backoff(attempts):
+    """attempts 回目の失敗後に待つ秒数（指数バックオフ）"""
+    base = _setting("JOBS_RETRY_BASE_DELAY", 10)
+    cap = _setting("JOBS_RETRY_MAX_DELAY", 3600)
+    return min(cap, base * 2 ** max(attempts - 1, 0))
+
+
+def _mark_done(jobs):
+    Job.objects.filter(id__in=[j.id for j in jobs]).update(
+        status=Job.Status.DONE, locked_by="", last_error=""
+    )
+
+
+def _mark_failed(jobs, error):
+    now = timezone.now()
+    for job in jobs:
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(id=job.id).update(
+                status=Job.Status.FAILED, locked_by="", last_error=error
+            )
+        else:
+            Job.objects.filter(id=job.id).update(
+                status=Job.Status.QUEUED,
+                locked_by="",
+                locked_at=None,
+                run_at=now + timedelta(seconds=backoff(job.attempts)),
+                last_error=error,
+            )
+
+
+def run_jobs(jobs):
+    """取得済みジョブをハンドラ名ごとにまとめて実行する。
+    batch ハンドラは 1 回の呼び出しでまとめて処理し、失敗したと返した分だけをリトライ
+    （例外なら全件リトライ）。"""
+    groups = defaultdict(list)
+    for job in jobs:
+        groups[job.name].append(job)
+
+    for name, group in groups.items():
+        try:
+            spec = get_spec(name)
+            failures = _call(spec, [job.payload for job in group])
+        except Exception:
+            error = traceback.format_exc()
+            logger.exception("ジョブ %s (%d 件) が失敗しました", name, len(group))
+            _mark_failed(group, error)
+            continue
+        if failures:
+            logger.error("ジョブ %s (%d 件中 %d 件) が失敗しました", name, len(group), len(failures))
+            for position, error in failures.items():
+                _mark_failed([group[position]], error)
+        _mark_done([job for position, job in enumerate(group) if position not in failures])
+
+
+def work_once(worker_id=None, batch_size=None):
+    """1 回分取得して実行する。処理した件数を返す。"""
+    worker_id = worker_id or default_worker_id()
+    batch_size = batch_size or _setting("JOBS_BATCH_SIZE", 100)
+    jobs = claim(worker_id, batch_size)
+    if jobs:
+        run_jobs(jobs)
+    return len(jobs)
+
+
+# ----------------------------
+# 組み込みハンドラ
+# ----------------------------
+@register("app.send_email", batch=True)
+def send_email(payloads):
+    """メールをまとめて送る。SMTP 接続は 1 バッチで 1 本だけ開く。
+    1 通ずつ送り、失敗した分だけを返す（送れた宛先にはリトライで二重に送らない）。"""
+    from django.core.mail import EmailMultiAlternatives, get_connection
+
+    messages = []
+    for payload in payloads:
+        message = EmailMultiAlternatives(
+            subject=payload["subject"],
+            body=payload["body"],
+            from_email=payload.get("from_email"),
+            to=payload["to"],
+        )
+        if payload.get("html"):
+            message.attach_alternative(payload["html"], "text/html")
+        messages.append(message)
+
+    failures = {}
+    with get_connection() as mail_connection:
+        for position, message in enumerate(messages):
+            try:
+                mail_connection.send_messages([message])
+            except Exception:
+                logger.exception("メールを送れませんでした: %s", message.to)
+                failures[position] = traceback.format_exc()
+    return failures
@@ -0,0 +1,37 @@
+# app/lazy.py
+"""
+重い依存（Stripe SDK・NumPy・SciPy）を使う時まで import しない
+
+モジュールの先頭で import すると、そのページに来ないワーカーも起動のたびに
+import の時間とメモリを払う（Stripe SDK だけで数十 ms）。
+
+    stripe = lazy.module("stripe", configure=lambda m: setattr(m, "api_key", KEY))
+    np = lazy.optional("numpy")  # 入っていなければ None
+
+PIL は app/images.py の関数の中で import している。
+起動時に読み込まれていないことは app/tests.py の StartupTests で確かめる。
+"""
+import functools
+import importlib
+
+from django.utils.functional import SimpleLazyObject
+
+
+def module(name, configure=None):
+    """最初に属性を読んだ時に import するモジュール（configure(module) で初期設定する）"""
+    def load():
+        loaded = importlib.import_module(name)
+        if configure is not None:
+            configure(loaded)
+        return loaded
+
+    return SimpleLazyObject(load)
+
+
+@functools.lru_cache(maxsize=None)
+def optional(name):
+    """任意の依存を import して返す。入っていなければ None（結果は覚えておく）"""
+    try:
+        return importlib.import_module(name)
+    except ImportError:  # pragma: no cover - 任意の依存
+        return None
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from app import benchmarks
+
+
+class Command(BaseCommand):
+    help = "非同期ビューのページを WSGI と ASGI のハンドラーに同時に投げ、スループットとレイテンシを比べます"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, action="append", dest="levels",
+                            help="同時リクエスト数（複数可。省略時は 1, 8, 32）")
+        parser.add_argument("--requests", type=int, default=200, help="同時数ごとのリクエスト数")
+        parser.add_argument("--url", action="append", dest="names", help="取得する URL 名（複数可）")
+
+    def handle(self, *args, **options):
+        # bench_views と同じ一時的な DB と固定のデータセットで計測する
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            benchmarks.seed()
+            results = benchmarks.run_concurrency(
+                options["levels"] or (1, 8, 32), options["requests"], options["names"],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'mode':<6} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for (mode, concurrency), r in results.items():
+            self.stdout.write(
+                f"{mode:<6} {concurrency:>5} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>7}"
+            )
@@ -0,0 +1,151 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE review (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    shop_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX review_shop_created ON review (shop_id, created_at);
+"""
+
+
+class Profile:
+    """ベンチマーク用の接続設定"""
+
+    def __init__(self, name, pragmas, immediate, persistent):
+        self.name = name
+        self.pragmas = pragmas
+        self.immediate = immediate
+        self.persistent = persistent
+
+    def connect(self, path):
+        # isolation_level=None で BEGIN を自分で発行する（Django と同じ）
+        timeout = self.pragmas.get("busy_timeout", 5000) / 1000
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        for key, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {key}={value}")
+        return conn
+
+
+PROFILES = {
+    # 変更前: Django の SQLite 既定値（rollback journal、DEFERRED、リクエストごとに接続）
+    "before": Profile("before", {}, immediate=False, persistent=False),
+    # 変更後: settings.SQLITE_PRAGMAS + BEGIN IMMEDIATE + 接続の使い回し
+    "after": Profile("after", getattr(settings, "SQLITE_PRAGMAS", {}), immediate=True, persistent=True),
+}
+
+
+class Command(BaseCommand):
+    help = "SQLite の接続設定（変更前 / 変更後）で読み書きのスループットを比較します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--write-ratio", type=float, default=0.2,
+                            help="書き込み操作の割合（0〜1）")
+        parser.add_argument("--rows", type=int, default=50_000, help="初期データの行数")
+        parser.add_argument("--shops", type=int, default=1_000)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            results = [self.run_profile(profile, Path(tmp) / f"{name}.sqlite3", options)
+                       for name, profile in PROFILES.items()]
+
+        header = f"{'profile':<8} {'reads/s':>10} {'writes/s':>10} {'locked':>8} {'p50 ms':>8} {'p99 ms':>8}"
+        self.stdout.write(header)
+        for r in results:
+            self.stdout.write(
+                f"{r['name']:<8} {r['reads']:>10.0f} {r['writes']:>10.0f} {r['errors']:>8} "
+                f"{r['p50']:>8.2f} {r['p99']:>8.2f}"
+            )
+
+    def seed(self, profile, path, options):
+        conn = profile.connect(path)
+        conn.executescript(SCHEMA)
+        now = time.time()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO review (shop_id, content, rating, created_at) VALUES (?, ?, ?, ?)",
+            ((random.randrange(options["shops"]), "おいしかった" * 10, random.randint(1, 5), now)
+             for _ in range(options["rows"])),
+        )
+        conn.execute("COMMIT")
+        conn.close()
+
+    def run_profile(self, profile, path, options):
+        self.seed(profile, path, options)
+        deadline = time.perf_counter() + options["seconds"]
+        lock = threading.Lock()
+        totals = {"reads": 0, "writes": 0, "errors": 0, "latencies": []}
+
+        def worker():
+            rng = random.Random()
+            reads = writes = errors = 0
+            latencies = []
+            conn = profile.connect(path) if profile.persistent else None
+            while time.perf_counter() < deadline:
+                c = conn or profile.connect(path)
+                started = time.perf_counter()
+                try:
+                    if rng.random() < options["write_ratio"]:
+                        c.execute("BEGIN IMMEDIATE" if profile.immediate else "BEGIN")
+                        # レビュー投稿と同じく、読んでから書く
+                        c.execute("SELECT count(*) FROM review WHERE shop_id = ?",
+                                  (rng.randrange(options["shops"]),)).fetchone()
+                        c.execute(
+                            "INSERT INTO review (shop_id, content, rating, created_at) VALUES (?, ?, ?, ?)",
+                            (rng.randrange(options["shops"]), "おいしかった", rng.randint(1, 5), time.time()),
+                        )
+                        c.execute("COMMIT")
+                        writes += 1
+                    else:
+                        c.execute(
+                            "SELECT id, content, rating FROM review WHERE shop_id = ? "
+                            "ORDER BY created_at DESC LIMIT 20",
+                            (rng.randrange(options["shops"]),),
+                        ).fetchall()
+                        reads += 1
+                    latencies.append(time.perf_counter() - started)
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if c.in_transaction:
+                        c.execute("ROLLBACK")
+                finally:
+                    if conn is None:
+                        c.close()
+            if conn is not None:
+                conn.close()
+            with lock:
+                totals["reads"] += reads
+                totals["writes"] += writes
+                totals["errors"] += errors
+                totals["latencies"].extend(latencies)
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        latencies = sorted(totals["latencies"]) or [0]
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            "name": profile.name,
+            "reads": totals["reads"] / options["seconds"],
+            "writes": totals["writes"] / options["seconds"],
+            "errors": totals["errors"],
+            "p50": quantiles[49] * 1000,
+            "p99": quantiles[98] * 1000,
+        }
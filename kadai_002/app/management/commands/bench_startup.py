@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import benchmarks
+
+
+class Command(BaseCommand):
+    help = "新しいプロセスで起動時間と最初のリクエストの応答時間を計測し、ベースラインと比較します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="準備あり・なしそれぞれの起動回数（中央値を使う）")
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="結果をベースラインとして保存する")
+
+    def handle(self, *args, **options):
+        results = benchmarks.run_startup(options["runs"])
+        baseline = {} if options["save_baseline"] else benchmarks.load_startup_baseline()
+        self.report(results, baseline)
+
+        if options["save_baseline"]:
+            benchmarks.save_startup_baseline(results)
+            self.stdout.write(self.style.SUCCESS(f"ベースラインを保存しました: {benchmarks.startup_baseline_path()}"))
+            return
+
+        regressions = benchmarks.compare_startup(results, baseline)
+        if regressions:
+            raise CommandError("起動が遅くなっています:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("ベースラインからの悪化はありません"))
+
+    def report(self, results, baseline):
+        self.stdout.write(f"{'mode':<7} {'status':>6} {'import ms':>10} {'ready ms':>9} {'1st ms':>8} {'2nd ms':>8}  (baseline ready / 1st)")
+        for mode, r in results.items():
+            base = baseline.get(mode)
+            note = f"  ({base['ready_ms']} / {base['first_response_ms']} ms)" if base else ""
+            self.stdout.write(
+                f"{mode:<7} {r['status']:>6} {r['import_ms']:>10} {r['ready_ms']:>9} "
+                f"{r['first_response_ms']:>8} {r['second_response_ms']:>8}{note}"
+            )
+            if r["heavy_modules"]:
+                self.stdout.write(self.style.WARNING(f"        起動時に読み込まれた重い依存: {', '.join(r['heavy_modules'])}"))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from app import benchmarks
+
+
+class Command(BaseCommand):
+    help = "app/urls.py の各ページのクエリ数・レイテンシ・ピークメモリを計測し、ベースラインと比較します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--url", action="append", dest="names", help="計測する URL 名（複数可）")
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="結果をベースラインとして保存する")
+        parser.add_argument("--current-db", action="store_true",
+                            help="テスト用 DB を作らず、設定中の DB とデータで計測する（比較はしない）")
+
+    def handle(self, *args, **options):
+        if options["current_db"]:
+            results = benchmarks.run(options["iterations"], options["names"])
+            self.report(results, {})
+            return
+
+        # テストと同じく一時的な DB を作り、固定のデータセットで計測する
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            benchmarks.seed()
+            results = benchmarks.run(options["iterations"], options["names"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options["save_baseline"]:
+            baseline = benchmarks.load_baseline() if options["names"] else {}
+            baseline.update(results)
+            benchmarks.save_baseline(baseline)
+            self.report(results, {})
+            self.stdout.write(self.style.SUCCESS(f"ベースラインを保存しました: {benchmarks.baseline_path()}"))
+            return
+
+        baseline = benchmarks.load_baseline()
+        self.report(results, baseline)
+        regressions = benchmarks.compare(results, baseline)
+        if regressions:
+            raise CommandError("性能が悪化しています:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("ベースラインからの悪化はありません"))
+
+    def report(self, results, baseline):
+        self.stdout.write(f"{'url':<24} {'status':>6} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak KB':>9}  (baseline p95)")
+        for name, r in results.items():
+            base = baseline.get(name)
+            note = f"  ({base['p95_ms']} ms, {base['queries']} q)" if base else ""
+            self.stdout.write(
+                f"{name:<24} {r['status']:>6} {r['queries']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['peak_kb']:>9}{note}"
+            )
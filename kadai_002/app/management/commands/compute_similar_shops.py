@@ -0,0 +1,53 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app import recommendations
+
+
+class Command(BaseCommand):
+    help = "お気に入り・レビューから「似ているお店」を計算して保存します（app/recommendations.py）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=recommendations.TOP_K,
+                            help="1 店舗あたり保存する件数")
+        parser.add_argument("--incremental", action="store_true",
+                            help="前回の計算以降に動きのあった店舗だけ計算し直す")
+        parser.add_argument("--since", help="--incremental の起点（ISO 形式。省略時は前回の計算日時）")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        engine = recommendations.engine()
+
+        if not options["incremental"]:
+            count = recommendations.rebuild(top_k=options["top_k"])
+            self.stdout.write(self.style.SUCCESS(
+                f"{count} 店舗を計算しました（{engine}, {time.perf_counter() - started:.1f} 秒）"
+            ))
+            return
+
+        since = self.parse_since(options["since"]) or recommendations.last_computed()
+        if since is None:
+            raise CommandError("前回の計算結果がありません。まず --incremental なしで実行してください")
+        shop_ids = recommendations.affected_shops(since)
+        if not shop_ids:
+            self.stdout.write(f"{timezone.localtime(since):%Y-%m-%d %H:%M:%S} 以降の変更はありません")
+            return
+        count = recommendations.rebuild(shop_ids, top_k=options["top_k"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{timezone.localtime(since):%Y-%m-%d %H:%M:%S} 以降の変更から {count} 店舗を計算し直しました"
+            f"（{engine}, {time.perf_counter() - started:.1f} 秒）"
+        ))
+
+    def parse_since(self, value):
+        if not value:
+            return None
+        try:
+            since = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"--since の形式が正しくありません: {value}")
+        if since.tzinfo is None:
+            since = timezone.make_aware(since)
+        return since
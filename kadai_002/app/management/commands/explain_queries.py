@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from app import benchmarks, query_plans
+
+
+class Command(BaseCommand):
+    help = "各ページの SQL を EXPLAIN QUERY PLAN で調べ、全件スキャン・一時ソートとインデックスの候補を表示します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", action="append", dest="names", help="調べる URL 名（複数可）")
+        parser.add_argument("--verbose-plans", action="store_true",
+                            help="lookup（カバリングでないインデックス）も表示する")
+
+    def handle(self, *args, **options):
+        # bench_views と同じく一時的な DB に固定のデータセットを作って調べる
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            benchmarks.seed()
+            findings = query_plans.analyze(options["names"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        shown = [f for f in findings if f.kind != "lookup" or options["verbose_plans"]]
+        for finding in shown:
+            if finding.fails:
+                label = self.style.ERROR(finding.kind.upper())
+            elif finding.key in query_plans.ALLOWED:
+                label = f"{finding.kind.upper()} (許可: {query_plans.ALLOWED[finding.key]})"
+            else:
+                label = finding.kind.upper()
+            self.stdout.write(f"{label} {finding.view}: {finding.detail}")
+            self.stdout.write(f"    {finding.sql}")
+            if finding.suggestion:
+                self.stdout.write(self.style.SUCCESS(f"    候補: {finding.suggestion}"))
+
+        failures = [f for f in findings if f.fails]
+        if failures:
+            raise CommandError(f"全件スキャン・一時ソートが {len(failures)} 件あります")
+        self.stdout.write(self.style.SUCCESS("問題のある実行計画はありません"))
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from app import exports
+
+
+class Command(BaseCommand):
+    help = "予約・レビュー・店舗を CSV / JSONL で出力します（メモリ使用量は件数に依存しません）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=sorted(exports.DATASETS))
+        parser.add_argument("--format", choices=sorted(exports.FORMATS), default="csv")
+        parser.add_argument("--gzip", action="store_true", help="gzip で圧縮して出力する")
+        parser.add_argument("--output", "-o", help="出力先ファイル（省略時は標準出力）")
+        parser.add_argument("--shop", type=int, help="店舗 ID で絞り込む（予約・レビュー）")
+        parser.add_argument("--date-from", help="予約日の開始（YYYY-MM-DD）")
+        parser.add_argument("--date-to", help="予約日の終了（YYYY-MM-DD）")
+
+    def handle(self, *args, **options):
+        filters = {
+            "shop": options["shop"],
+            "date_from": options["date_from"],
+            "date_to": options["date_to"],
+        }
+        chunks = exports.stream(options["dataset"], options["format"], filters, gzip=options["gzip"])
+        if options["output"]:
+            with open(options["output"], "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,46 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from app import images, prerender, shop_cache
+
+PLACEHOLDER_FIELDS = ("img_width", "img_height", "img_color", "img_placeholder")
+
+
+class Command(BaseCommand):
+    help = "既存の Shop / Category 画像から派生画像（サムネイル・WebP）とプレースホルダーを作成します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=sorted(images.IMAGE_MODELS),
+                            help="対象モデル（省略時はすべて）")
+        parser.add_argument("--force", action="store_true",
+                            help="作成済みのものも作り直す")
+        parser.add_argument("--enqueue", action="store_true",
+                            help="派生画像はこの場で生成せずジョブとして登録する")
+
+    def handle(self, *args, **options):
+        labels = [options["model"]] if options["model"] else sorted(images.IMAGE_MODELS)
+        for label in labels:
+            model = apps.get_model(label)
+            field = images.IMAGE_MODELS[label]
+            done = failed = 0
+            for instance in model.objects.exclude(**{field: ""}).iterator(chunk_size=500):
+                image = getattr(instance, field)
+                try:
+                    if options["force"] or not instance.img_placeholder:
+                        images.set_placeholder(instance, field)
+                        model.objects.filter(pk=instance.pk).update(
+                            **{name: getattr(instance, name) for name in PLACEHOLDER_FIELDS}
+                        )
+                        shop_cache.invalidate_object(instance)
+                        prerender.invalidate_object(instance)
+                    if not options["force"] and not images.needs_variants(image, instance.img_variants):
+                        continue
+                    if options["enqueue"]:
+                        images.enqueue(instance, field)
+                    else:
+                        images.process_instance(instance, field, force=options["force"])
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{label} #{instance.pk}: {e}")
+            self.stdout.write(f"{label}: {done} 件処理, {failed} 件失敗")
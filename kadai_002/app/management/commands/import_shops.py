@@ -0,0 +1,228 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app import areas, geo, images, jobs, prerender, shop_cache
+from app.models import Category, Shop
+
+# 入力の列名 → Shop のフィールド（category と image は別扱い）
+FIELDS = ("name", "address", "budget", "closed_days", "opening_hours", "detail", "price")
+# address から設定する列
+ADDRESS_FIELDS = [*areas.AREA_FIELDS, *geo.LOCATION_FIELDS]
+IMAGE_FIELDS = ["img", "img_width", "img_height", "img_color", "img_placeholder"]
+BUDGETS = {**{value: value for value in Shop.Budget.values},
+           **{label: value for value, label in Shop.Budget.choices}}
+
+
+def read_rows(path, fmt):
+    """1 行ずつ dict を返す。ファイル全体は読み込まない"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Checkpoint:
+    """処理済みの行数をファイルに記録する（バッチのコミットごとに更新）"""
+
+    def __init__(self, path, source):
+        self.path = Path(path) if path else None
+        self.source = str(Path(source).resolve())
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return 0
+        data = json.loads(self.path.read_text())
+        if data.get("source") != self.source:
+            raise CommandError(f"チェックポイント {self.path} は別のファイル（{data.get('source')}）のものです")
+        return data["rows"]
+
+    def save(self, rows):
+        if not self.path:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"source": self.source, "rows": rows}))
+        os.replace(tmp, self.path)
+
+
+class Command(BaseCommand):
+    help = "CSV / JSONL の店舗カタログを一括で取り込みます（external_id で upsert）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="入力ファイル（.csv / .jsonl）")
+        parser.add_argument("--format", choices=["csv", "jsonl"],
+                            help="省略時は拡張子から判定")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--images-dir",
+                            help="image 列のファイル名を探すディレクトリ")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="画像取り込みの並列数")
+        parser.add_argument("--checkpoint",
+                            help="進捗を記録するファイル。再実行時は続きから取り込む")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        self.images_dir = Path(options["images_dir"]) if options["images_dir"] else None
+        self.categories = dict(Category.objects.values_list("name", "id"))
+
+        checkpoint = Checkpoint(options["checkpoint"], path)
+        done = checkpoint.load()
+        if done:
+            self.stdout.write(f"チェックポイントから再開します（{done} 行処理済み）")
+
+        rows = islice(read_rows(path, fmt), done, None)
+        started = time.perf_counter()
+        imported = skipped = 0
+
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            while True:
+                batch = list(islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+                ok, errors = self.import_batch(batch, done, pool)
+                done += len(batch)
+                imported += ok
+                skipped += errors
+                checkpoint.save(done)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{done} 行（取り込み {imported} / スキップ {skipped}） "
+                    f"{imported / elapsed:.0f} rows/sec"
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"完了: {imported} 件を {elapsed:.1f} 秒で取り込みました"
+            f"（{imported / elapsed if elapsed else 0:.0f} rows/sec, スキップ {skipped} 件）"
+        ))
+
+    def import_batch(self, batch, offset, pool):
+        shops, image_jobs = {}, []
+        errors = 0
+        for line_no, row in enumerate(batch, start=offset + 1):
+            try:
+                shop = self.build_shop(row)
+            except (KeyError, ValueError) as e:
+                errors += 1
+                self.stderr.write(f"{line_no} 行目: {e}")
+                continue
+            # 同じバッチに同じ external_id があれば後の行を使う
+            shops[shop.external_id] = shop
+            if row.get("image") and self.images_dir:
+                image_jobs.append((shop, row["image"]))
+
+        shops = list(shops.values())
+        self.resolve_categories(shops)
+        # 画像のコピーとプレースホルダー計算はスレッドで並列に行う
+        with_image = {
+            shop.external_id for shop, ok in pool.map(lambda job: self.ingest_image(*job), image_jobs)
+            if ok
+        }
+        # 入力に無い列・空のセル（画像の無い行の画像も）で既存の値を上書きしないよう、
+        # 更新する列が同じ行ごとに分けて upsert する
+        groups = {}
+        for shop in shops:
+            update_fields = shop._update_fields + (IMAGE_FIELDS if shop.external_id in with_image else [])
+            groups.setdefault(tuple(update_fields), []).append(shop)
+
+        with transaction.atomic():
+            for update_fields, group in groups.items():
+                Shop.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=["external_id"],
+                    update_fields=list(update_fields),
+                )
+            if with_image:
+                # 派生画像は run_jobs で作る
+                ids = Shop.objects.filter(external_id__in=with_image).values_list("pk", flat=True)
+                jobs.enqueue_many(
+                    images.JOB_NAME,
+                    [{"model": "app.Shop", "pk": pk, "field": "img"} for pk in ids],
+                )
+        # bulk_create の upsert では signals が動かないので、店舗のキャッシュと静的ページを消す
+        touched = Shop.objects.filter(external_id__in=[shop.external_id for shop in shops])
+        shop_cache.invalidate_many(touched.values_list("pk", flat=True))
+        prerender.invalidate_shops(touched)
+        return len(shops), errors
+
+    def build_shop(self, row):
+        external_id = (row.get("external_id") or "").strip()
+        name = (row.get("name") or "").strip()
+        if not external_id:
+            raise ValueError("external_id がありません")
+        if not name:
+            raise ValueError("name がありません")
+
+        values = {field: row[field] for field in FIELDS if row.get(field) not in (None, "")}
+        values["name"] = name
+        if "budget" in values:
+            try:
+                values["budget"] = BUDGETS[values["budget"]]
+            except KeyError:
+                raise ValueError(f"budget が不正です: {values['budget']}")
+        if "price" in values:
+            values["price"] = int(values["price"])
+
+        shop = Shop(external_id=external_id, **values)
+        # bulk_create では pre_save が動かないので、エリアと位置はここで設定する
+        geo.apply(areas.apply(shop))
+        shop._category_name = (row.get("category") or "").strip()
+        shop._update_fields = self.update_fields(row)
+        return shop
+
+    def update_fields(self, row):
+        """既存の店舗で上書きする列（値の入っている列だけ。空のセルは build_shop が捨てるので含めない）"""
+        fields = [field for field in FIELDS if row.get(field) not in (None, "")]
+        if "address" in fields:
+            fields += ADDRESS_FIELDS
+        if (row.get("category") or "").strip():
+            fields.append("category")
+        return [*fields, "updated_at"]
+
+    def resolve_categories(self, shops):
+        """カテゴリ名 → ID をメモリ上の対応表で引き、無いものだけまとめて作る"""
+        missing = {shop._category_name for shop in shops
+                   if shop._category_name and shop._category_name not in self.categories}
+        if missing:
+            Category.objects.bulk_create(
+                [Category(name=name) for name in missing], ignore_conflicts=True
+            )
+            self.categories.update(
+                Category.objects.filter(name__in=missing).values_list("name", "id")
+            )
+        for shop in shops:
+            shop.category_id = self.categories.get(shop._category_name)
+
+    def ingest_image(self, shop, filename):
+        source = (self.images_dir / filename).resolve()
+        if self.images_dir.resolve() not in source.parents or not source.is_file():
+            self.stderr.write(f"{shop.external_id}: 画像が見つかりません: {filename}")
+            return shop, False
+        data = source.read_bytes()
+        # 内容のハッシュをファイル名にして、再実行しても重複保存しない
+        name = f"shops/{hashlib.sha1(data).hexdigest()[:16]}{source.suffix.lower()}"
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        try:
+            shop.img_width, shop.img_height, shop.img_color, shop.img_placeholder = images.placeholder(data)
+        except Exception as e:
+            self.stderr.write(f"{shop.external_id}: 画像を読み込めません: {e}")
+            return shop, False
+        shop.img = name
+        return shop, True
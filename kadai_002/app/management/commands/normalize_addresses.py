@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app import areas, geo, prerender, shop_cache
+from app.models import Shop
+
+
+class Command(BaseCommand):
+    help = "既存の店舗の住所から都道府県・市区町村・区と緯度・経度を設定し直します（app/areas.py, app/geo.py）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--missing", action="store_true",
+                            help="都道府県か緯度・経度が未設定の店舗だけ処理する")
+
+    def handle(self, *args, **options):
+        fields = [*areas.AREA_FIELDS, *geo.LOCATION_FIELDS]
+        queryset = Shop.objects.order_by("pk")
+        if options["missing"]:
+            queryset = queryset.filter(Q(prefecture="") | Q(latitude__isnull=True))
+        started = time.perf_counter()
+        done = changed = 0
+        last_pk = 0
+        while True:
+            # 主キーの範囲で区切って読むので、件数が多くてもメモリは一定
+            batch = list(queryset.filter(pk__gt=last_pk).only("pk", "address", *fields)
+                         [:options["batch_size"]])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            updated = []
+            now = timezone.now()
+            for shop in batch:
+                before = [getattr(shop, name) for name in fields]
+                geo.apply(areas.apply(shop))
+                if [getattr(shop, name) for name in fields] != before:
+                    shop.updated_at = now
+                    updated.append(shop)
+            with transaction.atomic():
+                Shop.objects.bulk_update(updated, [*fields, "updated_at"])
+            # bulk_update では signals が動かないので、店舗のキャッシュと静的ページを消す
+            shop_cache.invalidate_many([shop.pk for shop in updated])
+            prerender.invalidate_shops(Shop.objects.filter(pk__in=[shop.pk for shop in updated]))
+            done += len(batch)
+            changed += len(updated)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{done} 件を確認し {changed} 件を更新しました（{time.perf_counter() - started:.1f} 秒）"
+        ))
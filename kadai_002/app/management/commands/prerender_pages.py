@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import prerender
+
+
+class Command(BaseCommand):
+    help = "未ログインの店舗一覧・店舗詳細の静的 HTML とサイトマップを、変わった分だけ書き出します（定期実行用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", dest="force",
+                            help="変わっていないページも描画し直す（テンプレートを変えたときなど）")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = prerender.build(force=options["force"], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f"描画 {stats['rendered']}・変更なし {stats['unchanged']}・削除 {stats['removed']}・"
+            f"失敗 {stats['failed']} ページ、サイトマップ {stats['sitemaps']} ファイルを更新しました"
+            f"（{prerender.root()}、{time.perf_counter() - started:.1f} 秒）"
+        ))
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import trending
+
+
+class Command(BaseCommand):
+    help = "直近のレビュー・予約・お気に入りから「いま人気」のスコアを計算し直します（定期実行用）"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = trending.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} 店舗のスコアを更新しました（{time.perf_counter() - started:.1f} 秒）"
+        ))
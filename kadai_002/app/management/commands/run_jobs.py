@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from app import jobs
+
+
+class Command(BaseCommand):
+    help = "バックグラウンドジョブのワーカーを起動します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=1,
+                            help="並列に動かすワーカースレッド数")
+        parser.add_argument("--batch-size", type=int,
+                            default=getattr(settings, "JOBS_BATCH_SIZE", 100),
+                            help="1 回に取得するジョブ数（同名ジョブはまとめて実行）")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="ジョブがないときの待機秒数")
+        parser.add_argument("--once", action="store_true",
+                            help="待機中のジョブを処理しきったら終了する")
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"放置されていたジョブ {requeued} 件を待機中に戻しました")
+
+        concurrency = max(1, options["concurrency"])
+        self.stdout.write(f"ワーカー起動: concurrency={concurrency}")
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(self.loop, f"{jobs.default_worker_id()}:{n}", options)
+                for n in range(concurrency)
+            ]
+            try:
+                total = sum(f.result() for f in futures)
+            except KeyboardInterrupt:
+                self.stop.set()
+                total = sum(f.result() for f in futures)
+        self.stdout.write(self.style.SUCCESS(f"{total} 件のジョブを処理しました"))
+
+    def loop(self, worker_id, options):
+        processed = 0
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                count = jobs.work_once(worker_id, options["batch_size"])
+                processed += count
+                if count:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        finally:
+            connection.close()
+        return processed
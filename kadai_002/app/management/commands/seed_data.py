@@ -0,0 +1,188 @@
+import datetime
+import random
+import time
+from contextlib import contextmanager
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from app import areas, geo, prerender, shop_cache, trending
+from app.models import Category, Company, Favorite, MemberProfile, Reservation, Review, Shop
+
+PREFECTURES = {
+    "東京都": ["渋谷区", "新宿区", "港区", "千代田区", "中央区", "世田谷区", "台東区"],
+    "大阪府": ["大阪市北区", "大阪市中央区", "堺市堺区"],
+    "神奈川県": ["横浜市中区", "横浜市西区", "川崎市川崎区"],
+    "愛知県": ["名古屋市中区", "名古屋市中村区"],
+    "福岡県": ["福岡市博多区", "福岡市中央区"],
+    "北海道": ["札幌市中央区", "札幌市北区"],
+}
+CATEGORY_NAMES = ["居酒屋", "カフェ", "ラーメン", "寿司", "焼肉", "イタリアン", "フレンチ", "中華",
+                  "和食", "カレー", "ベーカリー", "バー", "定食", "そば", "うどん", "天ぷら"]
+OPENING_HOURS = ["11:00-22:00", "17:00-23:00", "08:00-18:00", "11:30-15:00", "18:00-23:30"]
+REVIEW_TEXTS = ["おいしかった", "また来たい", "接客が丁寧", "少し待った", "コスパが良い", "雰囲気が良い"]
+BATCH_SIZE = 2000
+
+
+@contextmanager
+def without_auto_now(*fields):
+    """created_at を過去の日時にばらつかせるため、一時的に auto_now_add を外す"""
+    saved = [(f, f.auto_now_add) for f in fields]
+    for f, _ in saved:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, value in saved:
+            f.auto_now_add = value
+
+
+def zipf_weights(n, s):
+    """順位 k の重みが 1 / k^s になる累積重み（random.choices の cum_weights 用）"""
+    return list(accumulate(1 / (k ** s) for k in range(1, n + 1)))
+
+
+class Command(BaseCommand):
+    help = "ベンチマーク用のデータを一括で作成します（レビュー数などは Zipf 分布で偏らせる）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=16)
+        parser.add_argument("--shops", type=int, default=10_000)
+        parser.add_argument("--users", type=int, default=5_000)
+        parser.add_argument("--reviews", type=int, default=100_000)
+        parser.add_argument("--reservations", type=int, default=50_000)
+        parser.add_argument("--favorites", type=int, default=50_000)
+        parser.add_argument("--zipf", type=float, default=1.1,
+                            help="店舗の人気の偏り（大きいほど一部の店舗に集中）")
+        parser.add_argument("--seed", type=int, default=None, help="乱数のシード（再現用）")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        # 同じ DB に何度流してもユーザー名がぶつからないようにする
+        self.run_id = f"{self.rng.getrandbits(32):08x}"
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            self.seed_company()
+            categories = self.seed_categories(options["categories"])
+            shops = self.seed_shops(options["shops"], categories)
+            users = self.seed_users(options["users"])
+
+            # 人気の順位をランダムに割り当て、上位の店舗にレビューなどが集中するようにする
+            ranked = shops[:]
+            self.rng.shuffle(ranked)
+            self.popular = (ranked, zipf_weights(len(ranked), options["zipf"]))
+
+            self.seed_reviews(options["reviews"], users)
+            self.seed_reservations(options["reservations"], users)
+            self.seed_favorites(options["favorites"], users)
+            # bulk_create ではシグナルが動かないので、まとめて計算する
+            trending.refresh()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"作成完了（{time.perf_counter() - started:.1f} 秒）: "
+            f"カテゴリ {len(categories)}, 店舗 {len(shops)}, ユーザー {len(users)}"
+        ))
+
+    def pick_shops(self, k):
+        shops, cum_weights = self.popular
+        return self.rng.choices(shops, cum_weights=cum_weights, k=k)
+
+    def random_datetime(self, days):
+        return timezone.now() - datetime.timedelta(seconds=self.rng.randrange(days * 86400))
+
+    def seed_company(self):
+        # 会社概要ページは 1 件目の Company を表示する
+        if not Company.objects.exists():
+            Company.objects.create(name="NAGOYAMESHI株式会社", founded_year=2020,
+                                   description="飲食店レビュー・予約サービスの運営", headquarters="愛知県名古屋市中区")
+
+    def seed_categories(self, n):
+        names = [CATEGORY_NAMES[i] if i < len(CATEGORY_NAMES) else f"カテゴリ{i + 1}" for i in range(n)]
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        return list(Category.objects.filter(name__in=names).values_list("id", flat=True))
+
+    def seed_shops(self, n, categories):
+        rng = self.rng
+        shops = []
+        for i in range(n):
+            prefecture = rng.choice(list(PREFECTURES))
+            city = rng.choice(PREFECTURES[prefecture])
+            shops.append(Shop(
+                name=f"{rng.choice(CATEGORY_NAMES)}の店 {self.run_id}-{i}",
+                category_id=rng.choice(categories) if categories else None,
+                address=f"{prefecture}{city}{rng.randint(1, 5)}丁目{rng.randint(1, 30)}-{rng.randint(1, 20)}",
+                budget=rng.choice(Shop.Budget.values),
+                opening_hours=rng.choice(OPENING_HOURS),
+                price=rng.choice([500, 1000, 1500, 2000, 3000]),
+                detail="ベンチマーク用のダミー店舗です。",
+            ))
+            geo.apply(areas.apply(shops[-1]))
+        created = Shop.objects.bulk_create(shops, batch_size=BATCH_SIZE)
+        self.stdout.write(f"店舗 {len(created)} 件")
+        # 以前に同じ主キーで覚えた店舗（テストでロールバックされたものなど）を残さない
+        shop_cache.invalidate_many([shop.pk for shop in created])
+        prerender.invalidate_listings()  # 新しい店舗なので、店舗詳細のページはまだ無い
+        return [shop.pk for shop in created]
+
+    def seed_users(self, n):
+        # パスワードのハッシュ計算は重いので 1 回だけ行い使い回す
+        password = make_password("password")
+        users = User.objects.bulk_create(
+            [User(username=f"seed_{self.run_id}_{i}", email=f"seed_{self.run_id}_{i}@example.com",
+                  password=password) for i in range(n)],
+            batch_size=BATCH_SIZE,
+        )
+        # bulk_create では post_save（プロフィール作成）が動かないので、ここで作る
+        MemberProfile.objects.bulk_create(
+            [MemberProfile(user_id=user.pk, display_name=user.username) for user in users],
+            batch_size=BATCH_SIZE,
+        )
+        self.stdout.write(f"ユーザー {len(users)} 件")
+        return [user.pk for user in users]
+
+    def seed_reviews(self, n, users):
+        rng = self.rng
+        with without_auto_now(Review._meta.get_field("created_at")):
+            reviews = [
+                Review(shop_id=shop_id, user_id=rng.choice(users), content=rng.choice(REVIEW_TEXTS),
+                       rating=rng.randint(1, 5), created_at=self.random_datetime(365))
+                for shop_id in self.pick_shops(n)
+            ]
+            Review.objects.bulk_create(reviews, batch_size=BATCH_SIZE)
+        self.stdout.write(f"レビュー {n} 件")
+
+    def seed_reservations(self, n, users):
+        rng = self.rng
+        today = timezone.localdate()
+        with without_auto_now(Reservation._meta.get_field("created_at")):
+            reservations = [
+                Reservation(
+                    shop_id=shop_id, user_id=rng.choice(users),
+                    date=today + datetime.timedelta(days=rng.randint(-180, 60)),
+                    time=datetime.time(rng.randint(11, 21), rng.choice([0, 30])),
+                    num_people=rng.randint(1, 8), created_at=self.random_datetime(180),
+                )
+                for shop_id in self.pick_shops(n)
+            ]
+            # (shop, date, time, user) の重複は捨てる
+            Reservation.objects.bulk_create(reservations, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        self.stdout.write(f"予約 最大 {n} 件")
+
+    def seed_favorites(self, n, users):
+        rng = self.rng
+        favorites = [Favorite(user_id=rng.choice(users), shop_id=shop_id) for shop_id in self.pick_shops(n)]
+        Favorite.objects.bulk_create(favorites, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        # 非正規化した favorite_count を 1 回の UPDATE で合わせる
+        counts = (
+            Favorite.objects.filter(shop=OuterRef("pk")).order_by().values("shop")
+            .annotate(c=Count("id")).values("c")
+        )
+        Shop.objects.filter(pk__in=Favorite.objects.values("shop")).update(favorite_count=Subquery(counts))
+        self.stdout.write(f"お気に入り 最大 {n} 件")
@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app import routers
+
+
+def sqlite_path(name):
+    """'file:/path/db.sqlite3?mode=ro' のような URI からファイルパスを取り出す"""
+    name = str(name)
+    if name.startswith("file:"):
+        name = name[len("file:"):].split("?", 1)[0]
+    return name
+
+
+class Command(BaseCommand):
+    help = "default の SQLite データベースを読み取りレプリカのファイルへコピーします（ローカル検証用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0,
+                            help="指定した秒数ごとに繰り返しコピーする（0 なら 1 回だけ）")
+
+    def handle(self, *args, **options):
+        if settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("SQLite 以外ではデータベース側のレプリケーションを使ってください")
+        aliases = routers.replicas()
+        if not aliases:
+            raise CommandError("DATABASE_REPLICAS が空です（DB_REPLICAS=2 などで起動してください）")
+
+        while True:
+            for alias in aliases:
+                started = time.perf_counter()
+                self.copy(settings.DATABASES["default"]["NAME"], settings.DATABASES[alias]["NAME"])
+                self.stdout.write(f"{alias}: {time.perf_counter() - started:.2f} 秒")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def copy(self, source_name, replica_name):
+        # backup API は読み書き中でも一貫したコピーを取れる。
+        # レプリカ側は読み取り専用で開くので、WAL ではなく通常のジャーナルに戻しておく
+        source = sqlite3.connect(sqlite_path(source_name))
+        replica = sqlite3.connect(sqlite_path(replica_name))
+        try:
+            source.backup(replica)
+            replica.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            replica.close()
+            source.close()
@@ -0,0 +1,220 @@
+# app/metrics.py
+"""
+Prometheus 形式のメトリクス
+
+- リクエスト数・レイテンシのヒストグラム（URL 名・メソッド・ステータス別）
+- DB のクエリ数と時間（URL 名別）
+- キャッシュのヒット・ミス（settings.CACHES の InstrumentedLocMemCache）
+- 外部 HTTP（Stripe など）の 1 回ごとのレイテンシ（ホスト別）
+
+値はプロセスごとにメモリ上で数え、METRICS_FLUSH_INTERVAL 秒ごとに
+METRICS_DIR/<pid>-<起動時刻>.json へ書き出す（書き出しはバックグラウンドのスレッドで行い、
+リクエストの処理、特に ASGI のイベントループを止めない）。/metrics ではディレクトリ内の
+全プロセス分を合計して返すので、gunicorn などの複数ワーカーでも 1 つの値になる。
+ファイルは消さない（カウンターが減らないように）。デプロイ時にディレクトリごと消してよい。
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+# 名前: (種類, 説明)
+METRICS = {
+    "app_http_requests_total": ("counter", "処理したリクエスト数"),
+    "app_http_request_duration_seconds": ("histogram", "リクエストの処理時間"),
+    "app_db_queries_total": ("counter", "実行した SQL の数"),
+    "app_db_query_seconds_total": ("counter", "SQL の実行時間の合計"),
+    "app_cache_requests_total": ("counter", "キャッシュの参照数（result=hit/miss）"),
+    "app_external_http_duration_seconds": ("histogram", "外部 HTTP 呼び出しの時間（Stripe など）"),
+    "app_ratelimit_rejections_total": ("counter", "回数制限で断ったリクエスト数（app/ratelimit.py）"),
+}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """1 プロセス分の値"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (名前, ラベル) -> 値
+        self.histograms = {}  # (名前, ラベル) -> [各バケットの件数..., +Inf の件数, 合計, 件数]
+        self.started = int(time.time())
+        self.last_flush = 0.0
+        self.flushing = threading.Lock()  # 書き出し中のスレッドは 1 つだけ
+        self.flusher = None
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            row = self.histograms.get(key)
+            if row is None:
+                row = self.histograms[key] = [0] * (len(BUCKETS) + 3)
+            row[bisect.bisect_left(BUCKETS, value)] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, dict(labels), row[:]] for (name, labels), row in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """
+        METRICS_DIR に自分のプロセスの値を書き出す。
+        force=False（リクエストごと）は間隔が空いたときだけ、バックグラウンドのスレッドで書く。
+        """
+        directory = metrics_dir()
+        now = time.monotonic()
+        if directory is None or (not force and now - self.last_flush < flush_interval()):
+            return
+        self.last_flush = now
+        if force:
+            self._write(directory)
+        elif self.flushing.acquire(blocking=False):
+            self.flusher = threading.Thread(target=self._write_in_background, args=(directory,),
+                                            name="metrics-flush", daemon=True)
+            self.flusher.start()
+
+    def _write_in_background(self, directory):
+        try:
+            self._write(directory)
+        except OSError:
+            logger.warning("メトリクスを書き出せませんでした", exc_info=True)
+        finally:
+            self.flushing.release()
+
+    def _write(self, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}-{self.started}.json"
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+def metrics_dir():
+    value = getattr(settings, "METRICS_DIR", None)
+    return Path(value) if value else None
+
+
+def flush_interval():
+    return getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, labels, value)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, labels, value)
+
+
+def record_request(route, method, status, seconds, timings):
+    """MetricsMiddleware から 1 リクエストごとに呼ぶ"""
+    inc("app_http_requests_total", route=route, method=method, status=str(status))
+    observe("app_http_request_duration_seconds", seconds, route=route, status=str(status))
+    if timings.db_queries:
+        inc("app_db_queries_total", timings.db_queries, route=route)
+        inc("app_db_query_seconds_total", timings.db_ms / 1000, route=route)
+    for host, elapsed in timings.http_log:
+        observe("app_external_http_duration_seconds", elapsed, host=host)
+    registry.flush()
+
+
+def collect():
+    """全プロセス分を合計した snapshot（自分のプロセスは最新の値を使う）"""
+    snapshots = [registry.snapshot()]
+    directory = metrics_dir()
+    if directory is not None and directory.is_dir():
+        own = f"{os.getpid()}-{registry.started}.json"
+        for path in directory.glob("*.json"):
+            if path.name == own:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # 書き込み途中などは次回に回す
+                continue
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, row in snapshot["histograms"]:
+            key = (name, tuple(sorted(labels.items())))
+            total = histograms.setdefault(key, [0] * len(row))
+            for i, value in enumerate(row):
+                total[i] += value
+    return counters, histograms
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render():
+    """Prometheus のテキスト形式（version 0.0.4）"""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        else:
+            for (metric, labels), row in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, "+Inf"), row[:-2]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {row[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {row[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+_MISSING = object()
+
+
+class InstrumentedLocMemCache(LocMemCache):
+    """
+    ヒット・ミスを app_cache_requests_total に数える LocMemCache
+    （get_many なども内部で get を呼ぶので、ここだけで数えられる）
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.metrics_name = params.get("OPTIONS", {}).get("METRICS_NAME", name or "default")
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        inc("app_cache_requests_total", cache=self.metrics_name, result="miss" if value is _MISSING else "hit")
+        return default if value is _MISSING else value
@@ -0,0 +1,450 @@
+# app/middleware.py
+import cProfile
+import json
+import logging
+import mimetypes
+import random
+import re
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+from . import metrics, prerender, profiling, ratelimit, routers
+
+logger = logging.getLogger("app.profiling")
+
+# ManifestStaticFilesStorage が付けるハッシュ（例: style.1a2b3c4d5e6f.css）
+HASHED_STATIC_RE = re.compile(r"\.[0-9a-f]{12}\.[^/]+$")
+# 圧縮済みファイルの優先順
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def _is_immutable_static(path):
+    return bool(HASHED_STATIC_RE.search(path))
+
+
+def _is_immutable_media(path):
+    # app/images.py の派生画像は内容のハッシュ付きディレクトリに置かれる
+    derived = getattr(settings, "IMAGE_DERIVED_DIR", "derived")
+    return path.startswith(derived + "/")
+
+
+class HybridMiddleware:
+    """
+    同期（WSGI）・非同期（ASGI）のどちらのチェーンにも入れるミドルウェアの共通部分。
+    ASGI で非同期ビューの前後にスレッドの切り替えを挟まないように、非同期のときは
+    __acall__ を使う。process_view は I/O をしないので、非同期のときもそのまま呼ぶ。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            if hasattr(self, "process_view"):
+                process_view = self.process_view
+
+                async def aprocess_view(*args):
+                    return process_view(*args)
+
+                self.process_view = aprocess_view
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.call(request)
+
+
+class StaticServeMiddleware(HybridMiddleware):
+    """
+    STATIC_ROOT（collectstatic 済み）と MEDIA_ROOT のファイルを Django 自身で配信する。
+
+    - 内容のハッシュ付きファイルには immutable な長期キャッシュを付ける
+    - collectstatic で作った .br / .gz を Accept-Encoding に応じて返す
+    - If-None-Match（304）と単一の Range（206）に対応
+    - FileResponse を返すので、WSGI サーバーが wsgi.file_wrapper で
+      sendfile を使える場合はゼロコピーで送られる
+
+    PRERENDER_SERVE が True なら、prerender_pages で書き出した未ログイン向けのページと
+    サイトマップ（app/prerender.py）も PRERENDER_MAX_AGE 秒のキャッシュ付きで返す。
+
+    ファイルが無ければ次の処理に渡すので、開発時は runserver の配信がそのまま使える。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "STATIC_SERVE", True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.max_age = getattr(settings, "STATIC_SERVE_MAX_AGE", 3600)
+        self.roots = []
+        if settings.STATIC_ROOT and settings.STATIC_URL:
+            self.roots.append((settings.STATIC_URL, settings.STATIC_ROOT, _is_immutable_static))
+        if settings.MEDIA_ROOT and settings.MEDIA_URL:
+            self.roots.append((settings.MEDIA_URL, settings.MEDIA_ROOT, _is_immutable_media))
+        self.prerendered = getattr(settings, "PRERENDER_SERVE", False)
+        self.prerender_max_age = getattr(settings, "PRERENDER_MAX_AGE", 300)
+
+    def call(self, request):
+        response = self.serve_request(request)
+        return response if response is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        # ファイルの確認はブロックするので、配信対象のパスのときだけスレッドで行う
+        if (any(request.path.startswith(prefix) for prefix, _, _ in self.roots)
+                or (self.prerendered and prerender.file_for(request))):
+            response = await sync_to_async(self.serve_request)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve_request(self, request):
+        if request.method in ("GET", "HEAD"):
+            for prefix, root, is_immutable in self.roots:
+                if request.path.startswith(prefix):
+                    response = self.serve(request, root, request.path[len(prefix):], is_immutable)
+                    if response is not None:
+                        return response
+        if self.prerendered:
+            return self.serve_prerendered(request)
+        return None
+
+    def serve_prerendered(self, request):
+        name = prerender.file_for(request)
+        if name is None:
+            return None
+        response = self.serve(request, prerender.root(), name, lambda path: False, self.prerender_max_age)
+        if response is not None:
+            # ログインすると別のページになる
+            patch_vary_headers(response, ("Cookie",))
+            if response.get("Content-Type", "").startswith(("text/html", "application/xml", "text/xml")):
+                response.headers["Content-Type"] = response["Content-Type"].split(";")[0] + "; charset=utf-8"
+        return response
+
+    def serve(self, request, root, path, is_immutable, max_age=None):
+        path = unquote(path)
+        try:
+            fullpath = Path(safe_join(root, path))
+        except (SuspiciousFileOperation, ValueError):
+            return None
+        if not fullpath.is_file():
+            return None
+
+        encoding, served = self.negotiate(request, fullpath)
+        stat = served.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+
+        headers = {
+            "ETag": etag,
+            "Last-Modified": http_date(stat.st_mtime),
+            "Cache-Control": (
+                "public, max-age=31536000, immutable" if is_immutable(path)
+                else f"public, max-age={self.max_age if max_age is None else max_age}"
+            ),
+        }
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+            return self._finish(response, headers, fullpath)
+
+        content_type, _ = mimetypes.guess_type(fullpath.name)
+        content_type = content_type or "application/octet-stream"
+
+        # Range は圧縮していない本体に対してだけ扱う
+        range_header = request.headers.get("Range")
+        if range_header and encoding is None and self._if_range_matches(request, etag, headers):
+            response = self.serve_range(served, stat.st_size, range_header, content_type)
+            if response is not None:
+                return self._finish(response, headers, fullpath)
+
+        response = FileResponse(served.open("rb"), content_type=content_type, filename=fullpath.name)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Accept-Ranges"] = "bytes"
+        return self._finish(response, headers, fullpath)
+
+    def negotiate(self, request, fullpath):
+        accept = request.headers.get("Accept-Encoding", "")
+        for encoding, suffix in ENCODINGS:
+            if encoding in accept:
+                candidate = fullpath.with_name(fullpath.name + suffix)
+                if candidate.is_file():
+                    return encoding, candidate
+        return None, fullpath
+
+    def _if_range_matches(self, request, etag, headers):
+        if_range = request.headers.get("If-Range")
+        return not if_range or if_range in (etag, headers["Last-Modified"])
+
+    def serve_range(self, path, size, range_header, content_type):
+        match = RANGE_RE.match(range_header.strip())
+        if not match:
+            # 複数範囲などは扱わず全体を返す
+            return None
+        start, end = match.groups()
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        elif end:
+            # bytes=-N は末尾 N バイト
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            return None
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+
+        def chunks():
+            with path.open("rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = f.read(min(CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+        response = StreamingHttpResponse(chunks(), status=206, content_type=content_type)
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response.headers["Content-Length"] = str(end - start + 1)
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
+
+    def _finish(self, response, headers, fullpath):
+        for key, value in headers.items():
+            response.headers[key] = value
+        if any(fullpath.with_name(fullpath.name + suffix).is_file() for _, suffix in ENCODINGS):
+            patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    app/routers.py のルーティング状態をリクエストごとに用意する。
+
+    GET/HEAD 以外のリクエストと、直近に書き込みをしたブラウザ（Cookie で判定）は
+    プライマリを読む。閲覧系ビュー（use_replica）以外もプライマリを読む。
+    """
+    cookie_name = "db_primary_until"
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sticky_seconds = getattr(settings, "REPLICA_STICKY_SECONDS", 5)
+
+    def call(self, request):
+        if not routers.replicas():
+            return self.get_response(request)
+        state, token = self._begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        # 状態は contextvar なので、sync_to_async で動く ORM からも見える
+        if not routers.replicas():
+            return await self.get_response(request)
+        state, token = self._begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self._finish(state, response)
+
+    def _begin(self, request):
+        pinned = request.method not in ("GET", "HEAD", "OPTIONS") or self._is_sticky(request)
+        return routers.begin_request(pinned=pinned)
+
+    def _finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                self.cookie_name,
+                str(int(time.time() + self.sticky_seconds)),
+                max_age=self.sticky_seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        routers.allow_replica(
+            getattr(view_func, "use_replica", False) or getattr(view_class, "use_replica", False)
+        )
+
+    def _is_sticky(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class ProfilingMiddleware:
+    """
+    リクエストごとの処理時間の内訳（DB・テンプレート・外部 HTTP、app/profiling.py）を
+    Server-Timing ヘッダーとログ（logger "app.profiling"、1 行 1 JSON）に出す。
+
+    PROFILING_SAMPLE_RATE の割合のリクエストは cProfile を取り、PROFILING_SLOW_MS を
+    超えたものだけ PROFILING_DIR に .prof で保存する（新しい PROFILING_KEEP 件を残す）。
+    保存したファイルは `python -m pstats <file>` や snakeviz で見る。
+
+    PROFILING_ENABLED = False のときはミドルウェア自体を外すので負荷はかからない。
+    cProfile はスレッド単位なので同期専用（ASGI で有効にするとここでスレッドを切り替える）。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "PROFILING_SLOW_MS", 500)
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+        self.directory = Path(getattr(settings, "PROFILING_DIR", settings.BASE_DIR / "profiles"))
+        self.keep = getattr(settings, "PROFILING_KEEP", 50)
+        self.header = getattr(settings, "PROFILING_SERVER_TIMING", True)
+
+    def __call__(self, request):
+        profiler = self._start_profiler() if random.random() < self.sample_rate else None
+        try:
+            with profiling.measure() as timings:
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        total_ms = timings.total_ms
+
+        if self.header:
+            response.headers["Server-Timing"] = profiling.server_timing(timings, total_ms)
+        slow = total_ms >= self.slow_ms
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": getattr(request.resolver_match, "view_name", None),
+            "status": response.status_code,
+            "total_ms": round(total_ms, 1),
+            "db_ms": round(timings.db_ms, 1),
+            "db_queries": timings.db_queries,
+            "template_ms": round(timings.template_ms, 1),
+            "http_ms": round(timings.http_ms, 1),
+            "http_calls": timings.http_calls,
+        }
+        if profiler is not None and slow:
+            record["profile"] = self._save_profile(profiler, request, total_ms)
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(record, ensure_ascii=False))
+        return response
+
+    def _start_profiler(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 別のスレッドで cProfile が動いている（Python 3.12 以降は同時に 1 つだけ）
+            return None
+        return profiler
+
+    def _save_profile(self, profiler, request, total_ms):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^0-9A-Za-z]+", "_", request.path).strip("_")[:60] or "root"
+        path = self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{int(total_ms)}ms.prof"
+        profiler.dump_stats(path)
+        self._rotate()
+        return path.name
+
+    def _rotate(self):
+        files = sorted(self.directory.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in files[self.keep:]:
+            old.unlink(missing_ok=True)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    URL 名ごとのリクエスト数・レイテンシ・クエリ数などを app/metrics.py に数える。
+    URL 名の無いリクエスト（404 など）は route="unmatched" にまとめる。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def call(self, request):
+        started = time.perf_counter()
+        with profiling.measure() as timings:
+            response = self.get_response(request)
+        return self._record(request, response, started, timings)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with profiling.measure() as timings:
+            response = await self.get_response(request)
+        return self._record(request, response, started, timings)
+
+    def _record(self, request, response, started, timings):
+        match = request.resolver_match
+        route = match.view_name if match and match.url_name else "unmatched"
+        metrics.record_request(route, request.method, response.status_code, time.perf_counter() - started, timings)
+        return response
+
+
+class RateLimitMiddleware(HybridMiddleware):
+    """
+    settings.RATELIMITS にある URL 名への RATELIMIT_METHODS のリクエストを数え、
+    上限を超えたら 429 を返す（app/ratelimit.py）。process_view で判定するので、
+    ビュー・CSRF の検証より前に断る。
+    "user" の判定は request.user（セッションとユーザーの読み込み）を見るので、
+    非同期のときは対象の URL だけスレッドで判定する。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "RATELIMIT_ENABLED", True) or not getattr(settings, "RATELIMITS", None):
+            raise MiddlewareNotUsed
+        self.methods = set(getattr(settings, "RATELIMIT_METHODS", ["POST"]))
+        self.names = set(settings.RATELIMITS)
+        super().__init__(get_response)
+        if self.is_async:
+            self.process_view = self.aprocess_view
+
+    def call(self, request):
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self._applies(request):
+            return None
+        return self._limit(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if not self._applies(request):
+            return None
+        return await sync_to_async(self._limit)(request)
+
+    def _applies(self, request):
+        return request.method in self.methods and request.resolver_match.url_name in self.names
+
+    def _limit(self, request):
+        limited = ratelimit.check(request, request.resolver_match.url_name)
+        if limited is None:
+            return None
+        rule, retry_after = limited
+        metrics.inc("app_ratelimit_rejections_total", route=rule.name, scope=rule.scope)
+        response = HttpResponse(
+            "リクエストが多すぎます。しばらく待ってからやり直してください。\n",
+            status=429, content_type="text/plain; charset=utf-8",
+        )
+        response["Retry-After"] = str(retry_after)
+        return response
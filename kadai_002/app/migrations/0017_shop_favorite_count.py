@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def backfill_favorite_count(apps, schema_editor):
+    Shop = apps.get_model('app', 'Shop')
+    Favorite = apps.get_model('app', 'Favorite')
+    counts = (
+        Favorite.objects.filter(shop=OuterRef('pk'))
+        .order_by()
+        .values('shop')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    Shop.objects.filter(pk__in=Favorite.objects.values('shop')).update(
+        favorite_count=Subquery(counts)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='お気に入り数'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['-favorite_count', 'id'], name='app_shop_favorite_count_idx'),
+        ),
+        migrations.RunPython(backfill_favorite_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_shop_favorite_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='派生画像'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='派生画像'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_img_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='img_color',
+            field=models.CharField(blank=True, editable=False, max_length=7, verbose_name='画像の代表色'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='img_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='画像の高さ'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='img_placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='プレビュー画像(data URI)'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='img_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='画像の幅'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='img_color',
+            field=models.CharField(blank=True, editable=False, max_length=7, verbose_name='画像の代表色'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='img_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='画像の高さ'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='img_placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='プレビュー画像(data URI)'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='img_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='画像の幅'),
+        ),
+    ]
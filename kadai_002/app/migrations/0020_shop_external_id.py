@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_img_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='外部ID'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_shop_external_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='memberprofile',
+            index=models.Index(fields=['display_name'], name='app_memberp_display_d401ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memberprofile',
+            index=models.Index(fields=['birth_date'], name='app_memberp_birth_d_55a4af_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date'], name='app_reserva_date_32d8be_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='app_review_created_fab46b_idx'),
+        ),
+    ]
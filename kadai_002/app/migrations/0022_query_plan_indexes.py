@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', '-date', '-time'], name='app_reserva_user_id_554d3d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['shop', '-created_at'], name='app_review_shop_id_180558_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['category', '-favorite_count'], name='app_shop_categor_a4b8c8_idx'),
+        ),
+    ]
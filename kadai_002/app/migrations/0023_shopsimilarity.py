@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='順位')),
+                ('score', models.FloatField(verbose_name='類似度')),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='計算日時')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='app.shop')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_in', to='app.shop')),
+            ],
+            options={
+                'verbose_name': '似ている店舗',
+                'verbose_name_plural': '似ている店舗',
+                'unique_together': {('shop', 'rank')},
+            },
+        ),
+    ]
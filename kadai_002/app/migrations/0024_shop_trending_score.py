@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_shopsimilarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='トレンドスコア'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['-trending_score', 'id'], name='app_shop_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['category', '-trending_score'], name='app_shop_categor_028c42_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_shop_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='city',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='市区町村'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='prefecture',
+            field=models.CharField(blank=True, editable=False, max_length=4, verbose_name='都道府県'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='ward',
+            field=models.CharField(blank=True, editable=False, max_length=20, verbose_name='区'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['prefecture'], name='app_shop_prefect_7a2996_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['prefecture', 'city'], name='app_shop_prefect_87a2f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['prefecture', 'city', 'ward'], name='app_shop_prefect_c29260_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_shop_area'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, editable=False, null=True, verbose_name='格子セル'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='緯度'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='経度'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['geo_cell', 'latitude', 'longitude'], name='app_shop_geo_cel_c8c5a2_idx'),
+        ),
+    ]
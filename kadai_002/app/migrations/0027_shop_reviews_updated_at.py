@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_shop_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='reviews_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='レビュー更新日時'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    # WAL はファイルに記録される設定なので、接続ごとではなく 1 回だけ切り替える
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class Migration(migrations.Migration):
+    # journal_mode はトランザクションの中では変えられない
+    atomic = False
+
+    dependencies = [
+        ('app', '0027_shop_reviews_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, migrations.RunPython.noop),
+    ]
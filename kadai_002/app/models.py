@@ -2,12 +2,20 @@ from django.db import models
 from django.core.validators import MinLengthValidator
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 class Category(models.Model):
     """店舗のカテゴリー（例：居酒屋、カフェ、レストランなど）。
     将来的にカテゴリーを追加・編集したい場合は別テーブルにしておくと便利。"""
     name = models.CharField("カテゴリ名", max_length=50, unique=True)
     img = models.ImageField(blank=True, default='noImage.png')
+    # 縮小・WebP 変換した派生画像（app/images.py が生成）
+    img_variants = models.JSONField("派生画像", default=dict, blank=True, editable=False)
+    # アップロード時に計算するプレースホルダー（app/images.py の set_placeholder）
+    img_width = models.PositiveIntegerField("画像の幅", null=True, blank=True, editable=False)
+    img_height = models.PositiveIntegerField("画像の高さ", null=True, blank=True, editable=False)
+    img_color = models.CharField("画像の代表色", max_length=7, blank=True, editable=False)
+    img_placeholder = models.TextField("プレビュー画像(data URI)", blank=True, editable=False)
 
     class Meta:
         verbose_name = "カテゴリ"
@@ -35,6 +43,8 @@ class Shop(models.Model):
         HIGH = "HIGH", "3,000円〜"
 
     name = models.CharField("店舗名", max_length=200, validators=[MinLengthValidator(1)])
+    # 取り込み元（提携先カタログなど）の店舗 ID。import_shops の upsert のキー
+    external_id = models.CharField("外部ID", max_length=100, unique=True, null=True, blank=True)
     category = models.ForeignKey(
         Category,
         verbose_name="カテゴリ",
@@ -44,7 +54,20 @@ class Shop(models.Model):
         related_name="shops",
     )
     img = models.ImageField(blank=True, default='noImage.png')
+    img_variants = models.JSONField("派生画像", default=dict, blank=True, editable=False)
+    img_width = models.PositiveIntegerField("画像の幅", null=True, blank=True, editable=False)
+    img_height = models.PositiveIntegerField("画像の高さ", null=True, blank=True, editable=False)
+    img_color = models.CharField("画像の代表色", max_length=7, blank=True, editable=False)
+    img_placeholder = models.TextField("プレビュー画像(data URI)", blank=True, editable=False)
     address = models.CharField("住所", max_length=300, blank=True)
+    # address から取り出したエリア（app/areas.py。保存時に設定される）
+    prefecture = models.CharField("都道府県", max_length=4, blank=True, editable=False)
+    city = models.CharField("市区町村", max_length=50, blank=True, editable=False)
+    ward = models.CharField("区", max_length=20, blank=True, editable=False)
+    # 住所から決めた位置と格子のセル番号（app/geo.py）
+    latitude = models.FloatField("緯度", null=True, blank=True, editable=False)
+    longitude = models.FloatField("経度", null=True, blank=True, editable=False)
+    geo_cell = models.IntegerField("格子セル", null=True, blank=True, editable=False)
     budget = models.CharField(
         "予算",
         max_length=4,
@@ -70,13 +93,35 @@ class Shop(models.Model):
 
     price = models.IntegerField("予約料金（円）", default=1000)
 
+    # お気に入り数（Favorite の追加・削除時に F() で増減する非正規化カラム。削除は signals の post_delete）
+    favorite_count = models.PositiveIntegerField("お気に入り数", default=0)
+    # 時間で減衰する人気度（app/trending.py。レビュー・予約・お気に入りで加算）
+    trending_score = models.FloatField("トレンドスコア", default=0, editable=False)
+
     created_at = models.DateTimeField("作成日時", auto_now_add=True)
     updated_at = models.DateTimeField("更新日時", auto_now=True)
+    # レビューの投稿・編集・削除の日時（静的ページの再生成の判定に使う。app/prerender.py）
+    reviews_updated_at = models.DateTimeField("レビュー更新日時", null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "店舗"
         verbose_name_plural = "店舗"
-        indexes = [models.Index(fields=["name"]), models.Index(fields=["address"])]
+        indexes = [
+            models.Index(fields=["name"]),
+            models.Index(fields=["address"]),
+            models.Index(fields=["-favorite_count", "id"], name="app_shop_favorite_count_idx"),
+            # カテゴリで絞り込んだお気に入り順（explain_queries の指摘）
+            models.Index(fields=["category", "-favorite_count"]),
+            # いま人気の順（app/trending.py）
+            models.Index(fields=["-trending_score", "id"], name="app_shop_trending_idx"),
+            models.Index(fields=["category", "-trending_score"]),
+            # エリアで絞り込み・件数の集計（app/areas.py）
+            models.Index(fields=["prefecture"]),
+            models.Index(fields=["prefecture", "city"]),
+            models.Index(fields=["prefecture", "city", "ward"]),
+            # 近くのお店の候補（本体を読まずに距離まで計算できる）
+            models.Index(fields=["geo_cell", "latitude", "longitude"]),
+        ]
 
     def __str__(self):
         return self.name
@@ -93,6 +138,10 @@ class Review(models.Model):
 
     class Meta:
         ordering = ["-created_at"]  # 新しい順
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["shop", "-created_at"]),  # 店舗詳細のレビュー一覧
+        ]
 
 class Reservation(models.Model):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='reservations')
@@ -104,6 +153,10 @@ class Reservation(models.Model):
 
     class Meta:
         unique_together = ('shop', 'date', 'time', 'user')  # 同一ユーザーが同時刻に二重予約できないようにする
+        indexes = [
+            models.Index(fields=["date"]),
+            models.Index(fields=["user", "-date", "-time"]),  # 予約一覧（新しい順）
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.shop.name} ({self.date} {self.time})"
@@ -126,6 +179,10 @@ class MemberProfile(models.Model):
      # ← Stripe顧客IDを追加
     stripe_customer_id = models.CharField(max_length=255, null=True, blank=True)
 
+    class Meta:
+        # 管理画面の前方一致検索と日付での絞り込み用
+        indexes = [models.Index(fields=["display_name"]), models.Index(fields=["birth_date"])]
+
     def __str__(self):
         return self.display_name
     
@@ -140,4 +197,61 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f"{self.user.username} → {self.shop.name}"
-    
\ No newline at end of file
+    
+
+#バックグラウンドジョブ
+class Job(models.Model):
+    """
+    DB に保存するバックグラウンドジョブ（app/jobs.py 参照）
+    - name: 登録済みハンドラ名（例: "app.send_email"）
+    - payload: ハンドラに渡す引数（JSON）
+    - run_at: この時刻以降に実行する（リトライ時はバックオフ分だけ先送り）
+    """
+    class Status(models.TextChoices):
+        QUEUED = "queued", "待機中"
+        RUNNING = "running", "実行中"
+        DONE = "done", "完了"
+        FAILED = "failed", "失敗"
+
+    name = models.CharField("ジョブ名", max_length=100)
+    payload = models.JSONField("引数", default=dict, blank=True)
+    status = models.CharField(
+        "状態",
+        max_length=10,
+        choices=Status.choices,
+        default=Status.QUEUED,
+    )
+    attempts = models.PositiveIntegerField("試行回数", default=0)
+    max_attempts = models.PositiveIntegerField("最大試行回数", default=5)
+    run_at = models.DateTimeField("実行予定日時", default=timezone.now)
+    locked_by = models.CharField("実行ワーカー", max_length=100, blank=True)
+    locked_at = models.DateTimeField("取得日時", null=True, blank=True)
+    last_error = models.TextField("最後のエラー", blank=True)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "ジョブ"
+        verbose_name_plural = "ジョブ"
+        # ワーカーは status=queued かつ run_at <= now を古い順に取り出す
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+#似ている店舗（python manage.py compute_similar_shops が作る。app/recommendations.py 参照）
+class ShopSimilarity(models.Model):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="similarities")
+    similar = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="recommended_in")
+    rank = models.PositiveSmallIntegerField("順位")  # 1 が最も似ている
+    score = models.FloatField("類似度")
+    computed_at = models.DateTimeField("計算日時", default=timezone.now)
+
+    class Meta:
+        verbose_name = "似ている店舗"
+        verbose_name_plural = "似ている店舗"
+        # 店舗詳細は shop で絞って rank 順に読むだけ（このインデックス 1 本で足りる）
+        unique_together = ('shop', 'rank')
+
+    def __str__(self):
+        return f"{self.shop_id} → {self.similar_id} ({self.score:.3f})"
@@ -0,0 +1,347 @@
+# app/prerender.py
+"""
+未ログインで見るページの静的 HTML とサイトマップ（クローラー・CDN 向け）
+
+python manage.py prerender_pages で、未ログインの店舗一覧（トップとカテゴリごと）と
+すべての店舗詳細を settings.PRERENDER_ROOT に書き出す。
+
+    index.html                  /
+    category/<id>/index.html    /?category_id=<id>
+    shop/<pk>/index.html        /shop/<pk>/
+    sitemap.xml                 サイトマップのインデックス
+    sitemaps/pages.xml          トップとカテゴリ
+    sitemaps/shops-0001.xml     店舗詳細（SITEMAP_SHARD_SIZE 件ずつ）
+
+- 差分だけ作り直す: ページごとの状態を manifest.json に残し、店舗詳細は
+  updated_at と reviews_updated_at（レビューの投稿・編集・削除で更新）、
+  一覧は店舗数・最終更新・いま人気の店舗が変わったものだけを描画する
+- 描画は WSGIHandler にそのまま渡す（ミドルウェア・テンプレートは通常と同じ）
+- ファイルは一時ファイルに書いてから置き換え、.gz / .br も横に作る（app/storage.py）
+- 中身が変わらないファイルは書き直さない（mtime と ETag が変わらないので CDN の 304 が効く）
+
+CDN や Web サーバーは上の対応でファイルを返し、Django にも来た場合は
+StaticServeMiddleware が未ログイン（セッション Cookie 無し）の GET に返す。
+店舗やレビューが変わると signals で該当ページのファイルを消すので、次に作り直すまでは
+Django が描画する（古いページは返さない）。signals が動かない QuerySet.update() /
+bulk_* で店舗を変えるところ（管理画面の料金変更・import_shops など）は、
+shop_cache と同じく invalidate_shops() / invalidate_object() を呼び、updated_at も更新する。
+一覧のファイルは LISTING_FIELDS（一覧に出る列）が変わったときだけ消す（listings=False で残す）。
+料金・お気に入り数・レビューは一覧に出ないので、店舗詳細のファイルだけを消す
+（一覧の「いま人気」の入れ替わりは、次の build が状態の違いから作り直す）。
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from . import trending
+from .models import Category, Shop
+from .storage import compress_file
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.html"
+# 一覧（トップ・カテゴリ）のカードとエリアの絞り込みに出る Shop の列
+LISTING_FIELDS = (
+    "name", "category_id", "address", "budget", "prefecture", "city", "ward",
+    "img", "img_variants", "img_width", "img_height", "img_color", "img_placeholder",
+)
+MANIFEST = "manifest.json"
+SITEMAP_INDEX = "sitemap.xml"
+SITEMAP_DIR = "sitemaps"
+# 描画のためのリクエストに付けるヘッダー（書き出し済みのファイルを返さずに描画させる）
+BYPASS_HEADER = "HTTP_X_PRERENDER"
+SHOP_PATH_RE = re.compile(r"^/shop/(\d+)/$")
+SITEMAP_PATH_RE = re.compile(rf"^/(?:{re.escape(SITEMAP_INDEX)}|{SITEMAP_DIR}/[\w-]+\.xml)$")
+CATEGORY_QUERY_RE = re.compile(r"^category_id=(\d+)$")
+SAVE_EVERY = 1000  # 途中で止まっても描画済みの分を無駄にしないよう、何件ごとに manifest を保存するか
+
+
+def root():
+    return Path(getattr(settings, "PRERENDER_ROOT", Path(settings.BASE_DIR) / "prerendered"))
+
+
+def base_url():
+    return getattr(settings, "PRERENDER_BASE_URL", "http://localhost:8000").rstrip("/")
+
+
+def shard_size():
+    # サイトマップ 1 ファイルの上限は 50,000 URL
+    return min(getattr(settings, "SITEMAP_SHARD_SIZE", 50000), 50000)
+
+
+def category_file(category_id):
+    return f"category/{category_id}/index.html"
+
+
+def shop_file(shop_id):
+    return f"shop/{shop_id}/index.html"
+
+
+def file_for(request):
+    """request に返せる書き出し済みファイルの PRERENDER_ROOT からの相対パス（無ければ None。I/O はしない）"""
+    if request.method not in ("GET", "HEAD") or BYPASS_HEADER in request.META:
+        return None
+    if SITEMAP_PATH_RE.match(request.path):
+        return request.path[1:]
+    # ログイン中（セッションがある）なら通常どおり描画する
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+    query = request.META.get("QUERY_STRING", "")
+    if request.path == "/":
+        if not query:
+            return INDEX_FILE
+        match = CATEGORY_QUERY_RE.match(query)
+        return category_file(match.group(1)) if match else None
+    match = SHOP_PATH_RE.match(request.path)
+    if match and not query:
+        return shop_file(match.group(1))
+    return None
+
+
+def listing_values(shop):
+    """shop の LISTING_FIELDS の値（遅延読み込みの列は None。読み込みはしない）"""
+    values = {}
+    for name in LISTING_FIELDS:
+        value = shop.__dict__.get(name)
+        values[name] = getattr(value, "name", value)  # 画像は FieldFile
+    return values
+
+
+def invalidate(shop_id=None, category_id=None, listings=True):
+    """
+    店舗詳細と、その店舗が載る一覧のファイルを消す（次に作り直すまでは Django が描画する）。
+    一覧に出ない列だけを変えたときは listings=False にして一覧を残す
+    """
+    names = []
+    if shop_id is not None:
+        names.append(shop_file(shop_id))
+    if listings:
+        names.append(INDEX_FILE)
+        if category_id is not None:
+            names.append(category_file(category_id))
+    for name in names:
+        _remove(root() / name)
+
+
+def invalidate_shops(shops, listings=True):
+    """update() / bulk_* で変えた店舗（Shop の QuerySet）のページと、それが載る一覧のファイルを消す"""
+    base = root()
+    if listings:
+        _remove(base / INDEX_FILE)
+    categories = set()
+    for shop_id, category_id in shops.order_by().values_list("pk", "category_id").iterator(chunk_size=5000):
+        _remove(base / shop_file(shop_id))
+        categories.add(category_id)
+    if listings:
+        for category_id in categories - {None}:
+            _remove(base / category_file(category_id))
+
+
+def invalidate_listings():
+    """一覧（トップとすべてのカテゴリ）のファイルを消す（カテゴリの一覧はどの一覧にも出る）"""
+    base = root()
+    _remove(base / INDEX_FILE)
+    for path in base.glob(category_file("*")):
+        _remove(path)
+
+
+def invalidate_object(instance):
+    """update() で列を変えた Shop か Category（その店舗すべてと一覧）のファイルを消す"""
+    if isinstance(instance, Shop):
+        invalidate(instance.pk, instance.category_id)
+    elif isinstance(instance, Category):
+        invalidate_listings()
+        invalidate_shops(Shop.objects.filter(category=instance))
+
+
+def _remove(path, suffixes=("", ".gz", ".br")):
+    for suffix in suffixes:
+        try:
+            path.with_name(path.name + suffix).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _write(path, data, compress=True):
+    """中身が変わったときだけ一時ファイル経由で置き換え、圧縮版も作り直す。書いたら True"""
+    if path.is_file() and path.read_bytes() == data:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+    # 圧縮しても小さくならないと作られないので、古い圧縮版は先に消す
+    _remove(path, (".gz", ".br"))
+    if compress:
+        compress_file(str(path))
+    return True
+
+
+class Renderer:
+    """未ログインのリクエストを WSGIHandler に渡して HTML を得る"""
+
+    def __init__(self):
+        # signals・ミドルウェアは invalidate / file_for だけを使うので、起動時には読み込まない
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.test import RequestFactory
+
+        self.handler = WSGIHandler()
+        self.factory = RequestFactory(HTTP_HOST=urlsplit(base_url()).netloc, **{BYPASS_HEADER: "1"})
+
+    def get(self, path, query=None):
+        environ = self.factory.get(path, query or {}).environ
+        statuses = []
+        response = self.handler(environ, lambda status, headers, exc_info=None: statuses.append(int(status.split()[0])))
+        try:
+            body = b"".join(response)
+        finally:
+            response.close()
+        return statuses[0], body
+
+
+def load_manifest():
+    path = root() / MANIFEST
+    if not path.exists():
+        return {"pages": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(manifest):
+    _write(root() / MANIFEST, json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode("utf-8"), compress=False)
+
+
+def shop_states():
+    """[(店舗 ID, lastmod), ...]（ID 順。lastmod は店舗かレビューが最後に変わった日時）"""
+    rows = Shop.objects.order_by("id").values_list("id", "updated_at", "reviews_updated_at")
+    return [
+        (shop_id, max(updated_at, reviews_updated_at or updated_at))
+        for shop_id, updated_at, reviews_updated_at in rows.iterator(chunk_size=5000)
+    ]
+
+
+def listing_states():
+    """{ファイル: (パスとクエリ, lastmod, 状態)}。状態は店舗数・最終更新・いま人気の店舗"""
+    def state(count, lastmod, category_id):
+        top = [shop.pk for shop in trending.top_shops(category_id)]
+        return f"{count}:{lastmod.isoformat() if lastmod else ''}:{','.join(map(str, top))}"
+
+    shop_list = reverse("shop_list")
+    total = Shop.objects.aggregate(count=Count("id"), lastmod=Max("updated_at"))
+    listings = {INDEX_FILE: ((shop_list, None), total["lastmod"], state(total["count"], total["lastmod"], None))}
+    categories = (
+        Category.objects.order_by("id")
+        .annotate(count=Count("shops"), lastmod=Max("shops__updated_at"))
+        .values_list("id", "count", "lastmod")
+    )
+    for category_id, count, lastmod in categories:
+        listings[category_file(category_id)] = (
+            (shop_list, {"category_id": category_id}), lastmod, state(count, lastmod, category_id),
+        )
+    return listings
+
+
+def build(force=False, stdout=None):
+    """
+    変わったページだけ（force なら全ページ）を描画し、サイトマップを作り直す。
+    {"rendered": 描画した数, "unchanged": 飛ばした数, "removed": 消した数, "failed": 失敗した数, "sitemaps": 書き直した数}
+    """
+    manifest = load_manifest()  # force でも、削除された店舗のファイルを消すために読む
+    pages = manifest.setdefault("pages", {})
+    renderer = Renderer()
+    stats = {"rendered": 0, "unchanged": 0, "removed": 0, "failed": 0, "sitemaps": 0}
+    base = root()
+
+    def render(name, path, query, state):
+        if not force and pages.get(name) == state and (base / name).is_file():
+            stats["unchanged"] += 1
+            return
+        status, body = renderer.get(path, query)
+        if status != 200:
+            logger.warning("静的ページを作れませんでした: %s（%s）", path, status)
+            stats["failed"] += 1
+            pages.pop(name, None)
+            _remove(base / name)
+            return
+        _write(base / name, body)
+        pages[name] = state
+        stats["rendered"] += 1
+        if stats["rendered"] % SAVE_EVERY == 0:
+            save_manifest(manifest)
+            if stdout:
+                stdout.write(f"  {stats['rendered']} ページ描画しました")
+
+    listings = listing_states()
+    for name, ((path, query), _, state) in listings.items():
+        render(name, path, query, state)
+
+    shops = shop_states()
+    for shop_id, lastmod in shops:
+        render(shop_file(shop_id), reverse("shop_detail", args=[shop_id]), None, lastmod.isoformat())
+
+    # 削除された店舗・カテゴリのページ
+    current = {*listings, *(shop_file(shop_id) for shop_id, _ in shops)}
+    for name in [name for name in pages if name not in current]:
+        _remove(base / name)
+        try:
+            (base / name).parent.rmdir()
+        except OSError:  # 空でない
+            pass
+        del pages[name]
+        stats["removed"] += 1
+
+    stats["sitemaps"] = write_sitemaps(listings, shops)
+    save_manifest(manifest)
+    return stats
+
+
+def _urlset(entries):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for loc, lastmod in entries:
+        lastmod = f"<lastmod>{lastmod.isoformat()}</lastmod>" if lastmod else ""
+        lines.append(f"<url><loc>{escape(loc)}</loc>{lastmod}</url>")
+    lines.append("</urlset>")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def write_sitemaps(listings, shops):
+    """サイトマップ（インデックスと分割したファイル）を書き、中身が変わったファイルの数を返す"""
+    base, url = root(), base_url()
+    sitemaps = []  # [(ファイル, lastmod, 中身)]
+
+    entries = []
+    for (path, query), lastmod, _ in listings.values():
+        entries.append((url + path + (f"?category_id={query['category_id']}" if query else ""), lastmod))
+    sitemaps.append((f"{SITEMAP_DIR}/pages.xml", max((m for _, m in entries if m), default=None), _urlset(entries)))
+
+    size = shard_size()
+    for number, start in enumerate(range(0, len(shops), size), start=1):
+        chunk = shops[start:start + size]
+        entries = [(url + reverse("shop_detail", args=[shop_id]), lastmod) for shop_id, lastmod in chunk]
+        sitemaps.append((f"{SITEMAP_DIR}/shops-{number:04d}.xml", max(m for _, m in entries), _urlset(entries)))
+
+    written = sum(_write(base / name, body) for name, _, body in sitemaps)
+
+    # 店舗が減って要らなくなった分割ファイル
+    names = {name for name, _, _ in sitemaps}
+    for path in (base / SITEMAP_DIR).glob("*.xml"):
+        if f"{SITEMAP_DIR}/{path.name}" not in names:
+            _remove(path)
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for name, lastmod, _ in sitemaps:
+        lastmod = f"<lastmod>{lastmod.isoformat()}</lastmod>" if lastmod else ""
+        lines.append(f"<sitemap><loc>{escape(url)}/{name}</loc>{lastmod}</sitemap>")
+    lines.append("</sitemapindex>")
+    written += _write(base / SITEMAP_INDEX, ("\n".join(lines) + "\n").encode("utf-8"))
+    return written
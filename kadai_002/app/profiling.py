@@ -0,0 +1,162 @@
+# app/profiling.py
+"""
+リクエストごとの処理時間の内訳（ProfilingMiddleware から使う）
+
+- db: 実行した SQL の時間と件数（connection.execute_wrapper。非同期ビューの ORM は
+  別スレッドの接続で動くので、接続ができたときに各接続へ差し込んでおく）
+- tpl: テンプレートの描画時間（入れ子の include などは外側の 1 回として数える）。
+  テンプレート内で評価された QuerySet の SQL 時間も含む
+- http: 外部 HTTP（Stripe など）の時間。http.client を使うものはすべて含む
+
+計測中のリクエストの状態は contextvar に持つので、スレッドごとに独立している。
+テンプレートと http.client へのフックは最初に有効にしたときに 1 回だけ差し込み、
+計測中でなければ元の処理をそのまま呼ぶ。
+"""
+import contextvars
+import http.client
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import base as template_base
+
+
+@dataclass
+class Timings:
+    started: float = field(default_factory=time.perf_counter)
+    db_ms: float = 0.0
+    db_queries: int = 0
+    template_ms: float = 0.0
+    http_ms: float = 0.0
+    http_calls: int = 0
+    http_log: list = field(default_factory=list)  # 外部 HTTP 1 回ごとの (ホスト, 秒)
+    template_depth: int = 0
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+_current = contextvars.ContextVar("profiling_timings", default=None)
+_install_lock = threading.Lock()
+_installed = False
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def measure():
+    """
+    with ブロック内の DB・テンプレート・外部 HTTP の時間を Timings に集める。
+    すでに計測中なら同じ Timings を返す（ProfilingMiddleware と MetricsMiddleware の併用）。
+    """
+    if _current.get() is not None:
+        yield _current.get()
+        return
+    install()
+    for alias in connections:
+        _add_db_wrapper(connections[alias])
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def _add_db_wrapper(connection, **kwargs):
+    # 計測中でなければ何もしないので、接続に付けたままにする。execute_wrapper() は
+    # 末尾から外すので、それと入れ違わないよう先頭に入れる
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _db_wrapper)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_ms += (time.perf_counter() - started) * 1000
+        timings.db_queries += 1
+
+
+def install():
+    """DB の接続・テンプレートの描画・http.client の送受信に計測用のフックを差し込む"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        # sync_to_async のスレッドは contextvar を引き継ぐので、そこでの SQL も数えられる
+        connection_created.connect(_add_db_wrapper)
+        _patch_template_render()
+        _patch_http_client()
+        _installed = True
+
+
+def _patch_template_render():
+    original = template_base.Template.render
+
+    def render(self, context):
+        timings = _current.get()
+        if timings is None:
+            return original(self, context)
+        timings.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            timings.template_depth -= 1
+            if timings.template_depth == 0:
+                timings.template_ms += (time.perf_counter() - started) * 1000
+
+    template_base.Template.render = render
+
+
+def _patch_http_client():
+    original_request = http.client.HTTPConnection.request
+    original_getresponse = http.client.HTTPConnection.getresponse
+
+    def request(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return original_request(self, *args, **kwargs)
+        timings.http_calls += 1
+        started = self._profiling_started = time.perf_counter()
+        try:
+            return original_request(self, *args, **kwargs)
+        finally:
+            timings.http_ms += (time.perf_counter() - started) * 1000
+
+    def getresponse(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return original_getresponse(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return original_getresponse(self, *args, **kwargs)
+        finally:
+            finished = time.perf_counter()
+            timings.http_ms += (finished - started) * 1000
+            # 1 回の呼び出しは送信の開始から応答ヘッダーの受信まで
+            timings.http_log.append((self.host, finished - getattr(self, "_profiling_started", started)))
+
+    http.client.HTTPConnection.request = request
+    http.client.HTTPConnection.getresponse = getresponse
+
+
+def server_timing(timings, total_ms):
+    """Server-Timing ヘッダーの値"""
+    return ", ".join([
+        f'db;dur={timings.db_ms:.1f};desc="{timings.db_queries} queries"',
+        f"tpl;dur={timings.template_ms:.1f}",
+        f'http;dur={timings.http_ms:.1f};desc="{timings.http_calls} calls"',
+        f"total;dur={total_ms:.1f}",
+    ])
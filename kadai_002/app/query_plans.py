@@ -0,0 +1,227 @@
+# app/query_plans.py
+"""
+各ページの SQL の実行計画（EXPLAIN QUERY PLAN）を調べる
+
+app/benchmarks.py と同じ URL・データセットで各ページを 1 回ずつ取得し、
+実行された SELECT を EXPLAIN QUERY PLAN にかけて次のものを探す。
+
+- scan:   絞り込み条件があるのにテーブル全体を読んでいる（SCAN <table>）
+- sort:   ORDER BY / GROUP BY / DISTINCT のために一時 B-tree を作っている
+- lookup: インデックスで絞り込んだ後に本体の行を読みに行っている
+          （カバリングインデックスなら不要。参考情報で、失敗にはしない）
+
+scan と sort には、WHERE と ORDER BY の列から Meta.indexes の候補を出す。
+python manage.py explain_queries で一覧を表示し、app/tests.py では
+ALLOWED に無い scan / sort が出たら失敗にする。
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.db import connections
+from django.test import Client
+
+from . import benchmarks
+from .models import Shop
+
+PRIMARY = "default"
+
+# 各ページに加えて調べるクエリ文字列（絞り込み・並び替えの組み合わせ）
+VARIANTS = {
+    "shop_list": [
+        "?category_id={category}", "?category_id={category}&sort=favorites", "?keyword=店", "?sort=favorites",
+        "?sort=trending", "?category_id={category}&sort=trending",
+        "?area={prefecture}", "?area={prefecture}/{city}", "?area={prefecture}/{city}/{ward}",
+        "?lat={latitude}&lng={longitude}", "?lat={latitude}&lng={longitude}&radius=30&category_id={category}",
+    ],
+    "api_shop_list": ["?category_id={category}&sort=favorites&limit=100", "?lat={latitude}&lng={longitude}&limit=50"],
+}
+
+# 分かった上で許している指摘: (URL 名, テーブル, 種類) -> 理由
+ALLOWED = {
+    ("shop_list?keyword=店", "app_shop", "scan"): "店名の部分一致（LIKE '%...%'）はインデックスを使えない",
+}
+
+FROM_RE = re.compile(r'(?:FROM|JOIN)\s+"(\w+)"(?:\s+(?:AS\s+)?(\w+))?', re.I)
+SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS (\w+))?(.*)$")
+SEARCH_RE = re.compile(r"^SEARCH (\w+)(?: AS (\w+))? USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY|PRIMARY KEY)")
+SORT_RE = re.compile(r"^USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY|LAST TERM OF ORDER BY)")
+CLAUSE_END_RE = re.compile(r"\b(ORDER BY|GROUP BY|LIMIT|HAVING)\b")
+
+
+@dataclass
+class Finding:
+    view: str
+    kind: str          # scan / sort / lookup
+    table: str
+    detail: str
+    sql: str
+    suggestion: str = ""
+
+    @property
+    def key(self):
+        return (self.view, self.table, self.kind)
+
+    @property
+    def fails(self):
+        return self.kind in ("scan", "sort") and self.key not in ALLOWED
+
+
+@dataclass
+class Capture:
+    queries: list = field(default_factory=list)
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def capture(names=None):
+    """{URL 名: [(sql, params), ...]} を返す（ページは 1 回ずつ取得する）"""
+    user, objects = benchmarks.prepare()
+    client = Client()
+    client.force_login(user)
+    connection = connections[PRIMARY]
+
+    values = Shop.objects.values("prefecture", "city", "ward", "latitude", "longitude").get(pk=objects["shop"])
+    values["category"] = Shop.objects.values_list("category_id", flat=True).get(pk=objects["shop"])
+
+    captured = {}
+    for name, path, method in benchmarks.cases(objects):
+        if names and name not in names:
+            continue
+        for query in ["", *VARIANTS.get(name, [])]:
+            recorder = Capture()
+            with connection.execute_wrapper(recorder):
+                benchmarks._request(client, method, path + query.format(**values))
+            captured[name + query] = recorder.queries
+    return captured
+
+
+def explain(sql, params, using=PRIMARY):
+    with connections[using].cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[3] for row in cursor.fetchall()]
+
+
+def analyze(names=None):
+    """Finding のリストを返す（同じ URL・テーブル・種類の重複はまとめる）"""
+    findings = {}
+    for view, queries in capture(names).items():
+        for sql, params in queries:
+            for finding in check(view, sql, explain(sql, params)):
+                findings.setdefault(finding.key, finding)
+    return list(findings.values())
+
+
+def check(view, sql, plan):
+    aliases = _aliases(sql)
+    where, order = _where_columns(sql), _order_columns(sql)
+    results = []
+    for detail in plan:
+        detail = detail.strip()
+        if match := SCAN_RE.match(detail):
+            table = aliases.get(match.group(2) or match.group(1), match.group(1))
+            # USING INDEX 付きの SCAN はインデックス順に読むだけ（LIMIT で止まる）
+            if "USING" not in match.group(3) and table in where:
+                results.append(Finding(view, "scan", table, detail, sql,
+                                       suggest(table, where.get(table, []), order.get(table, []))))
+        elif match := SEARCH_RE.match(detail):
+            table = aliases.get(match.group(2) or match.group(1), match.group(1))
+            if match.group(3) == "INDEX":
+                results.append(Finding(view, "lookup", table, detail, sql))
+        elif SORT_RE.match(detail):
+            table = next(iter(order), None)
+            if table is None:
+                continue
+            results.append(Finding(view, "sort", table, detail, sql,
+                                   suggest(table, where.get(table, []), order.get(table, []))))
+    return results
+
+
+def _aliases(sql):
+    """SQL 中の別名（U0 など）→ テーブル名"""
+    aliases = {}
+    for table, alias in FROM_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in ("ON", "WHERE", "INNER", "LEFT", "ORDER", "GROUP", "LIMIT"):
+            aliases[alias] = table
+    return aliases
+
+
+def _qualified(segment, sql):
+    """segment 中の "テーブル"."列" と 別名."列" を (テーブル, 列) で返す"""
+    aliases = _aliases(sql)
+    pattern = re.compile(r'(?:"(\w+)"|\b(\w+))\."(\w+)"')
+    for quoted, bare, column in pattern.findall(segment):
+        table = aliases.get(quoted or bare)
+        if table:
+            yield table, column
+
+
+def _where_columns(sql):
+    """
+    {テーブル: [(列, 等号か)]}（最も外側の WHERE だけ見る）。
+    LIKE '%...%' の列はインデックスでは絞り込めないので含めない
+    """
+    start = sql.upper().rfind(" WHERE ")
+    if start < 0:
+        return {}
+    segment = sql[start:]
+    end = CLAUSE_END_RE.search(segment)
+    segment = segment[:end.start()] if end else segment
+    columns = {}
+    for table, column in _qualified(segment, sql):
+        if re.search(rf'"{column}"\s*LIKE\b', segment):
+            columns.setdefault(table, [])
+            continue
+        is_equal = bool(re.search(rf'"{column}"\s*(=|IN\b|IS\b)', segment))
+        if (column, is_equal) not in columns.setdefault(table, []):
+            columns[table].append((column, is_equal))
+    return columns
+
+
+def _order_columns(sql):
+    """{テーブル: [(列, 降順か)]}"""
+    start = sql.upper().rfind(" ORDER BY ")
+    if start < 0:
+        return {}
+    segment = sql[start + len(" ORDER BY "):]
+    end = re.search(r"\bLIMIT\b", segment)
+    segment = segment[:end.start()] if end else segment
+    columns = {}
+    for part in segment.split(","):
+        for table, column in _qualified(part, sql):
+            columns.setdefault(table, []).append((column, "DESC" in part.upper()))
+    return columns
+
+
+def _model_for(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def suggest(table, where, order):
+    """Meta.indexes に追加するインデックスの候補（等号の列 → 並び順の列 → 範囲の列）"""
+    model = _model_for(table)
+    if model is None:
+        return ""
+    names = {f.column: f.name for f in model._meta.concrete_fields}
+    fields = [names.get(column, column) for column, is_equal in where if is_equal]
+    for column, descending in order:
+        name = names.get(column, column)
+        if name not in fields:
+            fields.append(("-" if descending else "") + name)
+    for column, is_equal in where:
+        name = names.get(column, column)
+        if not is_equal and name not in fields and f"-{name}" not in fields:
+            fields.append(name)
+    # 主キーは暗黙にインデックスの末尾に付いている
+    pk = model._meta.pk.name
+    fields = [f for f in fields if f.lstrip("-") not in (pk, "id")]
+    if not fields:
+        return ""
+    return f"{model.__name__}.Meta.indexes += [models.Index(fields={fields!r})]"
@@ -0,0 +1,163 @@
+# app/ratelimit.py
+"""
+URL 名ごとのリクエスト数の制限（ログイン・レビュー投稿・予約・決済）
+
+settings.RATELIMITS に URL 名ごとの上限を書く:
+
+    RATELIMITS = {
+        "login": {"ip": "10/m"},                    # IP アドレスごとに 1 分 10 回
+        "checkout": {"user": "5/m", "ip": "20/m"},  # ログイン中のユーザーごとにも数える
+    }
+
+回数はスライディングウィンドウ（直前の窓の回数を経過時間の割合で減らして足す）で
+数える。カウンタはキャッシュの add / incr（アトミック）で持ち、キャッシュが
+使えないときはプロセス内のカウンタで代わりに数える。Redis や Memcached など
+全ワーカーで共有するキャッシュを使えば上限も全体で効く（LocMemCache ならワーカーごと）。
+
+"user" はログイン中なら request.user.pk、未ログインなら IP アドレスで数える
+（セッション Cookie で数えると、Cookie を捨てるだけで制限を抜けられるため）。
+判定は RateLimitMiddleware.process_view で行い、超えたら 429 を返してビューは呼ばない。
+断ったリクエストも数えるので、送り続けている間は制限が解けない。
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+KEY_PREFIX = "ratelimit"
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str       # URL 名
+    scope: str      # ip / user
+    limit: int
+    period: int     # 秒
+
+    @classmethod
+    def parse(cls, name, scope, rate):
+        """"10/m" → 1 分に 10 回（"100/5m" のように数を付けてもよい）"""
+        count, _, period = rate.partition("/")
+        unit = period[-1:]
+        if unit not in PERIODS or scope not in ("ip", "user"):
+            raise ValueError(f"RATELIMITS[{name!r}][{scope!r}] = {rate!r} が不正です")
+        return cls(name, scope, int(count), int(period[:-1] or 1) * PERIODS[unit])
+
+
+def rules():
+    """{URL 名: [Rule, ...]}"""
+    return {
+        name: [Rule.parse(name, scope, rate) for scope, rate in limits.items()]
+        for name, limits in getattr(settings, "RATELIMITS", {}).items()
+    }
+
+
+class MemoryCounter:
+    """キャッシュが使えないときのプロセス内のカウンタ（キャッシュと同じ add / incr / get）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}   # キー → (値, 期限)
+
+    def add(self, key, value, timeout):
+        with self.lock:
+            self._expire()
+            if key in self.values:
+                return False
+            self.values[key] = (value, time.monotonic() + timeout)
+            return True
+
+    def incr(self, key):
+        with self.lock:
+            if key not in self.values:
+                raise ValueError(f"{key} がありません")
+            value, expires = self.values[key]
+            self.values[key] = (value + 1, expires)
+            return value + 1
+
+    def get(self, key, default=None):
+        with self.lock:
+            value, expires = self.values.get(key, (default, 0))
+            return value if expires > time.monotonic() else default
+
+    def _expire(self):
+        # 数が増えたときだけ期限切れを掃除する
+        if len(self.values) < 10000:
+            return
+        now = time.monotonic()
+        self.values = {key: item for key, item in self.values.items() if item[1] > now}
+
+
+memory = MemoryCounter()
+
+
+def counter():
+    return caches[getattr(settings, "RATELIMIT_CACHE", "default")]
+
+
+def client_ip(request):
+    """REMOTE_ADDR（RATELIMIT_PROXY_COUNT 段のプロキシの後ろなら X-Forwarded-For から）"""
+    proxies = getattr(settings, "RATELIMIT_PROXY_COUNT", 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def identity(rule, request):
+    """数える単位。user はログイン中ならユーザーの ID、未ログインなら IP アドレス"""
+    if rule.scope == "user":
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+    return client_ip(request)
+
+
+def hit(rule, ident, now=None):
+    """1 回数えて、上限を超えていれば再試行までの秒数、超えていなければ 0 を返す"""
+    now = time.time() if now is None else now
+    window, offset = divmod(now, rule.period)
+    key = f"{KEY_PREFIX}:{rule.name}:{rule.scope}:{ident}:{rule.period}:"
+    current, previous = key + str(int(window)), key + str(int(window) - 1)
+    try:
+        count, before = _count(counter(), current, previous, rule.period)
+    except Exception:
+        logger.warning("キャッシュが使えないのでプロセス内で数えます", exc_info=True)
+        count, before = _count(memory, current, previous, rule.period)
+
+    estimated = before * (1 - offset / rule.period) + count
+    if estimated <= rule.limit:
+        return 0
+    if count > rule.limit:
+        return int(rule.period - offset) + 1
+    # 直前の窓の分が減って上限を下回るまでの時間
+    return int((estimated - rule.limit) / before * rule.period) + 1
+
+
+def _count(store, current, previous, period):
+    store.add(current, 0, period * 2)
+    try:
+        count = store.incr(current)
+    except ValueError:  # add と incr の間に期限が切れた
+        store.add(current, 1, period * 2)
+        count = 1
+    return count, store.get(previous, 0)
+
+
+def check(request, name):
+    """URL 名 name の上限を超えていれば (Rule, 再試行までの秒数)、超えていなければ None"""
+    for rule in rules().get(name, ()):
+        ident = identity(rule, request)
+        if not ident:
+            continue
+        retry_after = hit(rule, ident)
+        if retry_after:
+            return rule, retry_after
+    return None
@@ -0,0 +1,169 @@
+# app/recommendations.py
+"""
+「似ているお店」のレコメンド（item-item の協調フィルタリング）
+
+ユーザー × 店舗の疎行列を Favorite と Review（評価で重み付け）から作り、
+店舗の列ベクトル同士のコサイン類似度の上位 TOP_K 件を ShopSimilarity に保存する。
+計算は python manage.py compute_similar_shops で行い、店舗詳細は保存済みの
+結果を (shop, rank) のインデックスで 1 クエリ読むだけにする。
+
+NumPy / SciPy があれば scipy.sparse の行列積で計算し、無い環境では同じ計算を
+ユーザーごとの転置インデックスで行う（件数が多いと遅い）。
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import lazy
+from .models import Favorite, Review, Shop, ShopSimilarity
+
+TOP_K = 10                # 1 店舗あたり保存する件数
+FAVORITE_WEIGHT = 1.0     # お気に入り 1 件の重み
+REVIEW_WEIGHT = 1.0       # レビューの重み（× 評価 / 5）
+CHUNK_SIZE = 1000         # 行列積・保存を何店舗ずつ行うか
+DETAIL_COUNT = 6          # 店舗詳細に表示する件数
+
+
+def interactions():
+    """{(user_id, shop_id): 重み}。同じ店舗への複数のレビューは最高評価だけ数える"""
+    weights = defaultdict(float)
+    for user_id, shop_id in Favorite.objects.values_list("user_id", "shop_id").iterator(chunk_size=5000):
+        weights[(user_id, shop_id)] += FAVORITE_WEIGHT
+    reviews = (
+        Review.objects.order_by().values_list("user_id", "shop_id")
+        .annotate(rating=Max("rating")).filter(rating__gt=0)
+    )
+    for user_id, shop_id, rating in reviews.iterator(chunk_size=5000):
+        weights[(user_id, shop_id)] += REVIEW_WEIGHT * rating / 5
+    return weights
+
+
+def engine():
+    """類似度の計算に使うもの（"scipy" / "python"）"""
+    # NumPy / SciPy は重いので、店舗詳細を返すだけのワーカーでは import しない
+    if lazy.optional("numpy") is not None and lazy.optional("scipy.sparse") is not None:
+        return "scipy"
+    return "python"
+
+
+def similar_shops(weights, shop_ids=None, top_k=TOP_K):
+    """
+    {店舗 ID: [(似ている店舗 ID, 類似度), ...]}（類似度の高い順）を返す。
+    shop_ids を渡すとその店舗の分だけ計算する（行列は全体から作る）。
+    """
+    if engine() == "scipy":
+        return _similar_scipy(weights, shop_ids, top_k)
+    return _similar_python(weights, shop_ids, top_k)
+
+
+def _similar_scipy(weights, shop_ids, top_k):
+    np, sparse = lazy.optional("numpy"), lazy.optional("scipy.sparse")
+    users = {user_id: i for i, user_id in enumerate(sorted({u for u, _ in weights}))}
+    shops = sorted({s for _, s in weights})
+    columns = {shop_id: j for j, shop_id in enumerate(shops)}
+    rows = np.fromiter((users[u] for u, _ in weights), dtype=np.int64, count=len(weights))
+    cols = np.fromiter((columns[s] for _, s in weights), dtype=np.int64, count=len(weights))
+    data = np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+    matrix = sparse.csc_matrix((data, (rows, cols)), shape=(len(users), len(shops)))
+
+    # 列ごとに L2 ノルムで割っておけば、内積がそのままコサイン類似度になる
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    normalized = (matrix @ sparse.diags(1 / norms)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    targets = [columns[s] for s in (shops if shop_ids is None else shop_ids) if s in columns]
+    results = {}
+    for start in range(0, len(targets), CHUNK_SIZE):
+        chunk = targets[start:start + CHUNK_SIZE]
+        scores = (transposed[chunk] @ normalized).tocsr()
+        for i, j in enumerate(chunk):
+            row = scores.getrow(i)
+            candidates, values = row.indices, row.data
+            keep = candidates != j
+            candidates, values = candidates[keep], values[keep]
+            if len(values) > top_k:
+                top = np.argpartition(-values, top_k)[:top_k]
+                candidates, values = candidates[top], values[top]
+            order = np.argsort(-values, kind="stable")
+            results[shops[j]] = [(shops[candidates[k]], float(values[k])) for k in order]
+    return results
+
+
+def _similar_python(weights, shop_ids, top_k):
+    by_shop, by_user = defaultdict(dict), defaultdict(dict)
+    for (user_id, shop_id), weight in weights.items():
+        by_shop[shop_id][user_id] = weight
+        by_user[user_id][shop_id] = weight
+    norms = {shop_id: math.sqrt(sum(w * w for w in users.values())) for shop_id, users in by_shop.items()}
+
+    results = {}
+    for shop_id in (by_shop if shop_ids is None else [s for s in shop_ids if s in by_shop]):
+        dots = defaultdict(float)
+        for user_id, weight in by_shop[shop_id].items():
+            for other, other_weight in by_user[user_id].items():
+                if other != shop_id:
+                    dots[other] += weight * other_weight
+        norm = norms[shop_id]
+        scores = ((other, dot / (norm * norms[other])) for other, dot in dots.items())
+        results[shop_id] = heapq.nlargest(top_k, scores, key=lambda item: (item[1], -item[0]))
+    return results
+
+
+def save(results, computed_at):
+    """計算結果で ShopSimilarity を置き換える（CHUNK_SIZE 店舗ずつ）"""
+    shop_ids = list(results)
+    for start in range(0, len(shop_ids), CHUNK_SIZE):
+        chunk = shop_ids[start:start + CHUNK_SIZE]
+        with transaction.atomic():
+            ShopSimilarity.objects.filter(shop_id__in=chunk).delete()
+            ShopSimilarity.objects.bulk_create([
+                ShopSimilarity(shop_id=shop_id, similar_id=similar_id, rank=rank, score=score,
+                               computed_at=computed_at)
+                for shop_id in chunk
+                for rank, (similar_id, score) in enumerate(results[shop_id], start=1)
+            ])
+
+
+def affected_shops(since):
+    """
+    since 以降にお気に入り・レビューをしたユーザーが関わる店舗。
+    新しく共起した組はすべてこの中に入るので、差分更新ではこれだけ計算し直す
+    （ノルムの変化による他店舗のスコアの小さなずれは、定期的な全件計算で直す）。
+    """
+    users = set(Favorite.objects.filter(created_at__gte=since).values_list("user_id", flat=True))
+    users.update(Review.objects.filter(created_at__gte=since).values_list("user_id", flat=True))
+    if not users:
+        return set()
+    shops = set(Favorite.objects.filter(user_id__in=users).values_list("shop_id", flat=True))
+    shops.update(Review.objects.filter(user_id__in=users).values_list("shop_id", flat=True))
+    return shops
+
+
+def last_computed():
+    return ShopSimilarity.objects.aggregate(last=Max("computed_at"))["last"]
+
+
+def rebuild(shop_ids=None, top_k=TOP_K):
+    """全件（shop_ids=None）または指定した店舗の類似店舗を計算して保存し、件数を返す"""
+    computed_at = timezone.now()
+    results = similar_shops(interactions(), shop_ids, top_k)
+    save(results, computed_at)
+    if shop_ids is None:
+        # 関わりが無くなった店舗の古い結果を消す
+        ShopSimilarity.objects.filter(computed_at__lt=computed_at).delete()
+    else:
+        # 計算対象だったが似ている店舗が無くなったもの
+        ShopSimilarity.objects.filter(shop_id__in=set(shop_ids) - set(results)).delete()
+    return len(results)
+
+
+def for_shop(shop_id, limit=DETAIL_COUNT):
+    """店舗詳細に表示する似ている店舗（(shop, rank) のインデックスで 1 クエリ）"""
+    return (
+        Shop.objects.filter(recommended_in__shop_id=shop_id)
+        .order_by("recommended_in__rank")[:limit]
+    )
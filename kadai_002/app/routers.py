@@ -0,0 +1,84 @@
+# app/routers.py
+"""
+読み取りレプリカへのルーティング
+
+- 書き込みはすべて default（プライマリ）
+- 読み込みは、@use_replica / use_replica = True を付けた閲覧系ビューの中だけ
+  settings.DATABASE_REPLICAS のいずれかへ送る
+- リクエスト中に書き込みがあれば、そのリクエストの残りと、その後
+  REPLICA_STICKY_SECONDS 秒間の同じブラウザからのリクエストはプライマリを読む
+  （自分が投稿したレビューや予約がすぐ見えるように。Cookie は ReplicaRoutingMiddleware が付ける）
+
+管理コマンドなどリクエスト外からの読み込みと、セッション・認証（PRIMARY_APPS）は常にプライマリ
+（ログイン直後のセッションや権限の変更がレプリカの遅れで見えない、ということがないように）。
+"""
+import contextvars
+import random
+from dataclasses import dataclass
+
+from django.conf import settings
+
+PRIMARY = "default"
+PRIMARY_APPS = {"sessions", "auth", "contenttypes"}
+
+
+@dataclass
+class RoutingState:
+    replica_allowed: bool = False
+    pinned: bool = False  # True ならプライマリを読む
+    wrote: bool = False   # このリクエストで書き込みがあった
+
+
+_state = contextvars.ContextVar("db_routing_state", default=None)
+
+
+def begin_request(pinned=False):
+    """リクエストの開始時に呼ぶ。戻り値は end_request に渡す"""
+    state = RoutingState(pinned=pinned)
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def allow_replica(allowed=True):
+    state = _state.get()
+    if state is not None:
+        state.replica_allowed = allowed
+
+
+def use_replica(view):
+    """閲覧専用のビューに付けるデコレータ（クラスビューは use_replica = True）"""
+    view.use_replica = True
+    return view
+
+
+def replicas():
+    return [alias for alias in getattr(settings, "DATABASE_REPLICAS", []) if alias in settings.DATABASES]
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or not state.replica_allowed:
+            return PRIMARY
+        if model._meta.app_label in PRIMARY_APPS:
+            return PRIMARY
+        aliases = replicas()
+        return random.choice(aliases) if aliases else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = True
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリのコピーなので、どの組み合わせでも同じデータ
+        databases = {PRIMARY, *replicas()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,195 @@
+# app/shop_cache.py
+"""
+Shop（と category）を主キーで引く読み込みキャッシュ
+
+店舗詳細・レビュー投稿・予約・決済・近くのお店の一覧は、同じ店舗を何度も
+get_object_or_404(Shop, pk=...) で読んでいた。ここでは category を JOIN した
+インスタンスを settings.SHOP_CACHE のキャッシュに置き、次からは DB を読まない。
+
+- 鮮度: Shop の保存・削除と Category の保存・削除で signals から（コミットの後に）消す。
+  保存時は新しいインスタンスを書き込み、updated_at がキャッシュより古いもので
+  上書きしない（読み込みは add で書くので、保存の直後に古い行で上書きしない）。
+  QuerySet.update() / bulk_* で列を変えるところ（お気に入り数・派生画像・
+  管理画面の料金変更・import_shops など）は invalidate() / invalidate_many() を呼ぶ。
+  trending_score と reviews_updated_at はキャッシュ中の値が古いことがある（表示しない）
+- 読み込みは常にプライマリ（@use_replica のビューの中でも）。遅れているレプリカから
+  読んだ古い行を、書き込みで消した後のキャッシュに置かないように
+- single-flight: ミスしたとき、プロセス内では同じ店舗の読み込みを 1 本にまとめ、
+  プロセスをまたいではキャッシュの add でロックを取った 1 つだけが DB を読み、
+  他は LOCK_WAIT 秒まで結果を待つ（待ちきれなければ自分で読む）。
+  LocMemCache（既定）はワーカーごとなのでプロセスをまたぐロックは取らない。
+  ワーカー間でまとめるには Redis などの共有のキャッシュを使う
+- 存在しない主キーも NEGATIVE_TIMEOUT 秒覚えておく
+- get_many(pks) は一覧向け。キャッシュを get_many で引き、足りない分を 1 クエリで読む
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import Http404
+
+from .models import Shop
+from .routers import PRIMARY
+
+KEY_PREFIX = "shop:1"   # インスタンスの形（列）が変わったら数字を上げる
+TIMEOUT = 300
+NEGATIVE_TIMEOUT = 30
+LOCK_TIMEOUT = 5        # 読み込み中のロックの最長（読み込んだプロセスが落ちても残らない）
+LOCK_WAIT = 0.5         # 他のプロセスの読み込みを待つ最長の秒数
+POLL_INTERVAL = 0.01
+MISSING = "missing"     # 存在しない主キーの印
+
+_local_lock = threading.Lock()
+_inflight = {}          # 主キー → このプロセスで読み込み中の Flight
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+def cache():
+    return caches[getattr(settings, "SHOP_CACHE", "default")]
+
+
+def timeout():
+    return getattr(settings, "SHOP_CACHE_TIMEOUT", TIMEOUT)
+
+
+def cache_key(pk):
+    return f"{KEY_PREFIX}:{pk}"
+
+
+def lock_key(pk):
+    return f"{KEY_PREFIX}:lock:{pk}"
+
+
+def queryset():
+    return Shop.objects.using(PRIMARY).select_related("category")
+
+
+def get(pk):
+    """主キー pk の Shop（category 付き）。無ければ Shop.DoesNotExist"""
+    pk = int(pk)
+    value = cache().get(cache_key(pk))
+    if value is None:
+        value = _load_once(pk)
+    if value == MISSING:
+        raise Shop.DoesNotExist(f"Shop {pk} がありません")
+    return value[1]
+
+
+def get_or_404(pk):
+    try:
+        return get(pk)
+    except (Shop.DoesNotExist, ValueError):
+        raise Http404("店舗が見つかりません")
+
+
+def get_many(pks):
+    """{主キー: Shop}（存在しないものは含めない）。キャッシュに無い分は 1 クエリで読む"""
+    pks = [int(pk) for pk in pks]
+    found = cache().get_many([cache_key(pk) for pk in pks])
+    shops = {pk: found[cache_key(pk)][1] for pk in pks
+             if cache_key(pk) in found and found[cache_key(pk)] != MISSING}
+    missing = [pk for pk in dict.fromkeys(pks) if cache_key(pk) not in found]
+    if missing:
+        loaded = {shop.pk: shop for shop in queryset().filter(pk__in=missing)}
+        cache().set_many({cache_key(pk): (shop.updated_at, shop) for pk, shop in loaded.items()}, timeout())
+        absent = [pk for pk in missing if pk not in loaded]
+        if absent:
+            cache().set_many({cache_key(pk): MISSING for pk in absent}, NEGATIVE_TIMEOUT)
+        shops.update(loaded)
+    return shops
+
+
+aget = sync_to_async(get)
+aget_many = sync_to_async(get_many)
+
+
+async def aget_or_404(pk):
+    return await sync_to_async(get_or_404)(pk)
+
+
+def _load_once(pk):
+    """このプロセスで同じ主キーを読み込み中なら、その結果を待って使う"""
+    with _local_lock:
+        flight = _inflight.get(pk)
+        leader = flight is None
+        if leader:
+            flight = _inflight[pk] = Flight()
+    if not leader:
+        flight.done.wait(LOCK_WAIT + LOCK_TIMEOUT)
+        return flight.value if flight.value is not None else _load(pk)
+    try:
+        flight.value = _load_shared(pk)
+        return flight.value
+    finally:
+        with _local_lock:
+            _inflight.pop(pk, None)
+        flight.done.set()
+
+
+def _load_shared(pk):
+    """プロセスをまたいで 1 つだけが DB を読む（ロックを取れなければ結果を待つ）"""
+    store = cache()
+    if isinstance(store, LocMemCache):
+        # プロセス内のキャッシュでは、まとめる相手は _load_once で待っている
+        return _load(pk)
+    if not store.add(lock_key(pk), 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = store.get(cache_key(pk))
+            if value is not None:
+                return value
+        return _load(pk)
+    try:
+        return _load(pk)
+    finally:
+        store.delete(lock_key(pk))
+
+
+def _load(pk):
+    shop = queryset().filter(pk=pk).first()
+    if shop is None:
+        cache().add(cache_key(pk), MISSING, NEGATIVE_TIMEOUT)
+        return MISSING
+    value = (shop.updated_at, shop)
+    # 保存（store）が先に新しい値を書いていれば上書きしない
+    cache().add(cache_key(pk), value, timeout())
+    return value
+
+
+def store(shop):
+    """保存した Shop を書き込む（キャッシュにある方が新しければそのまま）"""
+    key = cache_key(shop.pk)
+    current = cache().get(key)
+    if current not in (None, MISSING) and current[0] > shop.updated_at:
+        return
+    if shop.category_id is not None and not Shop.category.is_cached(shop):
+        # category を読み直してから置く（読み出し側で追加のクエリが出ないように）
+        shop = queryset().filter(pk=shop.pk).first()
+        if shop is None:
+            return
+    cache().set(key, (shop.updated_at, shop), timeout())
+
+
+def invalidate(pk):
+    cache().delete(cache_key(pk))
+
+
+def invalidate_many(pks):
+    cache().delete_many([cache_key(pk) for pk in pks])
+
+
+def invalidate_object(instance):
+    """update() で列を変えた Shop か Category（その店舗すべて）のキャッシュを消す"""
+    if isinstance(instance, Shop):
+        invalidate(instance.pk)
+    elif isinstance(instance, Shop.category.field.related_model):
+        invalidate_many(Shop.objects.filter(category=instance).values_list("pk", flat=True))
@@ -1,11 +1,142 @@
 # app/signals.py
-from django.db.models.signals import post_save
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import MemberProfile
+from django.utils import timezone
+from .models import MemberProfile, Shop, Category, Review, Reservation, Favorite
+from . import areas, geo, images, prerender, shop_cache, trending
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         MemberProfile.objects.create(user=instance)
     instance.memberprofile.save()
+
+# 画像が変わったら派生画像の生成ジョブを登録する
+@receiver(post_save, sender=Shop)
+@receiver(post_save, sender=Category)
+def enqueue_image_variants(sender, instance, **kwargs):
+    if images.needs_variants(instance.img, instance.img_variants):
+        transaction.on_commit(lambda: images.enqueue(instance))
+
+
+# 読み込んだ時点の画像（変わったかどうかを pre_save で比べる。遅延読み込みの列は読まない）
+@receiver(post_init, sender=Shop)
+@receiver(post_init, sender=Category)
+def remember_image(sender, instance, **kwargs):
+    value = instance.__dict__.get("img")
+    instance._loaded_img = getattr(value, "name", value)
+
+
+# 画像が変わったときだけプレースホルダー（サイズ・代表色・16px プレビュー）を計算する
+@receiver(pre_save, sender=Shop)
+@receiver(pre_save, sender=Category)
+def set_image_placeholder(sender, instance, **kwargs):
+    if "img" in instance.get_deferred_fields():
+        return
+    image = instance.img
+    if not image or images.is_default(image):
+        images.clear_placeholder(instance)
+        return
+    changed = instance._state.adding or not image._committed or image.name != instance._loaded_img
+    if changed:
+        try:
+            images.set_placeholder(instance)
+        except Exception:
+            # 壊れた画像でも保存自体は止めない
+            logger.exception("プレースホルダーを作成できませんでした: %r", instance)
+    instance._loaded_img = image.name
+
+
+# 予約で「いま人気」のスコアを加算する（app/trending.py）
+# レビューは touch_shop_reviews、お気に入りは views._add_favorite が他の列と同じ UPDATE で加算する
+@receiver(post_save, sender=Reservation)
+def bump_trending_score(sender, instance, created, **kwargs):
+    if created:
+        trending.bump(instance.shop_id, "reservation", instance.created_at)
+
+
+# ユーザーを削除すると、その人のお気に入り（CASCADE）の分だけ favorite_count を 1 回の UPDATE で減らす
+# （追加・解除は views._add_favorite / _remove_favorite が同じトランザクションで増減する。
+# Favorite に削除のシグナルを付けると、解除の DELETE の前に SELECT が要るので付けない）
+@receiver(pre_delete, sender=User)
+def decrement_favorite_counts(sender, instance, using, **kwargs):
+    shop_ids = list(Favorite.objects.filter(user=instance).values_list("shop_id", flat=True))
+    if shop_ids:
+        Shop.objects.filter(pk__in=shop_ids, favorite_count__gt=0).update(favorite_count=F("favorite_count") - 1)
+        transaction.on_commit(lambda: shop_cache.invalidate_many(shop_ids), using=using)
+
+
+# 住所からエリア（都道府県・市区町村・区）と緯度・経度を設定する（app/areas.py, app/geo.py）
+@receiver(pre_save, sender=Shop)
+def set_shop_area(sender, instance, **kwargs):
+    geo.apply(areas.apply(instance))
+
+
+# 読み込んだ時点の一覧に出る列（保存で一覧の静的ページも消すかどうかを比べる）
+@receiver(post_init, sender=Shop)
+def remember_listing_values(sender, instance, **kwargs):
+    instance._loaded_listing = prerender.listing_values(instance)
+
+
+# 店舗・レビューが変わったら静的ページ（app/prerender.py）を消し、次に作り直すまでは Django が描画する
+# 一覧のファイルは、一覧に出る列が変わったとき（移ったカテゴリは移る前の一覧も）と追加・削除のときだけ消す
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_prerendered_shop(sender, instance, created=False, **kwargs):
+    before, after = instance._loaded_listing, prerender.listing_values(instance)
+    instance._loaded_listing = after
+    listings = created or kwargs["signal"] is post_delete or before != after
+    prerender.invalidate(instance.pk, instance.category_id, listings=listings)
+    if listings and before["category_id"] not in (None, instance.category_id):
+        prerender.invalidate(category_id=before["category_id"])
+
+
+# カテゴリ名はすべての一覧と、そのカテゴリの店舗詳細に出る（削除は店舗の category が NULL になる前に）
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_prerendered_category(sender, instance, **kwargs):
+    prerender.invalidate_object(instance)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_shop_reviews(sender, instance, created=False, **kwargs):
+    changes = {"reviews_updated_at": timezone.now()}
+    if created:
+        # 新しいレビューは「いま人気」のスコアも同じ UPDATE で加算する
+        changes["trending_score"] = trending.bumped("review", instance.created_at)
+    Shop.objects.filter(pk=instance.shop_id).update(**changes)
+    prerender.invalidate(instance.shop_id, listings=False)  # レビューは一覧に出ない
+
+
+# 店舗のキャッシュ（app/shop_cache.py）。すべての列を保存したときは新しいインスタンスを書き込む
+# どれもコミットの後に行う（ロールバックした値を置かない。コミット前に消すと、
+# 他のリクエストがコミット前の古い行を読み直してキャッシュに戻してしまう）
+@receiver(post_save, sender=Shop)
+def store_cached_shop(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is None and not instance.get_deferred_fields():
+        transaction.on_commit(lambda: shop_cache.store(instance), using=using)
+    else:
+        transaction.on_commit(lambda: shop_cache.invalidate(instance.pk), using=using)
+
+
+@receiver(post_delete, sender=Shop)
+def delete_cached_shop(sender, instance, using, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: shop_cache.invalidate(pk), using=using)
+
+
+# カテゴリはキャッシュ中の店舗に含まれる（削除では店舗の category が NULL になる前に店舗を調べる）
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_cached_category_shops(sender, instance, using, created=False, **kwargs):
+    if not created:
+        pks = list(Shop.objects.filter(category=instance).values_list("pk", flat=True))
+        transaction.on_commit(lambda: shop_cache.invalidate_many(pks), using=using)
@@ -0,0 +1,68 @@
+# app/storage.py
+"""
+collectstatic 用のストレージ
+
+ManifestStaticFilesStorage でファイル名に内容のハッシュを付けたうえで、
+テキスト系のファイルは gzip（.gz）と brotli（.br）に圧縮したものを横に置く。
+配信は app/middleware.py の StaticServeMiddleware が Accept-Encoding を見て選ぶ。
+brotli パッケージが無い環境では .gz だけを作る。
+"""
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 任意の依存
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".html", ".txt", ".xml", ".ico",
+    ".ttf", ".otf", ".eot",
+)
+# これより小さいファイルは圧縮しても得にならない
+MIN_COMPRESS_SIZE = 256
+
+
+def compress_file(path):
+    """path の .gz / .br を作る。元より小さくならなかった形式は作らない。作ったパスを返す"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+
+    outputs = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        outputs.append((".br", brotli.compress(data, quality=11)))
+
+    written = []
+    for suffix, compressed in outputs:
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # マニフェストに無い・ファイルが存在しない場合はハッシュ無しの URL を返す
+    # （collectstatic 前のテスト実行などでページ全体がエラーにならないように）
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        extensions = getattr(settings, "STATIC_COMPRESS_EXTENSIONS", COMPRESSIBLE_EXTENSIONS)
+        # ハッシュ付き・元の名前の両方を圧縮する（テンプレート以外から元の名前で参照されることもある）
+        for name in set(self.hashed_files.values()) | set(paths):
+            if name.endswith(extensions) and self.exists(name):
+                compress_file(self.path(name))
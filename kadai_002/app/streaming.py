@@ -0,0 +1,172 @@
+# app/streaming.py
+"""
+<head> とヘッダーを先に送る StreamingHttpResponse（settings.STREAMING_RENDER）
+
+render() はページ全体を文字列にしてから返すので、最初の 1 バイトが届くのは描画が
+すべて終わった後になる。ここでは base.html の {% block content %} の前まで
+（<head> とヘッダー）を先に送り、ブラウザーが本文の描画を待たずに CSS を取りに
+行けるようにする。本文も {% block %} の中をノードごとに描画し、CHUNK_SIZE 文字ずつ
+送るので、ページ全体の文字列は作らない（1 つのノードの出力、たとえば {% for %} 全体は
+まとめて描画される。CHUNK_SIZE を超えた分は次のチャンクに回す）。
+
+- Accept-Encoding に gzip があれば、送る単位ごとに圧縮して flush する
+  （GZipMiddleware と同じく、gzip のヘッダーにランダムな長さのファイル名を入れて BREACH を緩和する）
+- ASGI では描画を 1 チャンクずつスレッド（sync_to_async）で進める
+- テンプレートの中まで分けるのは {% extends %} と {% block %} だけ（ExtendsNode.render()・
+  BlockNode.render() と同じ手順でノードを順に描画する）。それ以外のノードは Django の render() に任せる
+
+ヘッダーを送った後に本文で例外が起きるとページは途中で切れる（ステータスは 200 のまま。
+ログには残る）。CSRF トークンはレスポンスを返した後に描画されるので、フォームが
+あるページは csrf=True を渡して Cookie を先に用意する。
+"""
+import gzip
+import logging
+import re
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.base import TextNode
+from django.template.context import make_context
+from django.template.loader import get_template
+from django.template.loader_tags import BLOCK_CONTEXT_KEY, BlockContext, BlockNode, ExtendsNode
+from django.utils.cache import patch_vary_headers
+from django.utils.text import StreamingBuffer
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024      # 送る単位（文字数）
+FLUSH_BLOCKS = ("content",)  # この block に入る前に、それまでの分をすぐ送る
+MAX_RANDOM_BYTES = 100
+ACCEPTS_GZIP_RE = re.compile(r"\bgzip\b")
+FLUSH = object()            # ここまでをすぐ送る印
+
+
+def enabled():
+    return getattr(settings, "STREAMING_RENDER", False)
+
+
+def render(request, template_name, context=None, csrf=False):
+    """render() の代わりに、描画しながら送る StreamingHttpResponse を返す"""
+    if csrf:
+        get_token(request)  # CsrfViewMiddleware がレスポンスに Cookie を付けられるように先に作る
+    template = get_template(template_name)
+    context = make_context(context, request, autoescape=template.backend.engine.autoescape)
+    chunks = _chunks(iter_template(template.template, context))
+
+    gzipped = ACCEPTS_GZIP_RE.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    if gzipped:
+        chunks = compress(chunks)
+    content = _aiter(chunks) if isinstance(request, ASGIRequest) else chunks
+    response = StreamingHttpResponse(content, content_type="text/html; charset=utf-8")
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+async def _aiter(chunks):
+    """同期のジェネレーターを 1 チャンクずつスレッドで進める（ORM もそのスレッドで動く）"""
+    step = sync_to_async(next)
+    while True:
+        chunk = await step(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _chunks(parts):
+    """描画した文字列を CHUNK_SIZE 文字ずつの bytes に分ける（FLUSH ではその時点までを送る）"""
+    pending = ""
+    try:
+        for part in parts:
+            if part is FLUSH:
+                if pending:
+                    yield pending.encode("utf-8")
+                    pending = ""
+                continue
+            pending += part
+            while len(pending) >= CHUNK_SIZE:
+                yield pending[:CHUNK_SIZE].encode("utf-8")
+                pending = pending[CHUNK_SIZE:]
+    except Exception:
+        logger.exception("ページの描画が途中で失敗しました")
+        raise
+    if pending:
+        yield pending.encode("utf-8")
+
+
+def compress(chunks):
+    """チャンクごとに圧縮して flush する gzip（受け取った側はすぐに展開して表示できる）"""
+    buffer = StreamingBuffer()
+    filename = secrets.token_hex(secrets.randbelow(MAX_RANDOM_BYTES // 2) + 1)
+    with gzip.GzipFile(filename=filename, mode="wb", compresslevel=6, fileobj=buffer, mtime=0) as zfile:
+        for chunk in chunks:
+            zfile.write(chunk)
+            zfile.flush()
+            yield buffer.read()
+    yield buffer.read()
+
+
+# ----------------------------
+# テンプレートをノードごとに描画する
+# ----------------------------
+
+def iter_template(template, context):
+    with context.render_context.push_state(template):
+        with context.bind_template(template):
+            context.template_name = template.name
+            yield from iter_nodelist(template.nodelist, context)
+
+
+def iter_nodelist(nodelist, context):
+    for node in nodelist:
+        if isinstance(node, ExtendsNode):
+            yield from _iter_extends(node, context)
+        elif isinstance(node, BlockNode):
+            if node.name in FLUSH_BLOCKS:
+                yield FLUSH
+            yield from _iter_block(node, context)
+        else:
+            yield str(node.render_annotated(context))
+
+
+def _iter_block(node, context):
+    # BlockNode.render()（django/template/loader_tags.py）と同じ手順で、差し替え後の block の
+    # ノードを順に返す（{{ block.super }} は context["block"] から BlockNode.render() で描画される）
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context["block"] = node
+            yield from iter_nodelist(node.nodelist, context)
+            return
+        push = block = block_context.pop(node.name)
+        if block is None:
+            block = node
+        block = type(node)(block.name, block.nodelist)
+        block.context = context
+        context["block"] = block
+        yield from iter_nodelist(block.nodelist, context)
+        if push is not None:
+            block_context.push(node.name, push)
+
+
+def _iter_extends(node, context):
+    # ExtendsNode.render()（django/template/loader_tags.py）と同じ手順で、最後に親を描画する代わりに
+    # 親のノードを順に返す
+    parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    for child in parent.nodelist:
+        # 親が {% extends %} を持たなければ一番上のテンプレートなので、その block も登録する
+        if not isinstance(child, TextNode):
+            if not isinstance(child, ExtendsNode):
+                block_context.add_blocks({n.name: n for n in parent.nodelist.get_nodes_by_type(BlockNode)})
+            break
+    with context.render_context.push_state(parent, isolated_context=False):
+        yield from iter_nodelist(parent.nodelist, context)
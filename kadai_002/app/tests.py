@@ -1,3 +1,932 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.template import Context, Engine, Template
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from app import (
+    areas, benchmarks, geo, images, jobs, metrics, prerender, query_plans, ratelimit, routers, shop_cache, streaming,
+    trending,
+)
+from app.filters import area_facets
+from app.admin import EstimatedCountPaginator, MemberProfileAdmin, ReviewAdmin, ShopAdmin
+from app.middleware import ReplicaRoutingMiddleware
+from app.models import Category, Favorite, Job, MemberProfile, Review, Shop, ShopSimilarity
+
+
+class ViewQueryBudgetTests(TestCase):
+    """各ページのクエリ数が benchmarks/baseline.json より増えていないこと"""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmarks.seed()
+
+    def test_queries_do_not_exceed_baseline(self):
+        baseline = benchmarks.load_baseline()
+        self.assertTrue(baseline, "python manage.py bench_views --save-baseline でベースラインを作成してください")
+        results = benchmarks.run(iterations=1)
+        self.assertEqual(benchmarks.compare(results, baseline, queries_only=True), [])
+
+
+class StartupTests(SimpleTestCase):
+    """重い依存（benchmarks.HEAVY_MODULES）を起動時に読み込まないこと
+    （時間はマシンで変わるので python manage.py bench_startup で比べる）"""
+
+    def test_heavy_modules_are_not_imported_at_startup(self):
+        results = benchmarks.run_startup(runs=1)
+        self.assertEqual({mode: r["status"] for mode, r in results.items()}, {"warmup": 200, "cold": 200})
+        self.assertEqual({mode: r["heavy_modules"] for mode, r in results.items()}, {"warmup": [], "cold": []})
+
+    def test_asgi_disables_persistent_connections(self):
+        code = (
+            "import config.{0}; from django.conf import settings; "
+            "print({{alias: db['CONN_MAX_AGE'] for alias, db in settings.DATABASES.items()}})"
+        )
+        env = {key: value for key, value in os.environ.items() if key != "DJANGO_ASGI"}
+        for module, expected in (("asgi", 0), ("wsgi", 600)):
+            output = subprocess.run([sys.executable, "-c", code.format(module)], cwd=settings.BASE_DIR, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            self.assertEqual(output.strip(), str({"default": expected}))
+
+
+class QueryPlanTests(TestCase):
+    """各ページの SQL に、許可していない全件スキャン・一時ソートが無いこと（app/query_plans.py）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmarks.seed()
+
+    def test_no_new_scans_or_sorts(self):
+        failures = [f for f in query_plans.analyze() if f.fails]
+        self.assertEqual(
+            [f"{f.view}: {f.detail} {f.suggestion}" for f in failures], [],
+            "python manage.py explain_queries で詳細を確認してください",
+        )
+
+
+class RateLimitTests(TestCase):
+    """回数制限（app/ratelimit.py）のスライディングウィンドウと数える単位"""
+
+    def setUp(self):
+        ratelimit.counter().clear()
+
+    def test_sliding_window(self):
+        rule = ratelimit.Rule.parse("test", "ip", "3/m")
+        self.assertEqual([ratelimit.hit(rule, "a", now=120) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(ratelimit.hit(rule, "a", now=130), 51)  # この窓で上限を超えた → 窓の終わりまで
+        self.assertEqual(ratelimit.hit(rule, "b", now=130), 0)   # 単位ごとに別に数える
+        # 次の窓の半分: 直前の窓の 4 回の半分 + 1 = 3 まではよい
+        self.assertEqual(ratelimit.hit(rule, "a", now=210), 0)
+        # 4 * 0.5 + 2 = 4 → 直前の窓の分が 1 回分減るまで 4 分の 1 窓（15 秒）待つ
+        self.assertEqual(ratelimit.hit(rule, "a", now=210), 16)
+        # 2 つ後の窓では直前の窓（2 回）だけを見る
+        self.assertEqual(ratelimit.hit(rule, "a", now=300), 0)
+
+    def test_falls_back_to_memory_when_cache_fails(self):
+        rule = ratelimit.Rule.parse("test", "ip", "1/m")
+        with mock.patch.object(ratelimit, "counter", side_effect=RuntimeError), self.assertLogs("app.ratelimit", "WARNING"):
+            self.assertEqual(ratelimit.hit(rule, "fallback", now=60), 0)
+            self.assertGreater(ratelimit.hit(rule, "fallback", now=60), 0)
+
+    def test_user_scope_is_user_id_or_ip(self):
+        rule = ratelimit.Rule.parse("test", "user", "1/m")
+        request = RequestFactory().post("/", REMOTE_ADDR="192.0.2.1")
+        request.user = AnonymousUser()
+        self.assertEqual(ratelimit.identity(rule, request), "192.0.2.1")
+        request.user = User(pk=7)
+        self.assertEqual(ratelimit.identity(rule, request), "user:7")
+
+    @override_settings(RATELIMITS={"login": {"user": "2/m"}})
+    def test_new_session_does_not_reset_user_limit(self):
+        user = User.objects.create_user("limited", password="password")
+        for n in range(3):
+            client = Client(REMOTE_ADDR=f"192.0.2.{n}")  # 毎回別のセッション・別の IP
+            client.force_login(user)
+            response = client.post(reverse("login"))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        # 未ログインは IP ごと
+        self.assertNotEqual(Client(REMOTE_ADDR="192.0.2.9").post(reverse("login")).status_code, 429)
+
+    @override_settings(RATELIMITS={"login": {"user": "1/m"}})
+    async def test_user_scope_under_asgi(self):
+        user = await User.objects.acreate(username="limited")
+        client = AsyncClient()
+        await client.aforce_login(user)
+        self.assertNotEqual((await client.post(reverse("login"))).status_code, 429)
+        self.assertEqual((await client.post(reverse("login"))).status_code, 429)
+
+
+class MetricsTests(TestCase):
+    """メトリクス（app/metrics.py）の書き出しと /metrics/"""
+
+    def setUp(self):
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(METRICS_DIR=self.dir, METRICS_TOKEN="secret"))
+        self.registry = self.enterContext(mock.patch.object(metrics, "registry", metrics.Registry()))
+
+    def get(self, **headers):
+        return self.client.get(reverse("metrics"), **headers)
+
+    def test_requires_token_or_staff(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_output_sums_all_processes(self):
+        # 別のワーカーが書き出した値（shop_list への GET 2 回）と、書き込み途中の壊れたファイル
+        (self.dir / "1-1.json").write_text(json.dumps({
+            "counters": [["app_http_requests_total", {"route": "shop_list", "method": "GET", "status": "200"}, 2]],
+            "histograms": [["app_http_request_duration_seconds", {"route": "shop_list", "status": "200"},
+                            [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0.03, 2]]],
+        }))
+        (self.dir / "2-1.json").write_text("{")
+        self.client.get(reverse("shop_list"))
+        response = self.get(HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        lines = response.content.decode().splitlines()
+        for line in (
+            "# TYPE app_http_requests_total counter",
+            'app_http_requests_total{method="GET",route="shop_list",status="200"} 3',
+            "# TYPE app_http_request_duration_seconds histogram",
+            'app_http_request_duration_seconds_bucket{route="shop_list",status="200",le="+Inf"} 3',
+            'app_http_request_duration_seconds_count{route="shop_list",status="200"} 3',
+        ):
+            self.assertIn(line, lines)
+
+    def test_flush_writes_in_background(self):
+        metrics.inc("app_ratelimit_rejections_total", route="login", scope="ip")
+        threads = []
+        write = self.registry._write
+
+        def record(directory):
+            threads.append(threading.current_thread().name)
+            write(directory)
+
+        with mock.patch.object(self.registry, "_write", record):
+            self.registry.flush()
+            self.registry.flusher.join()
+            self.registry.flush()  # 間隔が空いていないので書かない
+        self.assertEqual(threads, ["metrics-flush"])
+        data = json.loads((self.dir / f"{os.getpid()}-{self.registry.started}.json").read_text())
+        self.assertEqual(data["counters"], [["app_ratelimit_rejections_total", {"route": "login", "scope": "ip"}, 1]])
+
+
+class AdminSearchTests(TestCase):
+    """管理画面の前方一致検索と件数（app/admin.py の ScalableAdmin）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser("staff", password="password")
+        for name in ("居酒屋A", "居酒屋B", "和食居酒", "Cafe", "cafe"):
+            Shop.objects.create(name=name)
+
+    def search(self, model_admin, term):
+        request = RequestFactory().get("/")
+        queryset = model_admin.model.objects.all()
+        return model_admin.get_search_results(request, queryset, term)[0]
+
+    def test_prefix_search_is_a_range(self):
+        admin = ShopAdmin(Shop, admin_site)
+        self.assertEqual(sorted(self.search(admin, "居酒").values_list("name", flat=True)), ["居酒屋A", "居酒屋B"])
+        self.assertEqual(list(self.search(admin, "Caf").values_list("name", flat=True)), ["Cafe"])
+        Shop.objects.filter(name="Cafe").update(external_id="x-1")
+        self.assertEqual(list(self.search(admin, "x-1").values_list("name", flat=True)), ["Cafe"])
+        admin = MemberProfileAdmin(MemberProfile, admin_site)
+        self.assertEqual([p.user for p in self.search(admin, "sta")], [self.staff])
+        self.assertEqual(list(self.search(admin, "Sta")), [])
+
+    def test_prefix_search_uses_indexes(self):
+        admins = (ShopAdmin(Shop, admin_site), MemberProfileAdmin(MemberProfile, admin_site), ReviewAdmin(Review, admin_site))
+        for admin in admins:
+            sql, params = self.search(admin, "居酒").query.sql_with_params()
+            plan = query_plans.explain(sql, params)
+            self.assertFalse([line for line in plan if line.startswith("SCAN")], plan)
+            self.assertTrue([line for line in plan if "USING" in line and "INDEX" in line], plan)
+
+    def test_small_tables_are_counted_exactly(self):
+        Shop.objects.filter(name="cafe").update(id=100000)
+        paginator = EstimatedCountPaginator(Shop.objects.order_by("pk"), 50)
+        self.assertEqual((paginator.count, paginator.estimated, paginator.truncated), (5, False, False))
+
+    @mock.patch.object(EstimatedCountPaginator, "ESTIMATE_LIMIT", 1)
+    def test_large_tables_are_labelled(self):
+        Shop.objects.filter(name="cafe").update(id=100000)
+        paginator = EstimatedCountPaginator(Shop.objects.order_by("pk"), 50)
+        self.assertEqual((paginator.count, paginator.estimated), (100000, True))
+        paginator = EstimatedCountPaginator(Shop.objects.filter(name__gte="A").order_by("pk"), 50)
+        self.assertEqual((paginator.count, paginator.truncated), (1, True))
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse("admin:app_shop_changelist")), "約 100000 店舗")
+        self.assertContains(self.client.get(reverse("admin:app_shop_changelist"), {"q": "居酒"}), "1 店舗 以上")
+
+
+class JobTests(TestCase):
+    """バックグラウンドジョブの取得・リトライ・その場での実行（app/jobs.py）"""
+
+    def enqueue_emails(self, *recipients):
+        return [
+            jobs.enqueue("app.send_email", {"subject": "件名", "body": "本文", "to": [to]})
+            for to in recipients
+        ]
+
+    def test_claim_takes_ready_jobs_once(self):
+        ready = self.enqueue_emails("a@example.com", "b@example.com")
+        jobs.enqueue("app.send_email", {"to": []}, run_at=timezone.now() + timedelta(hours=1))
+        claimed = jobs.claim("w1", 10)
+        self.assertEqual([job.pk for job in claimed], [job.pk for job in ready])
+        self.assertTrue(all(job.status == Job.Status.RUNNING and job.attempts == 1 for job in claimed))
+        self.assertEqual(jobs.claim("w2", 10), [])
+
+    def test_requeue_stale(self):
+        self.enqueue_emails("a@example.com")
+        jobs.claim("w1", 10)
+        self.assertEqual(jobs.requeue_stale(timeout=60), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(jobs.requeue_stale(timeout=60), 1)
+        self.assertEqual(Job.objects.get().status, Job.Status.QUEUED)
+
+    @override_settings(JOBS_RETRY_BASE_DELAY=10, JOBS_RETRY_MAX_DELAY=60)
+    def test_backoff(self):
+        self.assertEqual([jobs.backoff(n) for n in range(1, 6)], [10, 20, 40, 60, 60])
+
+    def test_batch_retries_only_failed_emails(self):
+        ok, failing = self.enqueue_emails("ok@example.com", "ng@example.com")
+        send = EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].to == ["ng@example.com"]:
+                raise OSError("送信できません")
+            return send(backend, messages)
+
+        with mock.patch.object(EmailBackend, "send_messages", send_messages):
+            self.assertEqual(jobs.work_once("w1"), 2)
+        self.assertEqual([message.to for message in mail.outbox], [["ok@example.com"]])
+        ok.refresh_from_db()
+        failing.refresh_from_db()
+        self.assertEqual(ok.status, Job.Status.DONE)
+        self.assertEqual(failing.status, Job.Status.QUEUED)
+        self.assertIn("送信できません", failing.last_error)
+        self.assertGreater(failing.run_at, timezone.now())
+
+        # リトライでは失敗した分だけを送る
+        Job.objects.filter(pk=failing.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.work_once("w1"), 1)
+        self.assertEqual([message.to for message in mail.outbox], [["ok@example.com"], ["ng@example.com"]])
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_immediately(self):
+        self.assertEqual(self.enqueue_emails("a@example.com"), [None])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Job.objects.exists())
+
+
+@mock.patch("app.routers.replicas", return_value=["replica1"])
+class RouterTests(SimpleTestCase):
+    """読み取りレプリカへのルーティング（app/routers.py と ReplicaRoutingMiddleware）"""
+
+    router = routers.PrimaryReplicaRouter()
+
+    def request(self, cookies=None, write=False):
+        """閲覧系ビューとして 1 リクエストを通し、(Shop を読んだ DB, 書き込み後に読んだ DB, response) を返す"""
+        seen = []
+
+        def view(request):
+            routers.allow_replica()
+            seen.append(self.router.db_for_read(Shop))
+            if write:
+                self.router.db_for_write(Review)
+                seen.append(self.router.db_for_read(Shop))
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        request.COOKIES.update(cookies or {})
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen, response
+
+    def test_outside_requests_read_primary(self, replicas):
+        self.assertEqual(self.router.db_for_read(Shop), routers.PRIMARY)
+
+    def test_sessions_and_auth_always_read_primary(self, replicas):
+        state, token = routers.begin_request()
+        try:
+            routers.allow_replica()
+            self.assertEqual(self.router.db_for_read(Shop), "replica1")
+            for model in (Session, User, ContentType):
+                self.assertEqual(self.router.db_for_read(model), routers.PRIMARY)
+        finally:
+            routers.end_request(token)
+
+    def test_write_pins_rest_of_request_and_sets_cookie(self, replicas):
+        seen, response = self.request(write=True)
+        self.assertEqual(seen, ["replica1", routers.PRIMARY])
+        cookie = response.cookies[ReplicaRoutingMiddleware.cookie_name]
+        self.assertEqual(cookie["max-age"], 5)
+        self.assertGreater(float(cookie.value), time.time())
+
+    def test_sticky_cookie_reads_primary_until_it_expires(self, replicas):
+        name = ReplicaRoutingMiddleware.cookie_name
+        seen, response = self.request(cookies={name: str(time.time() + 5)})
+        self.assertEqual(seen, [routers.PRIMARY])
+        self.assertNotIn(name, response.cookies)
+        self.assertEqual(self.request(cookies={name: str(time.time() - 1)})[0], ["replica1"])
+        self.assertEqual(self.request(cookies={name: "x"})[0], ["replica1"])
+
+    def test_read_only_request_sets_no_cookie(self, replicas):
+        seen, response = self.request()
+        self.assertEqual(seen, ["replica1"])
+        self.assertNotIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+
+
+class FavoriteTests(TestCase):
+    """お気に入りの切り替え（JSON）と favorite_count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fav", password="password")
+        cls.shop = Shop.objects.create(name="店舗")
+
+    def toggle(self, shop_id=None):
+        return self.client.post(reverse("toggle_favorite", args=[shop_id or self.shop.pk]))
+
+    def count(self):
+        return Shop.objects.values_list("favorite_count", flat=True).get(pk=self.shop.pk)
+
+    def test_toggle(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.toggle().json(), {"is_favorite": True, "favorite_count": 1})
+        self.assertEqual(self.toggle().json(), {"is_favorite": False, "favorite_count": 0})
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_remove_is_delete_then_one_update(self):
+        from app.views import _remove_favorite
+
+        Favorite.objects.create(user=self.user, shop=self.shop)
+        Shop.objects.filter(pk=self.shop.pk).update(favorite_count=1)
+        with self.assertNumQueries(4) as ctx:  # SAVEPOINT, DELETE, UPDATE, RELEASE
+            self.assertTrue(_remove_favorite(self.user, self.shop.pk))
+        self.assertEqual([q["sql"].split()[0] for q in ctx.captured_queries[1:3]], ["DELETE", "UPDATE"])
+        self.assertEqual(self.count(), 0)
+        self.assertFalse(_remove_favorite(self.user, self.shop.pk))
+        self.assertEqual(self.count(), 0)
+
+    def test_double_add_counts_once(self):
+        self.client.force_login(self.user)
+        url = reverse("add_favorite", args=[self.shop.pk])
+        self.client.post(url)
+        self.client.post(url)
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.assertEqual(self.count(), 1)
+
+    def test_anonymous_and_unknown_shop_get_json(self):
+        response = self.toggle()
+        self.assertEqual((response.status_code, response["Content-Type"]), (401, "application/json"))
+        self.client.force_login(self.user)
+        response = self.toggle(shop_id=self.shop.pk + 1000)
+        self.assertEqual((response.status_code, response["Content-Type"]), (404, "application/json"))
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_deleting_user_decrements_count(self):
+        other = User.objects.create_user("other")
+        self.client.force_login(self.user)
+        self.toggle()
+        self.client.force_login(other)
+        self.toggle()
+        self.assertEqual(self.count(), 2)
+        other.delete()
+        self.assertEqual(self.count(), 1)
+
+
+class ImportShopsTests(TestCase):
+    """python manage.py import_shops の upsert"""
+
+    def import_csv(self, text):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "shops.csv"
+            path.write_text(text, encoding="utf-8")
+            call_command("import_shops", str(path), stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_partial_catalog_keeps_other_columns(self):
+        self.import_csv(
+            "external_id,name,address,category,detail,price\n"
+            "s1,店舗,東京都新宿区西新宿1-1,和食,説明,3000\n"
+        )
+        self.import_csv("external_id,name\ns1,新しい名前\n")
+        shop = Shop.objects.select_related("category").get(external_id="s1")
+        self.assertEqual(shop.name, "新しい名前")
+        self.assertEqual((shop.address, shop.city, shop.detail, shop.price), ("東京都新宿区西新宿1-1", "新宿区", "説明", 3000))
+        self.assertEqual(shop.category.name, "和食")
+
+    def test_blank_cells_keep_stored_values(self):
+        header = "external_id,name,address,category,detail,price\n"
+        self.import_csv(header + "s1,店舗,東京都新宿区西新宿1-1,和食,説明,3000\ns2,店舗2,,,,\n")
+        # s1 は空のセルだけの行、s2 は値の入った行。同じバッチで別々に upsert される
+        self.import_csv(header + "s1,新しい名前,,,,\ns2,店舗2,大阪府大阪市北区梅田1-1,洋食,,1500\n")
+        shop = Shop.objects.select_related("category").get(external_id="s1")
+        self.assertEqual(shop.name, "新しい名前")
+        self.assertEqual((shop.address, shop.city, shop.detail, shop.price), ("東京都新宿区西新宿1-1", "新宿区", "説明", 3000))
+        self.assertEqual(shop.category.name, "和食")
+        shop = Shop.objects.select_related("category").get(external_id="s2")
+        self.assertEqual((shop.address, shop.city, shop.price, shop.category.name), ("大阪府大阪市北区梅田1-1", "大阪市", 1500, "洋食"))
+
+
+class ExportTests(TestCase):
+    """データ出力（app/exports.py）"""
+
+    def test_csv_escapes_formulas(self):
+        staff = User.objects.create_user("staff", is_staff=True)
+        shop = Shop.objects.create(name="+店舗")
+        Review.objects.create(shop=shop, user=staff, rating=5, content='=HYPERLINK("http://example.com")')
+        self.client.force_login(staff)
+        response = self.client.get(reverse("export_data", args=["reviews"]))
+        body = b"".join(response.streaming_content).decode("utf-8-sig")
+        self.assertIn("'+店舗", body)
+        self.assertIn("'=HYPERLINK", body)
+
+
+class ApiCursorTests(TestCase):
+    """JSON API のカーソルページング（app/api.py）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("api")
+        cls.shops = [Shop.objects.create(name=f"店舗{n}") for n in range(3)]
+        for rating in (3, 4, 5):
+            Review.objects.create(shop=cls.shops[0], user=user, rating=rating, content="")
+
+    def cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+    def collect(self, url):
+        """next をたどって全ページの id を集める"""
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [item["id"] for item in data["results"]]
+            url = data["next"]
+        return ids
+
+    def test_pages_follow_next(self):
+        shops = reverse("api_shop_list")
+        self.assertEqual(self.collect(f"{shops}?limit=1&fields=id"), [shop.pk for shop in self.shops])
+        self.assertEqual(
+            self.collect(f"{shops}?limit=2&sort=favorites&fields=id"), [shop.pk for shop in self.shops],
+        )
+        reviews = reverse("api_review_list", args=[self.shops[0].pk])
+        expected = list(Review.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(self.collect(f"{reviews}?limit=1&fields=id"), expected)
+
+    def test_malformed_cursor_is_400(self):
+        shops = reverse("api_shop_list")
+        reviews = reverse("api_review_list", args=[self.shops[0].pk])
+        for url, cursor in (
+            (shops, self.cursor(["abc"])),
+            (shops, self.cursor([None])),
+            (shops, self.cursor([[1]])),
+            (shops, self.cursor([1, 2])),
+            (shops, "!!!"),
+            (reviews, self.cursor(["x", 1])),
+            (reviews, self.cursor(["2026-01-01T00:00:00", "y"])),
+        ):
+            with self.subTest(url=url, cursor=cursor):
+                response = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.json()["error"])
+
+
+class ShopCacheTests(TestCase):
+    """店舗のキャッシュ（app/shop_cache.py）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="和食")
+        cls.shops = [Shop.objects.create(name=f"店舗{n}", category=cls.category) for n in range(3)]
+
+    def setUp(self):
+        shop_cache.cache().clear()
+
+    def test_get_many_reads_missing_in_one_query(self):
+        first, second, third = self.shops
+        shop_cache.get(first.pk)
+        with self.assertNumQueries(1):
+            shops = shop_cache.get_many([first.pk, second.pk, third.pk, 9999, second.pk])
+        self.assertEqual(sorted(shops), [first.pk, second.pk, third.pk])
+        with self.assertNumQueries(0):  # 存在しない主キーも覚えている
+            shops = shop_cache.get_many([third.pk, 9999])
+            self.assertEqual(shops[third.pk].category.name, "和食")
+        with self.assertNumQueries(0), self.assertRaises(Shop.DoesNotExist):
+            shop_cache.get(9999)
+
+    def test_load_once_shares_one_read_between_threads(self):
+        started, release = threading.Event(), threading.Event()
+        value = (timezone.now(), self.shops[0])
+
+        def slow_load(pk):
+            started.set()
+            release.wait(5)
+            return value
+
+        waiting = threading.Semaphore(0)
+
+        class CountingEvent(threading.Event):
+            def wait(self, timeout=None):
+                waiting.release()
+                return super().wait(timeout)
+
+        results = []
+        with mock.patch.object(shop_cache, "_load_shared", side_effect=slow_load) as load:
+            threads = [threading.Thread(target=lambda: results.append(shop_cache._load_once(1))) for _ in range(5)]
+            threads[0].start()
+            started.wait(5)
+            shop_cache._inflight[1].done = CountingEvent()
+            for thread in threads[1:]:
+                thread.start()
+            for _ in threads[1:]:  # 全員が先に読み込んでいるスレッドを待ち始めてから終わらせる
+                self.assertTrue(waiting.acquire(timeout=5))
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(results, [value] * 5)
+        self.assertEqual(shop_cache._inflight, {})
+
+    def test_signals_update_cache_after_commit(self):
+        shop = self.shops[0]
+        shop_cache.get(shop.pk)
+        shop.name = "新しい名前"
+        with self.captureOnCommitCallbacks() as callbacks:
+            shop.save()
+            self.assertEqual(shop_cache.get(shop.pk).name, "店舗0")  # コミット前は古いまま
+        for callback in callbacks:
+            callback()
+        self.assertEqual(shop_cache.get(shop.pk).name, "新しい名前")
+
+        # ロールバックした保存はキャッシュに入らない
+        try:
+            with transaction.atomic():
+                shop.name = "取り消す名前"
+                shop.save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(shop_cache.get(shop.pk).name, "新しい名前")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "洋食"
+            self.category.save()
+        self.assertEqual(shop_cache.get(shop.pk).category.name, "洋食")
+
+
+class TrendingTests(TestCase):
+    """「いま人気」のスコア（app/trending.py）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("trend")
+        cls.category = Category.objects.create(name="和食")
+        cls.shop = Shop.objects.create(name="店舗A", category=cls.category)
+        cls.other = Shop.objects.create(name="店舗B")
+
+    def setUp(self):
+        cache.clear()
+
+    def score(self, shop):
+        return Shop.objects.values_list("trending_score", flat=True).get(pk=shop.pk)
+
+    def test_bump_adds_weights_in_log_space(self):
+        now = timezone.now()
+        trending.bump(self.shop.pk, "review", now)
+        trending.bump(self.shop.pk, "reservation", now)
+        self.assertAlmostEqual(self.score(self.shop), trending.log_weight("review", now) + math.log(5 / 2))
+
+    def test_one_half_life_halves_the_weight(self):
+        now = timezone.now()
+        hours = timedelta(hours=trending.half_life_hours())
+        trending.bump(self.shop.pk, "reservation", now - hours)  # 3.0 が半分になって 1.5
+        trending.bump(self.other.pk, "review", now)              # 2.0
+        self.assertAlmostEqual(self.score(self.other) - self.score(self.shop), math.log(2 / 1.5))
+
+    def test_review_is_one_update_with_decay(self):
+        half_life = timedelta(hours=trending.half_life_hours())
+        trending.bump(self.shop.pk, "review", timezone.now() - half_life)  # 2.0 が半分になって 1.0
+        with self.assertNumQueries(2) as ctx:  # INSERT と店舗の UPDATE
+            review = Review.objects.create(shop=self.shop, user=self.user, rating=5, content="良い")
+        update = ctx.captured_queries[1]["sql"]
+        self.assertIn('"reviews_updated_at"', update)
+        self.assertIn('"trending_score"', update)
+        # ln(1.0 × e^x + 2.0 × e^x) = ln 2.0 + x + ln 1.5
+        self.assertAlmostEqual(self.score(self.shop), trending.log_weight("review", review.created_at) + math.log(1.5))
+
+    def test_top_shops_filters_and_caches(self):
+        trending.bump(self.shop.pk, "review")
+        trending.bump(self.other.pk, "reservation")
+        self.assertEqual(trending.top_shops(), [self.other, self.shop])
+        self.assertEqual(trending.top_shops(self.category.pk), [self.shop])
+        with self.assertNumQueries(0):
+            self.assertEqual(trending.top_shops(self.category.pk)[0].category, self.category)
+
+    def test_refresh_recomputes_and_clears_cache(self):
+        review = Review.objects.create(shop=self.shop, user=self.user, rating=5, content="良い")
+        self.assertGreater(self.score(self.shop), 0)  # 保存したときに加算される
+        self.assertEqual(trending.top_shops(), [self.shop])
+        Favorite.objects.create(user=self.user, shop=self.other)
+        review.delete()
+        self.assertEqual(trending.refresh(), 1)
+        self.assertEqual(self.score(self.shop), 0)
+        self.assertAlmostEqual(self.score(self.other), trending.compute()[self.other.pk])
+        self.assertEqual(trending.top_shops(), [self.other])
+
+
+class AreaTests(TestCase):
+    """住所からのエリアの取り出しと ?area= の絞り込み（app/areas.py）"""
+
+    def test_parse(self):
+        cases = {
+            "〒150-0002 東京都渋谷区渋谷２−１−１": ("東京都", "渋谷区", ""),
+            "大阪府大阪市北区梅田1-1": ("大阪府", "大阪市", "北区"),
+            "横浜市中区山下町1": ("神奈川県", "横浜市", "中区"),          # 政令指定都市から都道府県を補う
+            "四日市市諏訪町1": ("三重県", "四日市市", ""),                 # 名前の途中に「市」
+            "長野県北佐久郡軽井沢町軽井沢1": ("長野県", "北佐久郡軽井沢町", ""),
+            "神奈川県鎌倉市御成町1": ("神奈川県", "鎌倉市", ""),
+            "": ("", "", ""),
+        }
+        for address, expected in cases.items():
+            with self.subTest(address=address):
+                self.assertEqual(areas.parse(address), areas.Area(*expected))
+
+    def test_apply_on_save(self):
+        shop = Shop.objects.create(name="店舗", address="大阪府大阪市北区梅田1-1")
+        self.assertEqual((shop.prefecture, shop.city, shop.ward), ("大阪府", "大阪市", "北区"))
+        shop.address = "東京都渋谷区渋谷2-1-1"
+        shop.save()
+        shop.refresh_from_db()
+        self.assertEqual((shop.prefecture, shop.city, shop.ward), ("東京都", "渋谷区", ""))
+
+    def test_param_round_trip(self):
+        self.assertEqual(areas.format_param("神奈川県", "横浜市", "中区"), "神奈川県/横浜市/中区")
+        self.assertEqual(areas.format_param("東京都", "渋谷区"), "東京都/渋谷区")
+        self.assertEqual(areas.parse_param("神奈川県/横浜市/中区/余分"), {"prefecture": "神奈川県", "city": "横浜市", "ward": "中区"})
+        self.assertEqual(areas.parse_param("/東京都/"), {"prefecture": "東京都"})
+        self.assertEqual(areas.parse_param(None), {})
+
+    def test_area_facets_go_one_level_down(self):
+        for address in ("大阪府大阪市北区梅田1-1", "大阪府大阪市北区梅田2-1", "大阪府大阪市中央区難波1-1",
+                        "大阪府堺市堺区1-1", "東京都渋谷区渋谷2-1-1", ""):
+            Shop.objects.create(name="店舗", address=address)
+
+        def facets(area=None):
+            return [(f["label"], f["value"], f["count"]) for f in area_facets({"area": area} if area else {})]
+
+        self.assertEqual(facets(), [("大阪府", "大阪府", 4), ("東京都", "東京都", 1)])
+        self.assertEqual(facets("大阪府"), [("大阪市", "大阪府/大阪市", 3), ("堺市", "大阪府/堺市", 1)])
+        self.assertEqual(facets("大阪府/大阪市"), [("北区", "大阪府/大阪市/北区", 2), ("中央区", "大阪府/大阪市/中央区", 1)])
+        self.assertEqual(facets("大阪府/大阪市/北区"), [])
+
+
+class GeoTests(TestCase):
+    """店舗の位置と「近くのお店」（app/geo.py）"""
+
+    def test_locate_uses_ward_or_city_only(self):
+        centroids = geo.centroids()
+        self.assertEqual(geo.locate("神奈川県", "横浜市", "中区"), centroids["神奈川県/横浜市/中区"])
+        self.assertEqual(geo.locate("神奈川県", "横浜市", "存在しない区"), centroids["神奈川県/横浜市"])
+        self.assertEqual(geo.locate("東京都", "渋谷区"), centroids["東京都/渋谷区"])
+        # 表に無い市町村・都道府県だけでは位置を決めない（県庁の位置にしない）
+        self.assertIsNone(geo.locate("神奈川県", "鎌倉市"))
+        self.assertIsNone(geo.locate("神奈川県"))
+
+    def test_unlocated_shops_are_not_nearby(self):
+        yokohama = Shop.objects.create(name="横浜の店", address="神奈川県横浜市中区山下町1")
+        kamakura = Shop.objects.create(name="鎌倉の店", address="神奈川県鎌倉市御成町1")
+        self.assertEqual((kamakura.latitude, kamakura.longitude, kamakura.geo_cell), (None, None, None))
+        latitude, longitude = geo.locate("神奈川県", "横浜市", "中区")
+        found = geo.nearby(Shop.objects.all(), latitude, longitude, radius_km=30)
+        self.assertEqual([shop_id for shop_id, _ in found], [yokohama.pk])
+        self.assertAlmostEqual(found[0][1], 0)
+
+
+class ComputeSimilarShopsTests(TestCase):
+    """python manage.py compute_similar_shops"""
+
+    def test_full_and_incremental(self):
+        users = [User.objects.create_user(f"u{n}") for n in range(2)]
+        shops = [Shop.objects.create(name=f"店舗{n}") for n in range(2)]
+        for user in users:
+            for shop in shops:
+                Favorite.objects.create(user=user, shop=shop)
+        out = io.StringIO()
+        call_command("compute_similar_shops", stdout=out)
+        self.assertIn("2 店舗を計算しました", out.getvalue())
+        self.assertEqual(
+            list(ShopSimilarity.objects.filter(shop=shops[0]).values_list("similar_id", flat=True)), [shops[1].pk],
+        )
+        call_command("compute_similar_shops", "--incremental", stdout=io.StringIO())
+
+
+class PrerenderTests(TestCase):
+    """静的ページ（app/prerender.py）が update() での変更の後に古いまま返らないこと"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(
+            PRERENDER_ROOT=Path(tmp.name), PRERENDER_BASE_URL="http://testserver",
+        ))
+        self.shop = Shop.objects.create(name="店舗", price=1000, category=Category.objects.create(name="和食"))
+
+    def test_admin_price_action_invalidates_page(self):
+        self.assertEqual(prerender.build()["failed"], 0)
+        page = prerender.root() / prerender.shop_file(self.shop.pk)
+        self.assertTrue(page.is_file())
+
+        admin = User.objects.create_superuser("admin")
+        self.client.force_login(admin)
+        self.client.post(reverse("admin:app_shop_changelist"), {
+            "action": "update_price", "_selected_action": [self.shop.pk], "price": "2500",
+        })
+        self.assertFalse(page.is_file())
+        # 料金は一覧に出ないので、一覧のファイルは残す
+        self.assertTrue((prerender.root() / prerender.INDEX_FILE).is_file())
+        self.assertTrue((prerender.root() / prerender.category_file(self.shop.category_id)).is_file())
+
+        # updated_at も変わるので、次の書き出しで描画し直す
+        self.client.logout()
+        self.assertEqual(prerender.build()["rendered"], 3)
+        self.assertIn("2500", page.read_text(encoding="utf-8"))
+
+    def test_listings_are_kept_unless_a_listed_field_changes(self):
+        from app.views import _add_favorite
+
+        other = Category.objects.create(name="洋食")
+        prerender.build()
+        base = prerender.root()
+        index, page = base / prerender.INDEX_FILE, base / prerender.shop_file(self.shop.pk)
+        old_category, new_category = (base / prerender.category_file(c.pk) for c in (self.shop.category, other))
+
+        _add_favorite(User.objects.create_user("fav"), self.shop.pk)
+        Review.objects.create(shop=self.shop, user=User.objects.get(username="fav"), rating=4, content="良い")
+        shop = Shop.objects.get(pk=self.shop.pk)
+        shop.price = 3000
+        shop.save()
+        self.assertFalse(page.is_file())
+        self.assertTrue(index.is_file() and old_category.is_file() and new_category.is_file())
+
+        shop.category = other
+        shop.save()
+        self.assertFalse(index.is_file() or old_category.is_file() or new_category.is_file())
+
+
+@override_settings(STREAMING_RENDER=True)
+class StreamingRenderTests(TestCase):
+    """<head> を先に送るページ（app/streaming.py）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("streaming")
+        cls.shop = Shop.objects.create(name="店舗")
+
+    def test_detail_then_post_review_with_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.get(reverse("shop_detail", args=[self.shop.pk]))
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn("csrftoken", response.cookies)
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', body).group(1)
+
+        response = client.post(reverse("shop_detail", args=[self.shop.pk]), {
+            "csrfmiddlewaretoken": token, "content": "おいしい", "rating": 5,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Review.objects.filter(shop=self.shop).count(), 1)
+
+    def test_gzip_matches_normal_render(self):
+        url = reverse("shop_detail", args=[self.shop.pk])
+        with override_settings(STREAMING_RENDER=False):
+            expected = self.client.get(url).content
+        response = self.client.get(url, headers={"accept-encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(gzip.decompress(b"".join(chunks)), expected)
+
+    def test_chunks_are_cut_at_chunk_size(self):
+        parts = ["ab", "cdefghij", streaming.FLUSH, "k", "あいうえお"]
+        with mock.patch.object(streaming, "CHUNK_SIZE", 4):
+            chunks = list(streaming._chunks(iter(parts)))
+        self.assertEqual(chunks, [b"abcd", b"efgh", b"ij", "kあいう".encode(), "えお".encode()])
+
+    def test_content_block_is_rendered_node_by_node(self):
+        engine = Engine(loaders=[("django.template.loaders.locmem.Loader", {
+            "base.html": "<head>{% block title %}T{% endblock %}</head>{% block content %}base{% endblock %}",
+            "page.html": "{% extends 'base.html' %}{% block content %}{{ block.super }}<p>{{ a }}</p>"
+                         "{% for i in items %}{{ i }}{% endfor %}{% block inner %}in{% endblock %}{% endblock %}",
+        })])
+        template = engine.get_template("page.html")
+        values = {"a": 1, "items": [1, 2, 3]}
+        parts = list(streaming.iter_template(template, Context(values)))
+        self.assertEqual(parts, ["<head>", "T", "</head>", streaming.FLUSH, "base", "<p>", "1", "</p>", "123", "in"])
+        self.assertEqual("".join(p for p in parts if p is not streaming.FLUSH), template.render(Context(values)))
+
+
+def png(width=40, height=20, color=(200, 30, 30)):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return SimpleUploadedFile("shop.png", buffer.getvalue(), content_type="image/png")
+
+
+class ImageTests(TestCase):
+    """派生画像（app/images.py）とプレースホルダー、{% picture %}"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=tmp.name, JOBS_EAGER=True, IMAGE_VARIANTS={"thumb": 10, "card": 80},
+        ))
+
+    def create_shop(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Shop.objects.create(name="店舗", **kwargs)
+
+    def test_variants_and_picture_tag(self):
+        shop = self.create_shop(img=png())
+        shop.refresh_from_db()
+        variants = shop.img_variants["variants"]
+        self.assertEqual(shop.img_variants["source"], shop.img.name)
+        # 元画像より大きくはしない
+        self.assertEqual({name: (v["width"], v["height"]) for name, v in variants.items()},
+                         {"thumb": (10, 5), "card": (40, 20)})
+        html = Template('{% load image_tags %}{% picture shop alt="店舗" %}').render(Context({"shop": shop}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(f'{variants["thumb"]["webp"]} 10w', html)
+        self.assertIn('width="40" height="20"', html)
+        self.assertIn(shop.img_color, html)
+
+    def test_default_image_does_not_queue_variants(self):
+        with mock.patch.object(jobs, "enqueue") as enqueue:
+            shop = self.create_shop()
+            shop.name = "名前を変更"
+            with self.captureOnCommitCallbacks(execute=True):
+                shop.save()
+        enqueue.assert_not_called()
+        self.assertEqual(shop.img.name, "noImage.png")
+        html = Template("{% load image_tags %}{% picture shop %}").render(Context({"shop": shop}))
+        self.assertTrue(html.startswith("<img "))
+
+    def test_placeholder_is_computed_only_when_the_image_changes(self):
+        with mock.patch.object(images, "placeholder", wraps=images.placeholder) as placeholder:
+            shop = self.create_shop(img=png())
+            self.assertEqual(placeholder.call_count, 1)
+            self.assertEqual((shop.img_width, shop.img_height, shop.img_color), (40, 20, "#c81e1e"))
+            self.assertTrue(shop.img_placeholder.startswith("data:image/webp;base64,"))
+
+            shop = Shop.objects.get(pk=shop.pk)
+            shop.name = "名前を変更"
+            shop.save()
+            Shop.objects.only("pk", "name").get(pk=shop.pk).save(update_fields=["name"])
+            self.assertEqual(placeholder.call_count, 1)
+
+            shop.img = png(10, 30, (0, 0, 255))
+            shop.save()
+            self.assertEqual(placeholder.call_count, 2)
+            self.assertEqual((shop.img_width, shop.img_height, shop.img_color), (10, 30, "#0000ff"))
+
+    def test_existing_variants_are_not_queued_again(self):
+        shop = self.create_shop(img=png())
+        shop.refresh_from_db()
+        with mock.patch.object(jobs, "enqueue") as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                shop.save()
+        enqueue.assert_not_called()
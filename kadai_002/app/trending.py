@@ -0,0 +1,122 @@
+# app/trending.py
+"""
+「いま人気」のランキング（時間で減衰するスコア）
+
+レビュー・予約・お気に入りのたびに、その店舗の Shop.trending_score を加算する。
+スコアは半減期 TRENDING_HALF_LIFE_HOURS で指数的に減衰させたいが、全店舗を
+毎回減らすことはできないので、固定の起点 EPOCH からの時間で重みを
+増やしていく形にして対数で持つ（出来事の無い店舗は 0）:
+
+    trending_score = ln( Σ 重み × exp(λ × (発生時刻 - 起点)) )   λ = ln2 / 半減期
+
+どの店舗も同じ割合で減衰するので、この値の大小がそのまま「いまの人気」の順になる
+（trending_score にインデックスを張って並べ替えられる）。加算は 1 回の UPDATE で、
+ln(exp(a) + exp(b)) = max(a, b) + ln(1 + exp(min(a, b) - max(a, b))) を SQL で計算する。
+
+python manage.py refresh_trending は直近の行から全店舗のスコアを計算し直す
+（削除されたレビューや取り消された予約の分のずれを直す）。定期的に実行する。
+"""
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from .models import Favorite, Reservation, Review, Shop
+
+# スコアの起点。変えると保存済みのスコアと比べられなくなる（変えたら refresh_trending を実行する）
+EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+CACHE_TIMEOUT = 60       # カテゴリごとの上位リストのキャッシュ秒数
+TOP_N = 6
+BATCH_SIZE = 1000
+
+
+def half_life_hours():
+    return getattr(settings, "TRENDING_HALF_LIFE_HOURS", 72)
+
+
+def weights():
+    return getattr(settings, "TRENDING_WEIGHTS", {"review": 2.0, "reservation": 3.0, "favorite": 1.0})
+
+
+def log_weight(kind, at):
+    """1 件の出来事がスコアに足す量（対数）"""
+    rate = math.log(2) / (half_life_hours() * 3600)
+    return math.log(weights()[kind]) + rate * (at - EPOCH).total_seconds()
+
+
+def bumped(kind, at=None):
+    """出来事 1 件分を加算した trending_score の式（他の列の UPDATE にまとめるとき用）"""
+    x = Value(log_weight(kind, at or timezone.now()))
+    score = F("trending_score")
+    return Greatest(score, x) + Ln(1 + Exp(Least(score, x) - Greatest(score, x)))
+
+
+def bump(shop_id, kind, at=None):
+    """出来事 1 件分を加算する（1 回の UPDATE）"""
+    Shop.objects.filter(pk=shop_id).update(trending_score=bumped(kind, at))
+
+
+def window():
+    """これより古い出来事は重みが 1/1024 未満なので計算し直しでは無視する"""
+    return datetime.timedelta(hours=half_life_hours() * 10)
+
+
+def events(since):
+    """(店舗 ID, 種類, 発生時刻) を順に返す"""
+    sources = (
+        ("review", Review.objects.filter(created_at__gte=since)),
+        ("reservation", Reservation.objects.filter(created_at__gte=since)),
+        ("favorite", Favorite.objects.filter(created_at__gte=since)),
+    )
+    for kind, queryset in sources:
+        for shop_id, at in queryset.order_by().values_list("shop_id", "created_at").iterator(chunk_size=5000):
+            yield shop_id, kind, at
+
+
+def compute(now=None):
+    """{店舗 ID: スコア}（直近 window() の出来事から）"""
+    since = (now or timezone.now()) - window()
+    totals = defaultdict(list)
+    for shop_id, kind, at in events(since):
+        totals[shop_id].append(log_weight(kind, at))
+    scores = {}
+    for shop_id, values in totals.items():
+        top = max(values)
+        scores[shop_id] = top + math.log(sum(math.exp(v - top) for v in values))
+    return scores
+
+
+def refresh():
+    """全店舗のスコアを計算し直して、更新した店舗数を返す"""
+    scores = compute()
+    with transaction.atomic():
+        # 出来事の無くなった店舗は 0（最下位）に戻す
+        Shop.objects.exclude(pk__in=list(scores)).exclude(trending_score=0).update(trending_score=0)
+        shops = [Shop(pk=shop_id, trending_score=score) for shop_id, score in scores.items()]
+        Shop.objects.bulk_update(shops, ["trending_score"], batch_size=BATCH_SIZE)
+    categories = Shop.objects.order_by().values_list("category_id", flat=True).distinct()
+    cache.delete_many([cache_key(None), *(cache_key(c) for c in categories)])
+    return len(shops)
+
+
+def cache_key(category_id):
+    return f"trending:top:{category_id or 'all'}"
+
+
+def top_shops(category_id=None, limit=TOP_N):
+    """カテゴリごとの上位の店舗（CACHE_TIMEOUT 秒キャッシュする）"""
+    key = cache_key(category_id)
+    shops = cache.get(key)
+    if shops is None:
+        queryset = Shop.objects.filter(trending_score__gt=0).select_related("category")
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+        shops = list(queryset.order_by("-trending_score", "id")[:limit])
+        cache.set(key, shops, CACHE_TIMEOUT)
+    return shops
@@ -1,9 +1,10 @@
 from django.urls import path
-from . import views
+from . import api, views
 from .views import MemberProfileUpdateView,ReviewUpdateView, ReviewDeleteView
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
+from .forms import QueuedPasswordResetForm
 
 urlpatterns = [
     # ショップ関連
@@ -45,7 +46,8 @@ urlpatterns = [
     # パスワードリセット
     path("password_reset/", 
          auth_views.PasswordResetView.as_view(
-             template_name="app/password_reset.html"
+             template_name="app/password_reset.html",
+             form_class=QueuedPasswordResetForm,
          ), 
          name="password_reset"),
 
@@ -70,7 +72,20 @@ urlpatterns = [
     # urls.py
     path("favorite/add/<int:shop_id>/", views.add_favorite, name="add_favorite"),
     path("favorite/remove/<int:shop_id>/", views.remove_favorite, name="remove_favorite"),
+    path("favorite/toggle/<int:shop_id>/", views.toggle_favorite, name="toggle_favorite"),
     path("favorites/", views.my_favorite_list, name="my_favorite_list"),
+
+    # データ出力（スタッフのみ）
+    path("export/<str:dataset>/", views.export_data, name="export_data"),
+
+    # 読み取り専用の JSON API（app/api.py）
+    path("api/shops/", api.shop_list, name="api_shop_list"),
+    path("api/shops/<int:pk>/", api.shop_detail, name="api_shop_detail"),
+    path("api/shops/<int:pk>/reviews/", api.review_list, name="api_review_list"),
+    path("api/categories/", api.category_list, name="api_category_list"),
+
+    # Prometheus のメトリクス（トークンかスタッフのみ）
+    path("metrics/", views.metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
@@ -1,4 +1,8 @@
-import stripe
+import datetime
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import TemplateView, ListView
 from django.views.generic.edit import CreateView, UpdateView,DeleteView
@@ -10,55 +14,156 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.conf import settings
 from django.contrib.auth import login, logout
+from django.db import IntegrityError, router as db_router, transaction
+from django.db.models import F
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.http import require_POST
 
 from .models import Shop, Review, Category, Reservation, Company, MemberProfile, Favorite
 from .forms import RegisterForm, ReviewForm, ReservationForm, MemberProfileForm
+from .routers import use_replica
+from .filters import area_facets, filter_shops, nearby_shops
+from . import areas, exports, lazy, metrics, prerender, recommendations, shop_cache, streaming, trending
+
+# Stripe SDK は import が重いので、決済のページで初めて使う時に読み込む（app/lazy.py）
+stripe = lazy.module("stripe", configure=lambda module: setattr(module, "api_key", settings.STRIPE_SECRET_KEY))
+
+# ----------------------------
+# 非同期ビューの共通部分
+# ----------------------------
+# 閲覧の多いページ（店舗一覧・詳細・会社情報・お気に入り一覧）と JSON API は非同期ビュー。
+# ASGI ではクエリを待つ間にスレッドを占有せず、イベントループは他のリクエストを進められる。
+# ORM は thread_sensitive な sync_to_async で 1 本のスレッドで順に動くので、1 つのリクエストの
+# クエリは並行にはならない（asyncio.gather でまとめても速くならない）。順に await する。
+# WSGI でも Django がイベントループを用意して同じように動く。
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def auser(request):
+    """ログイン中のユーザー。テンプレートの request.user でもう一度読まないように差し替える"""
+    request.user = await request.auser()
+    return request.user
+
+
+async def arender(request, template_name, context=None):
+    # テンプレートの描画は同期処理（テンプレート内の遅延評価の SQL も含む）なのでスレッドで行う
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def astream(request, template_name, context=None, csrf=False):
+    """<head> とヘッダーを先に送る（STREAMING_RENDER = False なら arender と同じ。app/streaming.py）"""
+    if not streaming.enabled():
+        return await arender(request, template_name, context)
+    return streaming.render(request, template_name, context, csrf=csrf)
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
 # ----------------------------
 # Shop関連
 # ----------------------------
-class ShopListView(ListView):
-    model = Shop
+class ShopListView(View):
     template_name = 'app/shop_list.html'
-    context_object_name = 'shops'
     paginate_by = 9  # 1ページあたりの表示件数
+    use_replica = True  # 読み込みはレプリカへ（app/routers.py）
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        keyword = self.request.GET.get('keyword', '')
-        category_id = self.request.GET.get('category_id', '')
-
-        if keyword:
-            queryset = queryset.filter(name__icontains=keyword)
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
-        
-        return queryset.order_by('id')
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['keyword'] = self.request.GET.get('keyword', '')
-        context['selected_category'] = self.request.GET.get('category_id', '')
-        return context
-
-class ShopDetailView(TemplateView):
-    template_name = 'app/shop_detail.html'
+    async def get(self, request):
+        params = request.GET
+        try:
+            found = await sync_to_async(nearby_shops)(params)
+        except ValueError:
+            found = None  # 不正な lat・lng は指定されなかったものとして扱う
+        page = await self.paginate(found)
+        categories = await alist(Category.objects.all())
+        # いま人気の店舗（カテゴリごとに数十秒キャッシュ）
+        trending_shops = await sync_to_async(trending.top_shops)(params.get('category_id') or None)
+        facets = await sync_to_async(area_facets)(params)
+        await auser(request)
+        # エリアで探す（app/areas.py）。リンクは他の絞り込み条件を引き継ぐ
+        selected = areas.parse_param(params.get('area'))
+        return await astream(request, self.template_name, {
+            'shops': page.object_list,
+            'page_obj': page,
+            'paginator': page.paginator,
+            'is_paginated': page.has_other_pages(),
+            'categories': categories,
+            'keyword': params.get('keyword', ''),
+            'selected_category': params.get('category_id', ''),
+            'selected_sort': params.get('sort', ''),
+            'nearby': found is not None,
+            'trending_shops': trending_shops,
+            'area_facets': [{**facet, 'query': self._area_query(facet['value'])} for facet in facets],
+            'area_breadcrumbs': [{'label': '全国', 'query': self._area_query('')}] + [
+                {'label': name, 'query': self._area_query(areas.format_param(*list(selected.values())[:i + 1]))}
+                for i, name in enumerate(selected.values())
+            ],
+        })
 
-    def get(self, request, pk):
-        shop = get_object_or_404(Shop, pk=pk)
-        reviews = shop.reviews.all()
-        form = ReviewForm()
-        return render(request, self.template_name, {
+    async def paginate(self, found):
+        """
+        ページ（Page）を返す。絞り込み・並び順（?sort=...）は JSON API と共通（app/filters.py）。
+        ?lat=&lng= があれば近い順（app/geo.py）で、距離は shop.distance に入れる
+        """
+        if found is None:
+            queryset = filter_shops(self.request.GET).select_related('category')
+            paginator = Paginator(queryset, self.paginate_by)
+            paginator.count = await queryset.acount()
+        else:
+            paginator = Paginator(found, self.paginate_by)
+        number = self.request.GET.get('page') or 1
+        try:
+            page = paginator.page(paginator.num_pages if number == 'last' else number)
+        except InvalidPage:
+            raise Http404('ページが見つかりません')
+
+        if found is None:
+            page.object_list = await alist(page.object_list)
+        else:
+            ids = [shop_id for shop_id, _ in page.object_list]
+            shops = await shop_cache.aget_many(ids)
+            for shop_id, distance in page.object_list:
+                if shop_id in shops:
+                    shops[shop_id].distance = distance
+            page.object_list = [shops[shop_id] for shop_id in ids if shop_id in shops]
+        return page
+
+    def _area_query(self, area):
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        if area:
+            params['area'] = area
+        else:
+            params.pop('area', None)
+        return params.urlencode()
+
+class ShopDetailView(View):
+    template_name = 'app/shop_detail.html'
+    use_replica = True  # POST（レビュー投稿）はプライマリ
+
+    async def get(self, request, pk):
+        user = await auser(request)
+        # 店舗はキャッシュから（app/shop_cache.py）
+        shop = await shop_cache.aget_or_404(pk)
+        is_favorite = await self.is_favorite(user, pk)
+        # compute_similar_shops で計算済みのもの（app/recommendations.py）
+        similar_shops = await alist(recommendations.for_shop(pk))
+        # フォーム（レビュー・お気に入り）があるので、CSRF の Cookie をヘッダーより先に用意する
+        return await astream(request, self.template_name, {
             'shop': shop,
-            'reviews': reviews,
-            'form': form,
-        })
+            'reviews': Review.objects.filter(shop_id=pk).select_related('user'),
+            'form': ReviewForm(),
+            'is_favorite': is_favorite,
+            'similar_shops': similar_shops,
+        }, csrf=True)
 
-    def post(self, request, pk):
-        shop = get_object_or_404(Shop, pk=pk)
+    async def is_favorite(self, user, pk):
+        return user.is_authenticated and await Favorite.objects.filter(user=user, shop_id=pk).aexists()
+
+    async def post(self, request, pk):
+        # レビューの保存（シグナルでのスコア更新なども含む）は同期のまま行う
+        return await sync_to_async(self.save_review)(request, pk)
+
+    def save_review(self, request, pk):
+        shop = shop_cache.get_or_404(pk)
         if not request.user.is_authenticated:
             return redirect('login')
         form = ReviewForm(request.POST)
@@ -73,6 +178,7 @@ class ShopDetailView(TemplateView):
             'shop': shop,
             'reviews': reviews,
             'form': form,
+            'similar_shops': recommendations.for_shop(pk),
         })
 
 
@@ -146,7 +252,7 @@ def create_subscription(request):
 # ----------------------------
 @login_required
 def make_reservation(request, shop_id):
-    shop = get_object_or_404(Shop, pk=shop_id)
+    shop = shop_cache.get_or_404(shop_id)
   
     if request.method == 'POST':
         form = ReservationForm(request.POST)
@@ -223,7 +329,7 @@ def reservation_complete(request, reservation_id):
 # ----------------------------
 class CreateCheckoutSessionView(View):
     def post(self, request, pk):
-        shop = get_object_or_404(Shop, pk=pk)
+        shop = shop_cache.get_or_404(pk)
         checkout_session = stripe.checkout.Session.create(
             payment_method_types=['card'],
             line_items=[{
@@ -246,11 +352,13 @@ class SuccessPageView(TemplateView):
 class CancelPageView(TemplateView):
     template_name = 'app/cancel.html'
 
-def company_detail(request):
-    company = Company.objects.first()  # 最初の1件を取得
+@use_replica
+async def company_detail(request):
+    company = await Company.objects.afirst()  # 最初の1件を取得
+    await auser(request)
     if not company:
-        return render(request, 'app/company_not_found.html')
-    return render(request, 'app/company_detail.html', {'company': company})
+        return await arender(request, 'app/company_not_found.html')
+    return await arender(request, 'app/company_detail.html', {'company': company})
 
 #stripeの解約
 @login_required
@@ -305,24 +413,126 @@ class MemberProfileUpdateView(LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         return reverse("member_edit")
 
-# ★ お気に入り登録
+# ★ お気に入りの追加・解除
+# Shop を取得せず、Favorite の INSERT/DELETE と favorite_count の UPDATE だけで済ませる
+# （ユーザーの削除による減算は signals の pre_delete で行う）
+def _add_favorite(user, shop_id):
+    """お気に入りに追加する。新しく追加した場合 True。店舗が存在しなければ Http404。"""
+    try:
+        with transaction.atomic():
+            # 「いま人気」のスコア（app/trending.py）も同じ UPDATE で加算する
+            bumped = Shop.objects.filter(pk=shop_id).update(
+                favorite_count=F('favorite_count') + 1, trending_score=trending.bumped('favorite'),
+            )
+            if not bumped:
+                raise Http404
+            Favorite.objects.create(user=user, shop_id=shop_id)
+    except IntegrityError:
+        # 登録済み（カウントの UPDATE もロールバックされる）
+        return False
+    shop_cache.invalidate(shop_id)  # favorite_count が変わった
+    prerender.invalidate(shop_id, listings=False)  # お気に入り数は一覧に出ない（app/prerender.py）
+    return True
+
+
+def _remove_favorite(user, shop_id):
+    """お気に入りを解除する。解除した場合 True。"""
+    with transaction.atomic():
+        # Favorite には削除のシグナルが無いので、SELECT せずに 1 回の DELETE になる
+        deleted, _ = Favorite.objects.filter(user=user, shop_id=shop_id).delete()
+        if deleted:
+            Shop.objects.filter(pk=shop_id, favorite_count__gt=0).update(favorite_count=F('favorite_count') - 1)
+    if deleted:
+        shop_cache.invalidate(shop_id)
+        prerender.invalidate(shop_id, listings=False)
+    return bool(deleted)
+
+
 @login_required
+@require_POST
 def add_favorite(request, shop_id):
-    shop = get_object_or_404(Shop, id=shop_id)
-    Favorite.objects.get_or_create(user=request.user, shop=shop)
+    _add_favorite(request.user, shop_id)
     return redirect('shop_detail', pk=shop_id)
 
 
-# ★ お気に入り解除
 @login_required
+@require_POST
 def remove_favorite(request, shop_id):
-    shop = get_object_or_404(Shop, id=shop_id)
-    Favorite.objects.filter(user=request.user, shop=shop).delete()
+    _remove_favorite(request.user, shop_id)
     return redirect('shop_detail', pk=shop_id)
 
 
+# ★ お気に入り切り替え（JSON）
+# fetch() から呼ぶので、未ログイン・存在しない店舗もログイン画面や HTML の 404 ではなく JSON で返す
+@require_POST
+def toggle_favorite(request, shop_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'ログインしてください'}, status=401)
+    if _remove_favorite(request.user, shop_id):
+        is_favorite = False
+    else:
+        try:
+            _add_favorite(request.user, shop_id)
+        except Http404:
+            return JsonResponse({'error': '店舗が見つかりません'}, status=404)
+        is_favorite = True
+    favorite_count = Shop.objects.filter(pk=shop_id).values_list('favorite_count', flat=True).first()
+    return JsonResponse({'is_favorite': is_favorite, 'favorite_count': favorite_count})
+
+
 # ★ 自分のお気に入り一覧
 @login_required
-def my_favorite_list(request):
-    favorites = Favorite.objects.filter(user=request.user).select_related('shop')
-    return render(request, "app/my_favorite_list.html", {"favorites": favorites}) 
+@use_replica
+async def my_favorite_list(request):
+    user = await auser(request)
+    favorites = await alist(Favorite.objects.filter(user=user).select_related('shop'))
+    return await arender(request, "app/my_favorite_list.html", {"favorites": favorites})
+
+
+# ----------------------------
+# データ出力（運営者向け）
+# ----------------------------
+@login_required
+@use_replica
+def export_data(request, dataset):
+    if not request.user.is_staff:
+        return redirect('shop_list')
+    if dataset not in exports.DATASETS:
+        raise Http404
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest('format は csv か jsonl を指定してください')
+    gzip = request.GET.get('gzip') == '1'
+    filters = {
+        'shop': request.GET.get('shop'),
+        'date_from': request.GET.get('date_from'),
+        'date_to': request.GET.get('date_to'),
+    }
+    # 出力を始めてからエラーにならないよう、先に値を確かめる
+    try:
+        if filters['shop']:
+            filters['shop'] = int(filters['shop'])
+        for key in ('date_from', 'date_to'):
+            if filters[key]:
+                filters[key] = datetime.date.fromisoformat(filters[key])
+    except ValueError:
+        return HttpResponseBadRequest('shop / date_from / date_to の形式が正しくありません')
+    # 行はレスポンスを返した後（@use_replica の範囲の外）で読むので、読む DB をここで決める
+    using = db_router.db_for_read(Reservation)
+    response = StreamingHttpResponse(
+        exports.stream(dataset, fmt, filters, gzip=gzip, using=using),
+        content_type='application/gzip' if gzip else f'{exports.FORMATS[fmt]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(dataset, fmt, gzip)}"'
+    return response
+
+
+# Prometheus から取得するメトリクス（app/metrics.py）
+# Authorization: Bearer <METRICS_TOKEN> か、スタッフでログインしていれば見られる
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,78 @@
+# app/warmup.py
+"""
+ワーカーがリクエストを受け付ける前の準備（config/wsgi.py・config/asgi.py から呼ぶ）
+
+最初のリクエストが払っていた次の時間を起動時に済ませる。
+
+- connections: DB への接続（SQLite ならファイルを開いて PRAGMA を設定する。
+               CONN_MAX_AGE = 0（ASGI）ならリクエストごとに開き直すので何もしない）
+- urls:        URLconf とビューの import、reverse() の表の作成
+- templates:   app/templates のテンプレートをすべてコンパイルする（cached.Loader に残る）
+- reference:   参照データ（エリア表・位置の表・いま人気の店舗のキャッシュ）の読み込み
+
+AppConfig.ready() ではなくエントリポイントから呼ぶのは、ready() が manage.py の
+どのコマンド（migrate を含む）でも動き、そこで DB に触れるのを Django が勧めていないため。
+各段は失敗してもログに残して続ける（準備ができなくても起動は止めない）。
+settings.WARMUP_ENABLED = False で止められる。
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
+
+
+def open_connections():
+    for connection in connections.all():
+        if connection.settings_dict["CONN_MAX_AGE"] != 0:
+            connection.ensure_connection()
+
+
+def load_urls():
+    get_resolver().url_patterns
+    reverse("shop_list")
+
+
+def compile_templates():
+    for path in sorted(TEMPLATE_DIR.rglob("*.html")):
+        get_template(path.relative_to(TEMPLATE_DIR).as_posix())
+
+
+def load_reference_data():
+    from . import areas, geo, trending
+
+    areas.table()
+    geo.centroids()
+    trending.top_shops(None)
+
+
+STEPS = {
+    "connections": open_connections,
+    "urls": load_urls,
+    "templates": compile_templates,
+    "reference": load_reference_data,
+}
+
+
+def run():
+    """準備を行い、{段の名前: かかった ms} を返す（失敗した段は含めない）"""
+    if not getattr(settings, "WARMUP_ENABLED", True):
+        return {}
+    timings = {}
+    for name, step in STEPS.items():
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("起動時の準備（%s）に失敗しました", name)
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("起動時の準備が終わりました: %s", timings)
+    return timings
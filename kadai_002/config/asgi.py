@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_ASGI', '1')  # settings.CONN_MAX_AGE を 0 にする
 
 application = get_asgi_application()
+
+# リクエストを受け付ける前に DB 接続・テンプレート・参照データを用意する
+from app import warmup  # noqa: E402
+
+warmup.run()
@@ -33,6 +33,11 @@ ALLOWED_HOSTS = []
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.StaticServeMiddleware',  # STATIC_ROOT / MEDIA_ROOT の配信
+    'app.middleware.ProfilingMiddleware',  # 処理時間の内訳（PROFILING_ENABLED のときだけ）
+    'app.middleware.MetricsMiddleware',  # Prometheus のメトリクス（/metrics/）
+    'app.middleware.RateLimitMiddleware',  # ログイン・投稿などの回数制限（app/ratelimit.py）
+    'app.middleware.ReplicaRoutingMiddleware',  # 読み取りレプリカの振り分け（app/routers.py）
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,13 +69,114 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite を複数ワーカーから使うための設定
+# - WAL: 読み込みが書き込みを待たない。ファイルに記録される設定なので、接続ごとではなく
+#   migrate（app/migrations/0028_sqlite_wal.py）で 1 回だけ切り替える
+# - transaction_mode=IMMEDIATE: 書き込みトランザクションは開始時にロックを取り、
+#   途中で "database is locked" になるのを防ぐ（待つ時間は timeout 秒）
+# - CONN_MAX_AGE: 接続を使い回し、リクエストごとにファイルを開き直さない
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # 負の値は KiB 単位（64MB）
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,      # ミリ秒
+}
+
+# ASGI（config/asgi.py が DJANGO_ASGI=1 にする）では永続接続を使わない。
+# 同期の ORM は sync_to_async のスレッドで動き、接続がリクエストの終わりに確実には閉じられず、
+# 古い接続が残り続けるため（Django のドキュメントも非同期では CONN_MAX_AGE = 0 を勧めている）
+ASGI = os.environ.get('DJANGO_ASGI') == '1'
+CONN_MAX_AGE = 0 if ASGI else 600
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {k}={v}' for k, v in SQLITE_PRAGMAS.items() if k != 'journal_mode'),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
     }
 }
 
+# 読み取りレプリカ（app/routers.py）
+# ローカルでは DB_REPLICAS=2 で db.replica1.sqlite3, db.replica2.sqlite3 を読み取り専用で使う。
+# レプリカの中身は `python manage.py sync_replicas` で default からコピーする。
+DATABASE_REPLICAS = []
+for n in range(1, int(os.environ.get('DB_REPLICAS', '0')) + 1):
+    DATABASES[f'replica{n}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / f'db.replica{n}.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # 読み取り専用なので journal_mode は変えない
+            'init_command': ';'.join(
+                f'PRAGMA {k}={v}' for k, v in SQLITE_PRAGMAS.items() if k != 'journal_mode'
+            ),
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{n}')
+
+DATABASE_ROUTERS = ['app.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # 書き込み後、この秒数はプライマリを読む
+
+# app.middleware.ProfilingMiddleware（Server-Timing ヘッダーと app.profiling のログ）
+PROFILING_ENABLED = os.environ.get('PROFILING', '') == '1'
+PROFILING_SLOW_MS = 500          # これ以上かかったリクエストを WARNING で記録する
+PROFILING_SAMPLE_RATE = 0.1      # cProfile を取るリクエストの割合（遅いものだけ保存）
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_KEEP = 50              # 保存しておく .prof の数
+
+# app/metrics.py（/metrics/ で Prometheus 形式）
+METRICS_ENABLED = True
+METRICS_DIR = os.environ.get('METRICS_DIR', BASE_DIR / 'metrics')  # 全ワーカーで共有するディレクトリ
+METRICS_FLUSH_INTERVAL = 5     # 各ワーカーが値を書き出す間隔（秒）
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Authorization: Bearer <token>
+
+CACHES = {
+    'default': {
+        'BACKEND': 'app.metrics.InstrumentedLocMemCache',  # ヒット率を数える LocMemCache
+    },
+}
+
+# 回数制限（app/ratelimit.py）。URL 名: {"ip" / "user": "回数/期間"}
+RATELIMIT_ENABLED = True
+RATELIMITS = {
+    'login': {'ip': '10/m'},                          # パスワードのハッシュ計算が重い
+    'shop_detail': {'user': '5/m', 'ip': '20/m'},     # レビュー投稿
+    'make_reservation': {'user': '10/m', 'ip': '30/m'},
+    'checkout': {'user': '5/m', 'ip': '20/m'},        # Stripe のセッション作成
+}
+RATELIMIT_METHODS = ['POST']  # GET（ページの表示）は数えない
+RATELIMIT_CACHE = 'default'   # 全ワーカーで共有するなら Redis などのキャッシュを指定する
+RATELIMIT_PROXY_COUNT = int(os.environ.get('RATELIMIT_PROXY_COUNT', 0))  # 前段のプロキシの数（X-Forwarded-For）
+
+# いま人気のランキング（app/trending.py）
+TRENDING_HALF_LIFE_HOURS = 72  # スコアが半分になるまでの時間
+TRENDING_WEIGHTS = {'review': 2.0, 'reservation': 3.0, 'favorite': 1.0}
+
+# 店舗を主キーで引くキャッシュ（app/shop_cache.py）
+SHOP_CACHE = 'default'        # ワーカーをまたいで読み込みをまとめるなら Redis などの共有キャッシュ
+SHOP_CACHE_TIMEOUT = 300
+
+# python manage.py bench_views の比較対象（app/benchmarks.py）
+BENCHMARK_BASELINE = BASE_DIR / 'benchmarks' / 'baseline.json'
+STARTUP_BASELINE = BASE_DIR / 'benchmarks' / 'startup.json'
+
+# config/wsgi.py・config/asgi.py で、リクエストを受け付ける前に準備する（app/warmup.py）
+WARMUP_ENABLED = True
+
+# 店舗一覧・店舗詳細で <head> とヘッダーを先に送る（本文はノードごとに描画して CHUNK_SIZE ずつ送る。gzip は送る単位ごと。app/streaming.py）
+STREAMING_RENDER = False
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,6 +213,28 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'  # collectstatic の出力先
+
+# collectstatic でハッシュ付きファイル名 + .gz/.br を作る（app/storage.py）
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'app.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# app.middleware.StaticServeMiddleware
+STATIC_SERVE = True            # False にすると別の Web サーバーに配信を任せる
+STATIC_SERVE_MAX_AGE = 3600    # ハッシュ無しファイルのキャッシュ秒数（ハッシュ付きは 1 年 + immutable）
+
+# 未ログイン向けの静的ページとサイトマップ（python manage.py prerender_pages。app/prerender.py）
+PRERENDER_ROOT = BASE_DIR / 'prerendered'
+PRERENDER_BASE_URL = 'http://localhost:8000'  # サイトマップの URL（本番のドメインにする）
+PRERENDER_SERVE = True         # StaticServeMiddleware でも未ログインの GET に返す
+PRERENDER_MAX_AGE = 300        # 静的ページのキャッシュ秒数
+SITEMAP_SHARD_SIZE = 50000     # サイトマップ 1 ファイルの URL 数（上限 50,000）
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -149,3 +277,14 @@ EMAIL_USE_TLS = True
 
 EMAIL_HOST_USER = 'あなたのGmailアドレス'
 EMAIL_HOST_PASSWORD = 'アプリパスワード'
+
+# バックグラウンドジョブ（app/jobs.py, python manage.py run_jobs）
+JOBS_EAGER = False            # True: enqueue 時にその場で実行（テスト用）
+JOBS_BATCH_SIZE = 100         # ワーカーが 1 回に取得する件数
+JOBS_RETRY_BASE_DELAY = 10    # リトライ間隔（秒）。失敗ごとに 2 倍
+JOBS_RETRY_MAX_DELAY = 3600
+JOBS_LOCK_TIMEOUT = 600       # running のまま放置されたジョブを戻すまでの秒数
+
+# 派生画像（app/images.py）。MEDIA_ROOT/derived/ 以下は内容のハッシュ付きパスなので長期キャッシュ可
+IMAGE_VARIANTS = {"thumb": 160, "card": 480, "detail": 1200}  # 名前: 幅(px)
+IMAGE_DERIVED_DIR = "derived"
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# リクエストを受け付ける前に DB 接続・テンプレート・参照データを用意する
+from app import warmup  # noqa: E402
+
+warmup.run()